@@ -0,0 +1,254 @@
+"""Headless batch catalog generation.
+
+Reads a JSONL or CSV manifest of products and writes generated images plus a
+``results.jsonl`` manifest to an output directory. Items already recorded as
+successful in that manifest are skipped, so an interrupted run can simply be
+started again.
+
+Usage:
+    python batch.py products.jsonl --out catalog_images --concurrency 8
+"""
+import argparse
+import asyncio
+import csv
+import json
+import logging
+import mimetypes
+import time
+from dataclasses import dataclass
+from functools import partial
+from pathlib import Path
+
+from config import (
+    CACHE_DIR, IMAGEN_CACHE_MAX_BYTES, IMAGEN_CACHE_TTL_SECONDS,
+    ANALYSIS_CACHE_MAX_BYTES, ANALYSIS_CACHE_TTL_SECONDS, ANALYSIS_CACHE_MEMORY_ITEMS,
+    BATCH_CONCURRENCY, BATCH_IMAGEN_REQUESTS_PER_MINUTE, BATCH_GEMINI_REQUESTS_PER_MINUTE,
+    PREPROCESS_ENABLED, PREPROCESS_MAX_EDGE, PREPROCESS_FORMAT, PREPROCESS_QUALITY, PREPROCESS_CACHE_ITEMS,
+)
+from generation_cache import AnalysisCache, DiskCache, canonical_hash
+from metrics import REGISTRY, JsonlSink
+from preprocess import Preprocessor
+from services import HANDLES, ModelServices
+from styles import compose_reference_prompt, reference_analysis_prompt, registry as style_registry
+
+logger = logging.getLogger("batch")
+
+RESULTS_FILE = "results.jsonl"
+
+
+@dataclass
+class BatchItem:
+    """One manifest row: what to generate for a single product."""
+    item_id: str
+    prompt: str = ""
+    reference_image: str = ""
+    style: str = ""
+    negative_prompt: str = ""
+    count: int = 1
+
+
+# --- Manifest ---
+def _parse_row(row, base_dir: Path, line_no: int) -> BatchItem:
+    row = {k.strip(): (v.strip() if isinstance(v, str) else v) for k, v in row.items() if k}
+    prompt = row.get("prompt") or ""
+    reference_image = row.get("reference_image") or ""
+    if not prompt and not reference_image:
+        raise ValueError(f"row {line_no}: needs a prompt or a reference_image")
+    if reference_image and not Path(reference_image).is_absolute():
+        reference_image = str(base_dir / reference_image)
+    styles = style_registry()
+    style = row.get("style") or styles.default
+    if style not in styles.names:
+        raise ValueError(f"row {line_no}: unknown style '{style}'")
+    count = int(row.get("count") or 1)
+    if not 1 <= count <= 4:
+        raise ValueError(f"row {line_no}: count must be between 1 and 4")
+    item_id = str(row.get("id") or canonical_hash([prompt, reference_image, style, row.get("negative_prompt") or "", count])[:16])
+    return BatchItem(item_id, prompt, reference_image, style, row.get("negative_prompt") or "", count)
+
+
+def load_manifest(path) -> list:
+    """Load batch items from a ``.jsonl`` or ``.csv`` manifest."""
+    path = Path(path)
+    base_dir = path.parent
+    items = []
+    with open(path, newline="", encoding="utf-8") as f:
+        if path.suffix.lower() == ".csv":
+            for line_no, row in enumerate(csv.DictReader(f), start=2):
+                items.append(_parse_row(row, base_dir, line_no))
+        else:
+            for line_no, line in enumerate(f, start=1):
+                if line.strip():
+                    items.append(_parse_row(json.loads(line), base_dir, line_no))
+    ids = [item.item_id for item in items]
+    if len(ids) != len(set(ids)):
+        raise ValueError("manifest contains duplicate item ids")
+    return items
+
+
+def load_completed(results_path: Path) -> set:
+    """Return ids of items already generated successfully in a previous run."""
+    completed = set()
+    if not results_path.exists():
+        return completed
+    with open(results_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if record.get("status") == "ok":
+                completed.add(record.get("id"))
+    return completed
+
+
+# --- Generation ---
+def _image_extension(data: bytes) -> str:
+    if data[:2] == b"\xff\xd8":
+        return ".jpg"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return ".webp"
+    return ".png"
+
+
+async def process_item(item, services, out_dir: Path, imagen_cache=None, analysis_cache=None,
+                       preprocessor=None) -> dict:
+    """Generate images for one item and write them to ``out_dir``."""
+    started = time.perf_counter()
+    final_prompt = item.prompt
+    if item.reference_image:
+        image_bytes = await asyncio.to_thread(Path(item.reference_image).read_bytes)
+        mime_type = mimetypes.guess_type(item.reference_image)[0] or "image/png"
+        if preprocessor is not None:
+            prepared = await asyncio.to_thread(preprocessor.prepare, image_bytes, mime_type)
+            image_bytes, mime_type = prepared.asset.data, prepared.asset.mime_type
+        image_description, _ = await services.describe_image(
+            image_bytes, mime_type, reference_analysis_prompt(item.style), analysis_cache
+        )
+        final_prompt = compose_reference_prompt(image_description, item.prompt)
+
+    generation_params = {
+        "prompt": final_prompt,
+        "number_of_images": item.count,
+        "add_watermark": False,
+    }
+    if item.negative_prompt:
+        generation_params["negative_prompt"] = item.negative_prompt
+
+    image_blobs, cache_hit = await services.generate_images(generation_params, imagen_cache)
+    if not image_blobs:
+        raise RuntimeError("model returned no images")
+
+    files = []
+    for idx, blob in enumerate(image_blobs):
+        path = out_dir / f"{item.item_id}_{idx + 1}{_image_extension(blob)}"
+        await asyncio.to_thread(path.write_bytes, blob)
+        files.append(path.name)
+    return {
+        "id": item.item_id,
+        "status": "ok",
+        "style": item.style,
+        "prompt": final_prompt,
+        "images": files,
+        "cache_hit": cache_hit,
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+
+
+async def _run_pending(pending, services, out_dir, results_file, concurrency, summary,
+                       imagen_cache, analysis_cache, preprocessor):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run_one(item):
+        async with semaphore:
+            try:
+                return item, await process_item(item, services, out_dir, imagen_cache, analysis_cache,
+                                                preprocessor)
+            except Exception as e:
+                return item, e
+
+    for next_done in asyncio.as_completed([run_one(item) for item in pending]):
+        item, result = await next_done
+        if isinstance(result, Exception):
+            logger.error("Item %s failed: %s", item.item_id, result)
+            record = {"id": item.item_id, "status": "error", "error": str(result)}
+            summary["failed"] += 1
+        else:
+            record = result
+            summary["ok"] += 1
+        results_file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        results_file.flush()
+        logger.info("[%d/%d] %s %s", summary["ok"] + summary["failed"], len(pending),
+                    item.item_id, record["status"])
+
+
+def run_batch(items, out_dir, services, concurrency=BATCH_CONCURRENCY,
+              imagen_rpm=BATCH_IMAGEN_REQUESTS_PER_MINUTE, gemini_rpm=BATCH_GEMINI_REQUESTS_PER_MINUTE,
+              imagen_cache=None, analysis_cache=None, preprocessor=None) -> dict:
+    """Generate all pending items with at most ``concurrency`` in flight and return a summary."""
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    results_path = out_dir / RESULTS_FILE
+    completed = load_completed(results_path)
+    pending = [item for item in items if item.item_id not in completed]
+    logger.info("%d items in manifest, %d already done, %d to generate",
+                len(items), len(items) - len(pending), len(pending))
+
+    # Shares the parent's model handles, loading them only if an item needs them
+    limited = ModelServices(
+        loaders={name: partial(getattr, services, name) for name in HANDLES},
+        rate_limits={
+            "imagen": {**services.rate_limits["imagen"], "per_minute": imagen_rpm},
+            "gemini": {**services.rate_limits["gemini"], "per_minute": gemini_rpm},
+        },
+        concurrency={"imagen": concurrency, "gemini": concurrency},
+        timeouts=services.timeouts,
+        max_threads=max(services.max_threads, concurrency),
+    )
+    summary = {"total": len(items), "skipped": len(items) - len(pending), "ok": 0, "failed": 0}
+    started = time.perf_counter()
+    with open(results_path, "a", encoding="utf-8") as results_file:
+        limited.run(_run_pending(pending, limited, out_dir, results_file, concurrency, summary,
+                                 imagen_cache, analysis_cache, preprocessor))
+    summary["seconds"] = round(time.perf_counter() - started, 3)
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate catalog images from a JSONL or CSV manifest.")
+    parser.add_argument("manifest", help="JSONL or CSV with prompt, reference_image, style, negative_prompt, count")
+    parser.add_argument("--out", required=True, help="output directory for images and results.jsonl")
+    parser.add_argument("--concurrency", type=int, default=BATCH_CONCURRENCY)
+    parser.add_argument("--imagen-rpm", type=float, default=BATCH_IMAGEN_REQUESTS_PER_MINUTE)
+    parser.add_argument("--gemini-rpm", type=float, default=BATCH_GEMINI_REQUESTS_PER_MINUTE)
+    parser.add_argument("--no-cache", action="store_true", help="always call the models")
+    parser.add_argument("--metrics-jsonl", help="append per-stage timings to this JSONL file")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    if args.metrics_jsonl:
+        REGISTRY.add_sink(JsonlSink(args.metrics_jsonl))
+    items = load_manifest(args.manifest)
+    services = ModelServices.from_config()
+
+    imagen_cache = analysis_cache = None
+    if not args.no_cache:
+        imagen_cache = DiskCache(Path(CACHE_DIR) / "imagen", IMAGEN_CACHE_MAX_BYTES, IMAGEN_CACHE_TTL_SECONDS)
+        analysis_cache = AnalysisCache(
+            DiskCache(Path(CACHE_DIR) / "analysis", ANALYSIS_CACHE_MAX_BYTES, ANALYSIS_CACHE_TTL_SECONDS),
+            max_items=ANALYSIS_CACHE_MEMORY_ITEMS,
+        )
+
+    preprocessor = Preprocessor(PREPROCESS_MAX_EDGE, PREPROCESS_FORMAT, PREPROCESS_QUALITY,
+                                PREPROCESS_CACHE_ITEMS, enabled=PREPROCESS_ENABLED)
+    summary = run_batch(items, args.out, services, args.concurrency,
+                        args.imagen_rpm, args.gemini_rpm, imagen_cache, analysis_cache, preprocessor)
+    logger.info("Done: %s", summary)
+    for stage_name, row in REGISTRY.snapshot()["stages"].items():
+        logger.info("%s: n=%d errors=%d mean=%.2fs p95<=%ss", stage_name, row["count"],
+                    row["errors"], row["mean_s"], row["p95_s"])
+    return 1 if summary["failed"] else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
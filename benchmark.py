@@ -0,0 +1,295 @@
+"""Offline benchmark of the app's own overhead in each generation flow.
+
+Drives the image, Gemini-edit, video and favorites pipelines headlessly
+against the fake backends in ``fake_backends.py`` and reports throughput,
+latency percentiles, peak RSS and Python-level bytes allocated per request.
+Model latency is fixed by the fakes, so changes in the numbers come from the
+pipeline code itself.
+
+Usage:
+    python benchmark.py --requests 50 --concurrency 8 --latency 0.05
+    python benchmark.py --flows image,favorites --json results.json
+"""
+import argparse
+import json
+import logging
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from pathlib import Path
+
+from edit_stream import EVENT_IMAGE, EditStream, HedgedEdit
+from fake_backends import FakeGenAIClient, FakeGenerativeModel, FakeImagenModel, FakeLatency
+from favorites_store import FavoritesStore
+from image_asset import ImageAsset
+from media_store import MediaStore
+from metrics import REGISTRY
+from previews import PreviewCache, render_preview
+from services import ModelServices
+from video_jobs import JOB_SUCCEEDED, VideoJobManager
+
+logger = logging.getLogger(__name__)
+
+FLOWS = ("image", "gemini_edit", "gemini_hedged", "video", "favorites")
+
+
+def percentile(sorted_values, q) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(q * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def peak_rss_bytes():
+    """Peak resident set size of this process so far, or None where unsupported."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _display(asset, widths=(640, 320)):
+    """What a Streamlit run does with a new image: show previews twice (rerun), as main.preview does."""
+    previews = PreviewCache()
+    for width in widths:
+        for _ in range(2):
+            loader = partial(render_preview, asset.image, width, previews.image_format,
+                             previews.quality) if asset.decoded else None
+            previews.get(asset.data, width, key=asset.digest, loader=loader)
+
+
+# --- Flows ---
+class Harness:
+    """Builds the service layer on fake backends and exposes one callable per flow.
+
+    Each flow takes a request index and returns the number of payload bytes the
+    model produced for it.
+    """
+
+    def __init__(self, args, workdir):
+        latency = FakeLatency(args.latency, args.jitter)
+        self.args = args
+        self.client = FakeGenAIClient(edit_latency=latency, edit_width=args.image_size,
+                                      edit_height=args.image_size, video_submit_latency=latency,
+                                      video_polls=args.video_polls,
+                                      video_bytes=int(args.video_mb * 1024 * 1024),
+                                      video_base64=args.video_base64,
+                                      edit_stream_chunks=args.edit_stream_chunks)
+        # Unlimited buckets: the benchmark measures overhead, not quota pacing
+        unlimited = {family: {"per_minute": 0, "burst": 1} for family in ("imagen", "gemini", "gemini_edit", "veo")}
+        self.services = ModelServices(
+            imagen_model=FakeImagenModel(latency, args.image_size, args.image_size),
+            gemini_model=FakeGenerativeModel(latency),
+            genai_client=self.client,
+            concurrency={family: args.concurrency for family in ("imagen", "gemini", "gemini_edit")},
+            max_threads=max(8, args.concurrency * 2),
+            rate_limits=unlimited,
+        )
+        self.video_jobs = VideoJobManager(
+            self.client, max_workers=4, initial_delay=args.poll_interval, max_delay=args.poll_interval,
+            guard=self.services.guards["veo"], media_store=MediaStore(Path(workdir) / "media"),
+        )
+        self.favorites = FavoritesStore(Path(workdir) / "favorites")
+        self._favorite_sources = [self.client._edit_pool.take() for _ in range(4)]
+
+    def image(self, idx):
+        params = {"prompt": f"benchmark product {idx}", "number_of_images": self.args.num_images,
+                  "add_watermark": False}
+        blobs, _ = self.services.run(self.services.generate_images(params, None))
+        for blob in blobs:
+            _display(ImageAsset(blob))
+        return sum(len(blob) for blob in blobs)
+
+    def gemini_edit(self, idx):
+        # The streaming path the Gemini tab uses
+        source = self._favorite_sources[idx % len(self._favorite_sources)]
+        contents = [{"role": "user", "parts": [source, f"benchmark edit {idx}"]}]
+        stream = EditStream()
+        stream.follow(self.services.submit(
+            self.services.edit_image_stream("fake-gemini-image", contents, None, stream.feed)
+        ))
+        for kind, asset in stream.events():
+            if kind == EVENT_IMAGE:
+                asset.image
+                _display(asset, widths=(640,))
+        if stream.error is not None:
+            raise stream.error
+        if stream.image is None:
+            raise RuntimeError("fake stream returned no image")
+        return len(stream.image)
+
+    def gemini_hedged(self, idx):
+        source = self._favorite_sources[idx % len(self._favorite_sources)]
+        contents = [{"role": "user", "parts": [source, f"benchmark edit {idx}"]}]
+        edit = HedgedEdit(
+            lambda model_name, stream: self.services.submit(
+                self.services.edit_image_stream(model_name, contents, None, stream.feed)
+            ),
+            ("fake-gemini-image", "fake-gemini-image-2"),
+            hedge_after_seconds=self.args.hedge_after or None,
+        )
+        for _, kind, asset in edit.events(poll_seconds=0.005):
+            if kind == EVENT_IMAGE:
+                asset.image
+                _display(asset, widths=(640,))
+        stream = edit.result
+        if stream.image is None:
+            raise RuntimeError("fake stream returned no image")
+        return len(stream.image)
+
+    def video(self, idx):
+        job_id = self.video_jobs.submit({"prompt": f"benchmark video {idx}", "model": "fake-veo"})
+        while True:
+            job = self.video_jobs.get(job_id)
+            if job.done:
+                break
+            time.sleep(0.005)
+        if job.status != JOB_SUCCEEDED:
+            raise RuntimeError(job.error)
+        return Path(job.video_path).stat().st_size
+
+    def favorites_flow(self, idx):
+        # Unique bytes per request so every add writes a new blob and thumbnail
+        image_bytes = self._favorite_sources[idx % len(self._favorite_sources)] + idx.to_bytes(8, "big")
+        owner = f"bench-{idx % 4}"
+        self.favorites.add(owner, ImageAsset(image_bytes), f"benchmark favorite {idx}", "E-commerce Product", 1)
+        count = self.favorites.count(owner)
+        for favorite in self.favorites.page(owner, max(0, count - 10), 10):
+            self.favorites.thumbnail_bytes(favorite)
+        return len(image_bytes)
+
+    def flow(self, name):
+        return self.favorites_flow if name == "favorites" else getattr(self, name)
+
+    def close(self):
+        self.video_jobs.shutdown()
+
+
+# --- Measurement ---
+def measure_flow(fn, requests, concurrency, alloc_samples):
+    """Run ``fn`` ``requests`` times with ``concurrency`` workers, then sample allocations serially."""
+    latencies = []
+    errors = []
+    payload_bytes = 0
+
+    def timed(idx):
+        started = time.perf_counter()
+        produced = fn(idx)
+        return time.perf_counter() - started, produced
+
+    wall_started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for future in [pool.submit(timed, idx) for idx in range(requests)]:
+            try:
+                seconds, produced = future.result()
+                latencies.append(seconds)
+                payload_bytes += produced
+            except Exception as e:
+                errors.append(str(e))
+    wall = time.perf_counter() - wall_started
+
+    # Allocation sampling is serial and separate: tracemalloc slows every allocation
+    allocated = []
+    tracemalloc.start()
+    try:
+        for idx in range(requests, requests + alloc_samples):
+            tracemalloc.reset_peak()
+            baseline, _ = tracemalloc.get_traced_memory()
+            try:
+                fn(idx)
+            except Exception:
+                continue
+            allocated.append(tracemalloc.get_traced_memory()[1] - baseline)
+    finally:
+        tracemalloc.stop()
+
+    latencies.sort()
+    succeeded = len(latencies)
+    return {
+        "requests": requests,
+        "errors": len(errors),
+        "first_error": errors[0] if errors else None,
+        "throughput_rps": succeeded / wall if wall else 0.0,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "max_ms": (latencies[-1] * 1000) if latencies else 0.0,
+        "payload_bytes_per_request": payload_bytes / succeeded if succeeded else 0,
+        "alloc_peak_bytes_per_request": sum(allocated) / len(allocated) if allocated else None,
+        "peak_rss_bytes": peak_rss_bytes(),
+    }
+
+
+def format_report(results, model_latency) -> str:
+    header = f"{'flow':<14} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>6} " \
+             f"{'payload KB':>11} {'alloc KB':>10} {'x payload':>9} {'peak RSS MB':>11}"
+    lines = [f"Fake model latency: {model_latency * 1000:.0f} ms per call", header, "-" * len(header)]
+    for name, row in results.items():
+        payload = row["payload_bytes_per_request"]
+        alloc = row["alloc_peak_bytes_per_request"]
+        rss = row["peak_rss_bytes"]
+        lines.append(
+            f"{name:<14} {row['throughput_rps']:>8.1f} {row['p50_ms']:>9.1f} {row['p95_ms']:>9.1f} "
+            f"{row['p99_ms']:>9.1f} {row['errors']:>6} {payload / 1024:>11.0f} "
+            f"{(alloc or 0) / 1024:>10.0f} {(alloc / payload if alloc and payload else 0):>9.2f} "
+            f"{(rss or 0) / 1024 / 1024:>11.0f}"
+        )
+        if row["first_error"]:
+            lines.append(f"  first error: {row['first_error']}")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the generation pipeline against fake model backends.")
+    parser.add_argument("--flows", default=",".join(FLOWS), help=f"comma-separated subset of {', '.join(FLOWS)}")
+    parser.add_argument("--requests", type=int, default=40, help="requests per flow")
+    parser.add_argument("--concurrency", type=int, default=8, help="simultaneous requests (sessions)")
+    parser.add_argument("--latency", type=float, default=0.05, help="fake model latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="uniform latency jitter in seconds")
+    parser.add_argument("--image-size", type=int, default=1024, help="edge length of generated images")
+    parser.add_argument("--num-images", type=int, default=1, help="images per Imagen request")
+    parser.add_argument("--video-mb", type=float, default=4.0, help="size of generated videos")
+    parser.add_argument("--video-polls", type=int, default=2, help="polls before a fake Veo job finishes")
+    parser.add_argument("--video-base64", action="store_true", help="return base64 video bytes like older SDKs")
+    parser.add_argument("--edit-stream-chunks", type=int, default=1, help="parts a streamed edit image arrives in")
+    parser.add_argument("--hedge-after", type=float, default=0.0,
+                        help="gemini_hedged: seconds before the second model starts (0 = only on failure)")
+    parser.add_argument("--poll-interval", type=float, default=0.01, help="Veo poll interval in seconds")
+    parser.add_argument("--alloc-samples", type=int, default=3, help="serial requests traced for allocations")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="also write the results to this JSON file")
+    args = parser.parse_args(argv)
+
+    flows = [name.strip() for name in args.flows.split(",") if name.strip()]
+    unknown = set(flows) - set(FLOWS)
+    if unknown:
+        parser.error(f"unknown flows: {', '.join(sorted(unknown))}")
+
+    logging.basicConfig(level=logging.WARNING, format="%(asctime)s %(levelname)s %(message)s")
+    random.seed(args.seed)
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="imageai-bench-") as workdir:
+        harness = Harness(args, workdir)
+        try:
+            for name in flows:
+                results[name] = measure_flow(harness.flow(name), args.requests, args.concurrency,
+                                             args.alloc_samples)
+        finally:
+            harness.close()
+
+    print(format_report(results, args.latency))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "results": results, "stages": REGISTRY.snapshot()}, f, indent=2)
+    return 1 if any(row["errors"] for row in results.values()) else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,115 @@
+import os
+
+# --- Configuration ---
+PROJECT_ID = "your_project_id"
+LOCATION = "project_account_location"
+script_dir = os.path.dirname(os.path.abspath(__file__))
+SERVICE_ACCOUNT_PATH = r"your service account path"
+IMAGEN_MODEL_NAME = "imagen-4.0-generate-001"
+GEMINI_MODEL_NAME = "gemini-2.5-flash"
+VIDEO_MODEL_NAME = "veo-3.0-generate-preview"
+VIDEO_POLL_WORKERS = 4
+VIDEO_POLL_INITIAL_DELAY = 5.0
+VIDEO_POLL_MAX_DELAY = 20.0
+VIDEO_STATUS_REFRESH_SECONDS = 3
+VIDEO_MAX_POLL_ERRORS = 5  # consecutive failed status checks before a job is failed
+VIDEO_MAX_AGE_SECONDS = 30 * 60  # fail jobs still running this long after submission
+# Set to a gs:// prefix to have Veo write videos to Cloud Storage instead of returning bytes
+VIDEO_OUTPUT_GCS_URI = None
+CACHE_DIR = os.path.join(script_dir, ".cache")
+IMAGEN_CACHE_MAX_BYTES = 512 * 1024 * 1024
+IMAGEN_CACHE_TTL_SECONDS = 7 * 24 * 3600
+ANALYSIS_CACHE_MAX_BYTES = 32 * 1024 * 1024
+ANALYSIS_CACHE_TTL_SECONDS = 30 * 24 * 3600
+ANALYSIS_CACHE_MEMORY_ITEMS = 256
+
+# --- Favorites ---
+FAVORITES_DIR = os.path.join(script_dir, "data", "favorites")
+FAVORITES_PAGE_SIZE = 10
+FAVORITES_THUMBNAIL_WIDTH = 400
+FAVORITES_DUPLICATE_DISTANCE = 6  # max pHash/dHash Hamming distance treated as the same image
+FAVORITES_INDEX_OWNERS = 64  # owners whose near-duplicate indexes stay in memory
+# Without sign-in, favorites and jobs belong to a random id kept in this browser cookie
+ANONYMOUS_OWNER_COOKIE = "aicg_owner"
+ANONYMOUS_OWNER_COOKIE_DAYS = 365
+
+# --- Display Previews ---
+PREVIEW_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+# --- Generated Media ---
+MEDIA_DIR = os.path.join(script_dir, "data", "media")
+MEDIA_RETENTION_SECONDS = 24 * 3600
+MEDIA_MAX_BYTES = 2 * 1024 ** 3
+MEDIA_GC_INTERVAL_SECONDS = 60  # saves scan the media directory for expired files at most this often
+
+# --- Model Service Layer ---
+SERVICE_MAX_THREADS = 32
+SERVICE_CONCURRENCY = {"imagen": 8, "gemini": 8, "gemini_edit": 4}
+SERVICE_TIMEOUTS = {"imagen": 120.0, "gemini": 90.0, "gemini_edit": 180.0}
+
+# --- Rate Limits & Retries ---
+# Shared by every session in the process; per_minute of 0 disables throttling.
+RATE_LIMITS = {
+    "imagen": {"per_minute": 30, "burst": 5},
+    "gemini": {"per_minute": 60, "burst": 10},
+    "gemini_edit": {"per_minute": 20, "burst": 5},
+    "veo": {"per_minute": 10, "burst": 2},
+}
+RETRY_MAX_ATTEMPTS = 4
+RETRY_BASE_DELAY = 1.0
+RETRY_MAX_DELAY = 30.0
+CIRCUIT_FAILURE_THRESHOLD = 5
+CIRCUIT_RESET_SECONDS = 60.0
+
+# --- Batch Generation ---
+BATCH_CONCURRENCY = 4
+BATCH_IMAGEN_REQUESTS_PER_MINUTE = 30
+BATCH_GEMINI_REQUESTS_PER_MINUTE = 60
+
+# --- Metrics & Diagnostics ---
+METRICS_HTTP_PORT = None  # e.g. 9464 to serve Prometheus /metrics (unauthenticated); off by default
+METRICS_HTTP_HOST = "127.0.0.1"
+METRICS_JSONL_PATH = None  # e.g. os.path.join(script_dir, "data", "metrics.jsonl")
+SHOW_DIAGNOSTICS = True
+
+# --- Start-up ---
+WARM_UP_ON_BOOT = True  # load SDKs and model handles in a background thread at server start
+
+# --- Upload Preprocessing ---
+PREPROCESS_ENABLED = True
+PREPROCESS_MAX_EDGE = 1536  # longest edge sent to Gemini / Veo, in pixels
+PREPROCESS_FORMAT = "JPEG"
+PREPROCESS_QUALITY = 90
+PREPROCESS_CACHE_ITEMS = 64
+
+# --- Styles ---
+STYLES_PATH = os.path.join(script_dir, "styles.json")
+STYLES_RELOAD_SECONDS = 2.0  # how often to check styles.json for edits
+
+# --- Durable Jobs ---
+JOBS_DB_PATH = os.path.join(script_dir, "data", "jobs.db")
+JOB_REATTACH_SECONDS = 3600  # a reloaded page re-attaches to its latest job if submitted this recently
+JOB_RETENTION_SECONDS = 7 * 24 * 3600  # finished jobs are deleted from the table after this long
+
+# --- Speculative Prefetch ---
+PREFETCH_ENABLED = True  # analyze an uploaded reference image before Generate is clicked
+PREFETCH_BUDGET_PER_MINUTE = 6  # speculative analyses per user
+PREFETCH_BURST = 3
+PREFETCH_STALE_SECONDS = 120.0  # cancel speculations still unfinished after this long
+
+# --- Gemini Edit Streaming ---
+GEMINI_STREAM_BUFFER_BYTES = 4 * 1024 * 1024  # preallocated when an image arrives in several parts
+
+# --- Hedged Gemini Edits ---
+# Candidate image-edit models in order of preference; styles.json can override per style
+GEMINI_EDIT_MODELS = ("gemini-2.0-flash-preview-image-generation", "gemini-2.5-flash-image")
+GEMINI_HEDGE_AFTER_SECONDS = 20.0  # start the next candidate if no image by then; None only falls back on errors
+GEMINI_HEDGES_PER_MINUTE = 10  # process-wide cap on extra parallel requests
+GEMINI_HEDGE_BURST = 3
+GEMINI_SESSION_ASSET_BYTES = 64 * 1024 * 1024  # per-session inputs and outputs kept for feedback edits
+GEMINI_SESSION_ASSET_ITEMS = 16
+
+# --- Feedback Iterations ---
+HISTORY_DB_PATH = os.path.join(script_dir, "data", "history.db")
+HISTORY_RETENTION_SECONDS = MEDIA_RETENTION_SECONDS  # iteration images live in the media store
+FEEDBACK_PROMPT_MAX_CHARS = 1800  # regeneration prompts are compacted to at most this length
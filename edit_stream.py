@@ -0,0 +1,334 @@
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import CancelledError
+
+from image_asset import ImageAsset, sniff_image_mime
+from metrics import REGISTRY
+from payloads import InvalidPayload
+
+logger = logging.getLogger(__name__)
+
+# --- Stream Events ---
+EVENT_TEXT = "text"
+EVENT_IMAGE = "image"
+EVENT_DONE = "done"
+
+PNG_TRAILER = b"IEND\xaeB`\x82"
+JPEG_TRAILER = b"\xff\xd9"
+
+
+def looks_complete(view, mime_type) -> bool:
+    """True when ``view`` ends the way a finished PNG/JPEG/WebP file does."""
+    if mime_type == "image/png":
+        return bytes(view[-8:]) == PNG_TRAILER
+    if mime_type == "image/jpeg":
+        return bytes(view[-2:]) == JPEG_TRAILER
+    if mime_type == "image/webp":
+        return len(view) >= 12 and int.from_bytes(view[4:8], "little") + 8 == len(view)
+    return False
+
+
+class ImageBuffer:
+    """Accumulates one image's bytes as they stream in.
+
+    A payload that arrives in a single part is kept as-is (no copy). Once a
+    second part arrives, the bytes go into one ``bytearray`` preallocated to
+    ``capacity`` (grown by doubling if needed), so a split payload is copied
+    into place once instead of being re-concatenated on every chunk. The
+    allocation is kept across ``reset`` for the next image of the stream.
+    """
+
+    def __init__(self, capacity=4 * 1024 * 1024):
+        self.capacity = capacity
+        self._first = None
+        self._buf = None
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def write(self, data):
+        if not data:
+            return
+        if self._size == 0:
+            self._first = data
+            self._size = len(data)
+            return
+        end = self._size + len(data)
+        if self._buf is None or end > len(self._buf):
+            grown = bytearray(max(end, self.capacity, 2 * len(self._buf) if self._buf is not None else 0))
+            if self._first is None:
+                grown[:self._size] = memoryview(self._buf)[:self._size]
+            self._buf = grown
+        if self._first is not None:
+            self._buf[:self._size] = self._first
+            self._first = None
+        self._buf[self._size:end] = data
+        self._size = end
+
+    def view(self) -> memoryview:
+        if self._first is not None:
+            return memoryview(self._first)
+        return memoryview(self._buf)[:self._size] if self._buf is not None else memoryview(b"")
+
+    def getvalue(self) -> bytes:
+        if self._first is not None:
+            return self._first if isinstance(self._first, bytes) else bytes(self._first)
+        return bytes(self.view())
+
+    def reset(self):
+        self._first = None
+        self._size = 0
+
+
+class EditStream:
+    """Turns streamed ``generate_content`` chunks into text and image events.
+
+    ``feed`` runs on the service loop for each chunk; the script thread reads
+    ``events()`` and updates the page as text and images arrive. Image parts
+    are appended to an :class:`ImageBuffer`. An image is published as soon as
+    its bytes end like a complete file, when a new image starts, or when the
+    stream closes, whichever happens first. Payloads whose headers fail
+    validation are listed in ``rejected`` instead.
+
+    With ``on_event``, events are handed to ``on_event(stream, kind, value)``
+    instead of being queued for ``events()``.
+    """
+
+    def __init__(self, buffer_bytes=4 * 1024 * 1024, on_event=None, model_name=None):
+        self.model_name = model_name
+        self.text_chunks = []
+        self.images = []
+        self.rejected = []
+        self.error = None
+        self._events = queue.Queue()
+        self._buffer = ImageBuffer(buffer_bytes)
+        self._mime_type = None
+        self._closed = False
+        self._on_event = on_event
+        # feed runs on the service loop; close may come from a canceling thread
+        self._lock = threading.Lock()
+
+    # --- Producer side (service loop) ---
+    def feed(self, chunk):
+        with self._lock:
+            if not self._closed:
+                self._feed_locked(chunk)
+
+    def _feed_locked(self, chunk):
+        for candidate in getattr(chunk, "candidates", None) or []:
+            content = getattr(candidate, "content", None)
+            for part in getattr(content, "parts", None) or []:
+                inline = getattr(part, "inline_data", None)
+                if inline is not None and getattr(inline, "data", None):
+                    self._add_image_data(inline.data, getattr(inline, "mime_type", None))
+                text = getattr(part, "text", None)
+                if text:
+                    self._flush()
+                    self.text_chunks.append(text)
+                    self._emit(EVENT_TEXT, text)
+
+    def follow(self, future):
+        """Close the stream when ``future`` (the streaming call) finishes, fails or is cancelled."""
+        def on_done(done):
+            self.close(CancelledError("Cancelled") if done.cancelled() else done.exception())
+        future.add_done_callback(on_done)
+        return future
+
+    def close(self, error=None):
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._flush()
+            self.error = error
+            self._emit(EVENT_DONE, error)
+
+    def _add_image_data(self, data, mime_type):
+        if isinstance(data, str):
+            # Base64 text is unwrapped once the whole image has arrived
+            data = data.encode("ascii")
+        if len(self._buffer) and sniff_image_mime(data, default=None) is not None:
+            # A second image in the same response; publish the first
+            self._flush()
+        if not len(self._buffer):
+            self._mime_type = sniff_image_mime(data, default=mime_type or "image/png")
+        self._buffer.write(data)
+        if looks_complete(self._buffer.view(), self._mime_type):
+            self._flush()
+
+    def _flush(self):
+        if not len(self._buffer):
+            return
+        try:
+            asset = ImageAsset.from_payload(self._buffer.getvalue(), self._mime_type)
+        except InvalidPayload as e:
+            self.rejected.append(str(e))
+            return
+        finally:
+            self._buffer.reset()
+        self.images.append(asset)
+        self._emit(EVENT_IMAGE, asset)
+
+    def _emit(self, kind, value):
+        if self._on_event is not None:
+            self._on_event(self, kind, value)
+        else:
+            self._events.put((kind, value))
+
+    # --- Consumer side (script thread) ---
+    def events(self, poll_seconds=0.25):
+        """Yield ``(kind, value)`` until the stream closes; ``(None, None)`` on idle ticks.
+
+        The idle ticks let the caller touch the page regularly, which is where
+        Streamlit notices a pending rerun such as a click on Cancel.
+        """
+        while True:
+            try:
+                kind, value = self._events.get(timeout=poll_seconds)
+            except queue.Empty:
+                yield None, None
+                continue
+            yield kind, value
+            if kind == EVENT_DONE:
+                return
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    @property
+    def image(self):
+        """The last complete image of the response, if any."""
+        return self.images[-1] if self.images else None
+
+
+class HedgedEdit:
+    """One streamed edit raced across candidate models, hedging a slow first attempt.
+
+    Only the first candidate is started. If it has not produced an image
+    ``hedge_after_seconds`` after the last launch, the next candidate is
+    started alongside it, and so on down the list. A candidate that fails
+    is replaced by the next one straight away. The first valid image wins:
+    the other attempts are cancelled and only the winner keeps streaming.
+
+    ``start(model_name, stream)`` submits the streaming call for one model
+    and returns its future. ``may_hedge()`` is asked before each hedge (not
+    before a fallback after a failure) and can refuse, for example when a
+    hedge budget is spent. With ``hedge_after_seconds=None`` candidates are
+    only tried one after another, on failure.
+    """
+
+    def __init__(self, start, model_names, hedge_after_seconds=None, may_hedge=None,
+                 buffer_bytes=4 * 1024 * 1024):
+        self.hedge_after_seconds = hedge_after_seconds
+        self.attempts = []
+        self.winner = None
+        self.hedged = False
+        self.cancelled = False
+        self._start = start
+        self._pending = list(model_names)
+        self._may_hedge = may_hedge or (lambda: True)
+        self._buffer_bytes = buffer_bytes
+        self._events = queue.Queue()
+        self._launched_at = 0.0
+        self._lock = threading.Lock()
+
+    def _launch(self):
+        model_name = self._pending.pop(0)
+        stream = EditStream(self._buffer_bytes, on_event=self._on_event, model_name=model_name)
+        self._launched_at = time.monotonic()
+        future = stream.follow(self._start(model_name, stream))
+        with self._lock:
+            self.attempts.append((stream, future))
+            if self.cancelled:
+                future.cancel()
+
+    def _on_event(self, stream, kind, value):
+        self._events.put((stream, kind, value))
+
+    def cancel(self) -> bool:
+        """Cancel every attempt; True if anything was still running."""
+        with self._lock:
+            self.cancelled = True
+            attempts = list(self.attempts)
+        return any([future.cancel() for _, future in attempts])
+
+    def _cancel_others(self, winner):
+        with self._lock:
+            losers = [future for stream, future in self.attempts if stream is not winner]
+        cancelled = sum(future.cancel() for future in losers)
+        if cancelled:
+            REGISTRY.increment("gemini_hedge_cancelled", cancelled)
+
+    def _running(self) -> int:
+        return sum(1 for stream, _ in self.attempts if not stream.closed)
+
+    # --- Consumer side (script thread) ---
+    def events(self, poll_seconds=0.25):
+        """Yield ``(stream, kind, value)`` from the attempt(s) that matter; ``(None, None, None)`` on ticks.
+
+        Before there is a winner, text from any attempt is passed on; after
+        it, only the winner's events are. Ends when the winner finishes, or
+        when every attempt has finished without an image.
+        """
+        self._launch()
+        while True:
+            try:
+                stream, kind, value = self._events.get(timeout=poll_seconds)
+            except queue.Empty:
+                self._maybe_hedge()
+                yield None, None, None
+                continue
+            if self.winner is not None and stream is not self.winner:
+                continue
+            if kind == EVENT_IMAGE and self.winner is None:
+                self.winner = stream
+                if self.hedged:
+                    REGISTRY.increment("gemini_hedge_won" if stream is not self.attempts[0][0]
+                                       else "gemini_hedge_primary_won")
+                self._cancel_others(stream)
+            if kind == EVENT_DONE:
+                if stream is self.winner:
+                    yield stream, kind, value
+                    return
+                if value is not None and not self.cancelled and self._pending:
+                    logger.info("Gemini edit with %s failed, trying %s: %s",
+                                stream.model_name, self._pending[0], value)
+                    self._launch()
+                if not self._running():
+                    yield stream, kind, value
+                    return
+                continue
+            yield stream, kind, value
+            self._maybe_hedge()
+
+    def _maybe_hedge(self):
+        if (self.winner is not None or self.cancelled or not self._pending or self.hedge_after_seconds is None
+                or time.monotonic() - self._launched_at < self.hedge_after_seconds):
+            return
+        if not self._may_hedge():
+            REGISTRY.increment("gemini_hedge_over_budget")
+            # Check the budget again only after another full delay
+            self._launched_at = time.monotonic()
+            return
+        self.hedged = True
+        REGISTRY.increment("gemini_hedge_started")
+        logger.info("No image from Gemini after %.1fs, hedging with %s", self.hedge_after_seconds, self._pending[0])
+        self._launch()
+
+    @property
+    def result(self) -> EditStream:
+        """The attempt to show: the winner, else one that finished cleanly (text only).
+
+        Raises the last attempt's error when every attempt failed.
+        """
+        if self.winner is not None:
+            return self.winner
+        finished = [stream for stream, _ in self.attempts if stream.error is None and stream.closed]
+        if finished:
+            return max(finished, key=lambda stream: (len(stream.rejected) == 0, len(stream.text_chunks)))
+        errors = [stream.error for stream, _ in self.attempts if stream.error is not None]
+        raise errors[-1] if errors else Exception("No suitable Gemini image-capable model found in this region.")
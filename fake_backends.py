@@ -0,0 +1,194 @@
+"""Offline stand-ins for the Vertex AI and GenAI SDK objects used by the app.
+
+Each fake mimics only the attributes the app reads, sleeps for a configurable
+latency and returns payloads of a configurable size, so the pipeline can be
+driven without credentials or network access (see ``benchmark.py``).
+"""
+import asyncio
+import base64
+import os
+import random
+import threading
+import time
+from dataclasses import dataclass
+from io import BytesIO
+from types import SimpleNamespace
+
+from PIL import Image
+
+
+@dataclass
+class FakeLatency:
+    """Fixed delay plus uniform jitter, in seconds."""
+    seconds: float = 0.0
+    jitter: float = 0.0
+
+    def sample(self) -> float:
+        return max(0.0, self.seconds + random.uniform(-self.jitter, self.jitter))
+
+
+class FakeQuotaError(Exception):
+    """A 429 as the SDKs raise it; ``is_retryable`` treats it as a quota error."""
+    code = 429
+
+    def __init__(self, message="429 RESOURCE_EXHAUSTED: Quota exceeded"):
+        super().__init__(message)
+
+
+def make_image_bytes(width=1024, height=1024, image_format="PNG", seed=None) -> bytes:
+    """Encode a noise image; noise keeps PNG payloads close to their raw size."""
+    rng = random.Random(seed)
+    raw = rng.randbytes(width * height * 3)
+    buf = BytesIO()
+    Image.frombytes("RGB", (width, height), raw).save(buf, format=image_format)
+    return buf.getvalue()
+
+
+class _PayloadPool:
+    """A few pre-encoded payloads so the fakes themselves cost almost nothing per call."""
+
+    def __init__(self, factory, variants=4):
+        self._payloads = [factory(seed) for seed in range(variants)]
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def take(self):
+        with self._lock:
+            payload = self._payloads[self._next % len(self._payloads)]
+            self._next += 1
+        return payload
+
+
+# --- Imagen ---
+class FakeImagenModel:
+    """Stands in for ``ImageGenerationModel``."""
+
+    def __init__(self, latency=None, width=1024, height=1024, failures=()):
+        self.latency = latency or FakeLatency()
+        self._pool = _PayloadPool(lambda seed: make_image_bytes(width, height, seed=seed))
+        # Scripted errors raised by the first calls, in order (e.g. quota errors)
+        self.failures = list(failures)
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def generate_images(self, prompt, number_of_images=1, **kwargs):
+        with self._lock:
+            self.calls += 1
+            failure = self.failures.pop(0) if self.failures else None
+        time.sleep(self.latency.sample())
+        if failure is not None:
+            raise failure
+        images = [SimpleNamespace(_image_bytes=self._pool.take()) for _ in range(number_of_images)]
+        return SimpleNamespace(images=images)
+
+
+# --- Gemini (Vertex) ---
+class FakeGenerativeModel:
+    """Stands in for ``vertexai.generative_models.GenerativeModel``."""
+
+    def __init__(self, latency=None, text_chars=600):
+        self.latency = latency or FakeLatency()
+        self.text = ("A detailed product description. " * (text_chars // 32 + 1))[:text_chars]
+        self.calls = 0
+
+    def generate_content(self, contents, **kwargs):
+        self.calls += 1
+        time.sleep(self.latency.sample())
+        return SimpleNamespace(text=self.text)
+
+
+# --- GenAI Client ---
+def _content_chunk(*parts):
+    return SimpleNamespace(candidates=[SimpleNamespace(content=SimpleNamespace(parts=list(parts)))])
+
+
+class _FakeAsyncModels:
+    def __init__(self, client):
+        self._client = client
+
+    async def generate_content(self, model, contents, config=None):
+        self._client.edit_calls += 1
+        await asyncio.sleep(self._client.edit_latency.sample())
+        return self._client._edit_response()
+
+    async def generate_content_stream(self, model, contents, config=None):
+        self._client.edit_calls += 1
+        return self._client._edit_stream()
+
+
+class _FakeModels:
+    def __init__(self, client):
+        self._client = client
+
+    def generate_content(self, model, contents, config=None):
+        self._client.edit_calls += 1
+        time.sleep(self._client.edit_latency.sample())
+        return self._client._edit_response()
+
+    def generate_videos(self, **kwargs):
+        self._client.video_calls += 1
+        time.sleep(self._client.video_submit_latency.sample())
+        return SimpleNamespace(name=f"operations/{os.urandom(6).hex()}", done=False, error=None,
+                               response=None, _polls=0)
+
+
+class _FakeOperations:
+    def __init__(self, client):
+        self._client = client
+
+    def get(self, operation):
+        operation._polls += 1
+        if operation._polls >= self._client.video_polls:
+            video_bytes = self._client._video_pool.take()
+            if self._client.video_base64:
+                video_bytes = base64.b64encode(video_bytes)
+            video = SimpleNamespace(video_bytes=video_bytes, uri=None)
+            operation.response = SimpleNamespace(generated_videos=[SimpleNamespace(video=video)])
+            operation.done = True
+        return operation
+
+
+class FakeGenAIClient:
+    """Stands in for ``google.genai.Client`` (image edits and Veo operations).
+
+    Veo operations finish after ``video_polls`` calls to ``operations.get``;
+    ``video_base64`` returns the bytes base64-encoded as some SDK versions do.
+    Streamed edits send a text chunk and then the image in
+    ``edit_stream_chunks`` parts.
+    """
+
+    def __init__(self, edit_latency=None, edit_width=1024, edit_height=1024,
+                 video_submit_latency=None, video_polls=2, video_bytes=4 * 1024 * 1024,
+                 video_base64=False, edit_stream_chunks=1):
+        self.edit_latency = edit_latency or FakeLatency()
+        self.video_submit_latency = video_submit_latency or FakeLatency()
+        self.video_polls = video_polls
+        self.video_base64 = video_base64
+        self.edit_stream_chunks = edit_stream_chunks
+        self._edit_pool = _PayloadPool(lambda seed: make_image_bytes(edit_width, edit_height, seed=seed))
+        self._video_pool = _PayloadPool(lambda seed: b"\x00\x00\x00\x18ftypmp42" + random.Random(seed).randbytes(video_bytes),
+                                        variants=2)
+        self.edit_calls = 0
+        self.video_calls = 0
+        self.models = _FakeModels(self)
+        self.operations = _FakeOperations(self)
+        self.aio = SimpleNamespace(models=_FakeAsyncModels(self))
+
+    async def _edit_stream(self):
+        # Text first, then the image split over edit_stream_chunks parts, spread over the latency
+        latency = self.edit_latency.sample()
+        data = self._edit_pool.take()
+        await asyncio.sleep(latency / 2)
+        yield _content_chunk(SimpleNamespace(inline_data=None, text="Editing the image..."))
+        pieces = max(1, self.edit_stream_chunks)
+        size = -(-len(data) // pieces)
+        for offset in range(0, len(data), size):
+            await asyncio.sleep(latency / 2 / pieces)
+            inline = SimpleNamespace(data=data[offset:offset + size], mime_type="image/png")
+            yield _content_chunk(SimpleNamespace(inline_data=inline, text=None))
+
+    def _edit_response(self):
+        inline = SimpleNamespace(data=self._edit_pool.take(), mime_type="image/png")
+        parts = [SimpleNamespace(inline_data=inline, text=None),
+                 SimpleNamespace(inline_data=None, text="Here is the edited image.")]
+        return SimpleNamespace(candidates=[SimpleNamespace(content=SimpleNamespace(parts=parts))])
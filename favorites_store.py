@@ -0,0 +1,268 @@
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from contextlib import closing
+from dataclasses import dataclass
+from io import BytesIO
+from pathlib import Path
+
+from PIL import Image
+
+from image_asset import ImageAsset
+from perceptual_hash import HammingIndex, difference_hash, hamming, perceptual_hash
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS favorites (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    owner TEXT NOT NULL,
+    image_hash TEXT NOT NULL,
+    mime_type TEXT NOT NULL,
+    prompt TEXT NOT NULL,
+    style TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    iteration INTEGER NOT NULL,
+    phash TEXT,
+    dhash TEXT
+);
+CREATE INDEX IF NOT EXISTS favorites_owner ON favorites (owner, id);
+"""
+# Columns added after the first release, applied to existing databases on open
+MIGRATIONS = (
+    ("phash", "ALTER TABLE favorites ADD COLUMN phash TEXT"),
+    ("dhash", "ALTER TABLE favorites ADD COLUMN dhash TEXT"),
+)
+
+
+@dataclass
+class Favorite:
+    """Metadata for one saved image; the pixels stay on disk."""
+    id: int
+    image_hash: str
+    mime_type: str
+    prompt: str
+    style: str
+    date: str
+    iteration: int
+
+    @property
+    def extension(self) -> str:
+        return {"image/jpeg": "jpg", "image/webp": "webp"}.get(self.mime_type, "png")
+
+
+class FavoritesStore:
+    """Persistent favorites: SQLite metadata plus a content-addressed blob directory.
+
+    Images are stored once per SHA-256 under ``blobs/`` and a JPEG thumbnail is
+    written to ``thumbs/`` at insert time, so listing a page of favorites only
+    touches small files and never keeps image data in session state.
+
+    Each favorite also records a pHash and dHash. A per-owner
+    :class:`HammingIndex` over the pHash, built on first lookup and kept up to
+    date by writes, answers near-duplicate queries without scanning the table.
+    Only the ``max_indexes`` most recently queried owners keep an index in
+    memory; the others are rebuilt from the table on their next lookup.
+    """
+
+    def __init__(self, directory, thumbnail_width=400, max_indexes=64):
+        self.directory = Path(directory)
+        self.blob_dir = self.directory / "blobs"
+        self.thumb_dir = self.directory / "thumbs"
+        self.blob_dir.mkdir(parents=True, exist_ok=True)
+        self.thumb_dir.mkdir(parents=True, exist_ok=True)
+        self.thumbnail_width = thumbnail_width
+        self.db_path = self.directory / "favorites.db"
+        self._write_lock = threading.Lock()
+        self._index_lock = threading.Lock()
+        self._indexes = OrderedDict()
+        self.max_indexes = max_indexes
+        with closing(self._connect()) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(favorites)")}
+            for column, statement in MIGRATIONS:
+                if column not in columns:
+                    conn.execute(statement)
+            conn.commit()
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    # --- Blobs ---
+    def blob_path(self, image_hash) -> Path:
+        return self.blob_dir / image_hash[:2] / image_hash
+
+    def thumbnail_path(self, image_hash) -> Path:
+        return self.thumb_dir / f"{image_hash}_{self.thumbnail_width}.jpg"
+
+    def _write_atomic(self, path: Path, data):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def _thumbnail_bytes(self, asset: ImageAsset) -> bytes:
+        # Reuses the asset's decoded pixels; resize returns a new image
+        image = asset.image
+        if image.width > self.thumbnail_width:
+            height = max(1, int(image.height * self.thumbnail_width / image.width))
+            image = image.resize((self.thumbnail_width, height), Image.LANCZOS)
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+        buf = BytesIO()
+        image.save(buf, format="JPEG", quality=85)
+        return buf.getvalue()
+
+    def _store_blob_locked(self, asset: ImageAsset, thumbnail) -> str:
+        # Runs under _write_lock, so remove() cannot unlink the files before the row referencing them exists
+        image_hash = asset.digest
+        path = self.blob_path(image_hash)
+        if not path.exists():
+            self._write_atomic(path, asset.view)
+        thumb_path = self.thumbnail_path(image_hash)
+        if not thumb_path.exists():
+            self._write_atomic(thumb_path, thumbnail if thumbnail is not None else self._thumbnail_bytes(asset))
+        return image_hash
+
+    def image_bytes(self, favorite: Favorite) -> bytes:
+        return self.blob_path(favorite.image_hash).read_bytes()
+
+    def thumbnail_bytes(self, favorite: Favorite) -> bytes:
+        return self.thumbnail_path(favorite.image_hash).read_bytes()
+
+    # --- Metadata ---
+    def add(self, owner, image, prompt, style, iteration, mime_type=None) -> int:
+        """Save an :class:`ImageAsset` (or encoded bytes) and its metadata; returns the favorite id."""
+        asset = ImageAsset.of(image)
+        phash, dhash = perceptual_hash(asset.image), difference_hash(asset.image)
+        # Encode the thumbnail before taking the lock; it is only written if still missing
+        thumbnail = None if self.thumbnail_path(asset.digest).exists() else self._thumbnail_bytes(asset)
+        with self._write_lock, closing(self._connect()) as conn, conn:
+            image_hash = self._store_blob_locked(asset, thumbnail)
+            cursor = conn.execute(
+                "INSERT INTO favorites (owner, image_hash, mime_type, prompt, style, created_at, iteration, phash, dhash) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (owner, image_hash, mime_type or asset.mime_type, prompt, style,
+                 time.strftime("%Y-%m-%d %H:%M"), iteration, f"{phash:016x}", f"{dhash:016x}"),
+            )
+            favorite_id = cursor.lastrowid
+        with self._index_lock:
+            index = self._indexes.get(owner)
+        if index is not None:
+            index.add(favorite_id, phash, dhash)
+        return favorite_id
+
+    def count(self, owner) -> int:
+        with closing(self._connect()) as conn:
+            return conn.execute("SELECT COUNT(*) FROM favorites WHERE owner = ?", (owner,)).fetchone()[0]
+
+    def page(self, owner, offset=0, limit=10) -> list:
+        """Return favorites in insertion order, ``limit`` at a time."""
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                "SELECT id, image_hash, mime_type, prompt, style, created_at, iteration FROM favorites "
+                "WHERE owner = ? ORDER BY id LIMIT ? OFFSET ?",
+                (owner, limit, offset),
+            ).fetchall()
+        return [Favorite(*row) for row in rows]
+
+    # --- Near-duplicates ---
+    def find_similar(self, owner, image, max_distance=6) -> list:
+        """Return ``(distance, favorite_id)`` for ``owner``'s favorites that look like ``image``.
+
+        ``distance`` is the pHash Hamming distance; candidates are confirmed
+        with the dHash under the same threshold.
+        """
+        asset = ImageAsset.of(image)
+        return self._owner_index(owner).search(perceptual_hash(asset.image), difference_hash(asset.image),
+                                               max_distance)
+
+    def _owner_index(self, owner):
+        with self._index_lock:
+            index = self._indexes.get(owner)
+            if index is None:
+                index = self._indexes[owner] = _OwnerIndex()
+                for favorite_id, phash, dhash in self._load_hashes(owner):
+                    index.add(favorite_id, phash, dhash)
+                while len(self._indexes) > self.max_indexes:
+                    self._indexes.popitem(last=False)
+            self._indexes.move_to_end(owner)
+            return index
+
+    def _load_hashes(self, owner):
+        with closing(self._connect()) as conn:
+            rows = conn.execute("SELECT id, image_hash, phash, dhash FROM favorites WHERE owner = ?",
+                                (owner,)).fetchall()
+        hashes = []
+        backfill = []
+        for favorite_id, image_hash, phash, dhash in rows:
+            if phash is None or dhash is None:
+                # Favorites saved before hashes were recorded
+                try:
+                    image = ImageAsset(self.blob_path(image_hash).read_bytes()).image
+                except Exception:
+                    continue
+                phash, dhash = f"{perceptual_hash(image):016x}", f"{difference_hash(image):016x}"
+                backfill.append((phash, dhash, favorite_id))
+            hashes.append((favorite_id, int(phash, 16), int(dhash, 16)))
+        if backfill:
+            with self._write_lock, closing(self._connect()) as conn, conn:
+                conn.executemany("UPDATE favorites SET phash = ?, dhash = ? WHERE id = ?", backfill)
+        return hashes
+
+    def remove(self, owner, favorite_id):
+        with self._write_lock, closing(self._connect()) as conn, conn:
+            row = conn.execute("SELECT image_hash FROM favorites WHERE owner = ? AND id = ?",
+                               (owner, favorite_id)).fetchone()
+            if row is None:
+                return
+            conn.execute("DELETE FROM favorites WHERE id = ?", (favorite_id,))
+            self._drop_unreferenced(conn, [row[0]])
+        with self._index_lock:
+            index = self._indexes.get(owner)
+        if index is not None:
+            index.remove(favorite_id)
+
+    def clear(self, owner):
+        with self._write_lock, closing(self._connect()) as conn, conn:
+            hashes = [row[0] for row in conn.execute(
+                "SELECT DISTINCT image_hash FROM favorites WHERE owner = ?", (owner,))]
+            conn.execute("DELETE FROM favorites WHERE owner = ?", (owner,))
+            self._drop_unreferenced(conn, hashes)
+        with self._index_lock:
+            self._indexes.pop(owner, None)
+
+    def _drop_unreferenced(self, conn, hashes):
+        for image_hash in hashes:
+            still_used = conn.execute("SELECT 1 FROM favorites WHERE image_hash = ? LIMIT 1",
+                                      (image_hash,)).fetchone()
+            if still_used:
+                continue
+            for path in (self.blob_path(image_hash), self.thumbnail_path(image_hash)):
+                try:
+                    path.unlink()
+                except OSError:
+                    pass
+
+
+class _OwnerIndex:
+    """pHash index plus dHashes for one owner's favorites."""
+
+    def __init__(self):
+        self.phashes = HammingIndex()
+        self.dhashes = {}
+
+    def add(self, favorite_id, phash, dhash):
+        self.dhashes[favorite_id] = dhash
+        self.phashes.add(phash, favorite_id)
+
+    def remove(self, favorite_id):
+        self.dhashes.pop(favorite_id, None)
+        self.phashes.remove(favorite_id)
+
+    def search(self, phash, dhash, max_distance) -> list:
+        return [(distance, favorite_id) for distance, favorite_id in self.phashes.search(phash, max_distance)
+                if favorite_id in self.dhashes and hamming(dhash, self.dhashes[favorite_id]) <= max_distance]
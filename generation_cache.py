@@ -0,0 +1,256 @@
+import hashlib
+import json
+import logging
+import os
+import struct
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from io import BytesIO
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+
+def canonical_hash(payload) -> str:
+    """Return a stable SHA-256 hex digest of a JSON-serializable payload."""
+    encoded = json.dumps(payload, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+class DiskCache:
+    """Size-bounded LRU of byte blobs on disk with TTL expiry and hit/miss counters.
+
+    Each entry is one ``<key>.bin`` file. The file mtime records when the entry
+    was written and drives TTL expiry; recency for LRU eviction is tracked in
+    memory and seeded from mtimes when the cache is reopened.
+    """
+
+    def __init__(self, directory, max_bytes=512 * 1024 * 1024, ttl_seconds=7 * 24 * 3600):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._index = OrderedDict()
+        self._total_bytes = 0
+        self._load_index()
+
+    def _load_index(self):
+        entries = []
+        for path in self.directory.glob("*.bin"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, path.stem, stat.st_size))
+        for created, key, size in sorted(entries):
+            self._index[key] = (size, created)
+            self._total_bytes += size
+
+    def _path(self, key) -> Path:
+        return self.directory / f"{key}.bin"
+
+    def get(self, key):
+        """Return cached bytes for ``key`` or None on miss/expiry."""
+        with self._lock:
+            entry = self._index.get(key)
+            if entry is not None and time.time() - entry[1] > self.ttl_seconds:
+                self._remove_locked(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._index.move_to_end(key)
+        try:
+            data = self._path(key).read_bytes()
+        except OSError:
+            with self._lock:
+                # Another thread may have evicted or rewritten the entry since the lock was released
+                if self._index.get(key) is entry:
+                    self._remove_locked(key)
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return data
+
+    def put(self, key, data: bytes):
+        """Store ``data`` under ``key`` and evict expired / least recently used entries."""
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, self._path(key))
+        except OSError as e:
+            logger.warning("Could not write cache entry %s: %s", key, e)
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            return
+        with self._lock:
+            if key in self._index:
+                self._total_bytes -= self._index.pop(key)[0]
+            self._index[key] = (len(data), time.time())
+            self._total_bytes += len(data)
+            self._evict_locked()
+
+    def _evict_locked(self):
+        cutoff = time.time() - self.ttl_seconds
+        for key in [k for k, (_, created) in self._index.items() if created < cutoff]:
+            self._remove_locked(key)
+        while self._total_bytes > self.max_bytes and len(self._index) > 1:
+            self._remove_locked(next(iter(self._index)))
+
+    def _remove_locked(self, key):
+        entry = self._index.pop(key, None)
+        if entry is None:
+            return
+        self._total_bytes -= entry[0]
+        try:
+            self._path(key).unlink()
+        except OSError:
+            pass
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": len(self._index),
+                "bytes": self._total_bytes,
+            }
+
+
+# --- Imagen Results ---
+def _pack_blobs(blobs) -> bytes:
+    out = BytesIO()
+    out.write(struct.pack(">I", len(blobs)))
+    for blob in blobs:
+        out.write(struct.pack(">I", len(blob)))
+        out.write(blob)
+    return out.getvalue()
+
+
+def _unpack_blobs(data: bytes):
+    view = memoryview(data)
+    (count,) = struct.unpack_from(">I", view, 0)
+    offset = 4
+    blobs = []
+    for _ in range(count):
+        (size,) = struct.unpack_from(">I", view, offset)
+        offset += 4
+        blobs.append(bytes(view[offset:offset + size]))
+        offset += size
+    return blobs
+
+
+def _generated_image_bytes(image) -> bytes:
+    image_bytes = getattr(image, "_image_bytes", None)
+    if image_bytes:
+        return image_bytes
+    buf = BytesIO()
+    image._pil_image.save(buf, format="PNG")
+    return buf.getvalue()
+
+
+def imagen_cache_key(model_name, generation_params, variant=None) -> str:
+    payload = {"model": model_name, "params": generation_params}
+    if variant is not None:
+        payload["variant"] = variant
+    return canonical_hash(payload)
+
+
+def generate_images_cached(model, model_name, generation_params, cache=None, variant=None):
+    """Call ``model.generate_images`` through the content-addressed cache.
+
+    ``variant`` distinguishes otherwise identical requests, e.g. the parallel
+    single-image calls of a fan-out. Returns ``(image_bytes_list, cache_hit)``.
+    Only non-empty results are cached.
+    """
+    key = imagen_cache_key(model_name, generation_params, variant)
+    if cache is not None:
+        cached = cache.get(key)
+        if cached is not None:
+            return _unpack_blobs(cached), True
+
+    response = model.generate_images(**generation_params)
+    images = getattr(response, "images", None) or []
+    blobs = [_generated_image_bytes(image) for image in images]
+    if cache is not None and blobs:
+        cache.put(key, _pack_blobs(blobs))
+    return blobs, False
+
+
+# --- Reference Image Analysis ---
+class MemoryLRU:
+    """Small thread-safe in-process LRU mapping."""
+
+    def __init__(self, max_items=256):
+        self.max_items = max_items
+        self._lock = threading.Lock()
+        self._items = OrderedDict()
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._items:
+                return None
+            self._items.move_to_end(key)
+            return self._items[key]
+
+    def put(self, key, value):
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+
+
+class AnalysisCache:
+    """Reference-image descriptions: in-process LRU backed by a persistent DiskCache."""
+
+    def __init__(self, disk: DiskCache, max_items=256):
+        self.disk = disk
+        self.memory = MemoryLRU(max_items)
+
+    def get(self, key):
+        text = self.memory.get(key)
+        if text is not None:
+            return text
+        data = self.disk.get(key)
+        if data is None:
+            return None
+        text = data.decode("utf-8")
+        self.memory.put(key, text)
+        return text
+
+    def put(self, key, text: str):
+        self.memory.put(key, text)
+        self.disk.put(key, text.encode("utf-8"))
+
+
+def analysis_cache_key(model_name, image_bytes, style_prompt) -> str:
+    return canonical_hash({
+        "model": model_name,
+        "image_sha256": hashlib.sha256(image_bytes).hexdigest(),
+        "style_prompt": style_prompt,
+    })
+
+
+def describe_image_cached(cache, model_name, image_bytes, style_prompt, describe):
+    """Return ``(description, cache_hit)``; ``describe()`` runs only on a miss."""
+    key = analysis_cache_key(model_name, image_bytes, style_prompt)
+    if cache is not None:
+        cached = cache.get(key)
+        if cached is not None:
+            return cached, True
+    description = describe()
+    if cache is not None and description:
+        cache.put(key, description)
+    return description, False
@@ -0,0 +1,170 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from io import BytesIO
+
+from PIL import Image
+
+from payloads import KIND_IMAGE, decode_payload, sniff_mime
+
+FORMATS = {"image/png": "PNG", "image/jpeg": "JPEG", "image/webp": "WEBP", "image/gif": "GIF"}
+
+
+def sniff_image_mime(data, default="image/png"):
+    """Identify an encoded image from its first bytes; ``default`` when unknown."""
+    mime_type = sniff_mime(data)
+    return mime_type if mime_type in FORMATS else default
+
+
+class ImageAsset:
+    """Encoded image bytes with a lazily decoded view and memoized re-encodings.
+
+    The original payload is kept untouched and shared, never copied; the pixels
+    are decoded at most once and each ``(format, quality)`` encoding is produced
+    at most once, so the same image can move between generation, editing,
+    favorites and video without repeated decode/encode round trips.
+    """
+
+    def __init__(self, data, mime_type=None, size=None):
+        self._data = data if isinstance(data, bytes) else bytes(data)
+        self.mime_type = sniff_image_mime(self._data, default=mime_type or "image/png")
+        self._size = size
+        self._image = None
+        self._digest = None
+        self._encodings = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def of(cls, image):
+        """Return ``image`` if it already is an asset, otherwise wrap its bytes."""
+        return image if isinstance(image, cls) else cls(image)
+
+    @classmethod
+    def from_payload(cls, payload, mime_type=None):
+        """Wrap model output that may be raw or base64-encoded image bytes.
+
+        The header is validated without decoding pixels; raises
+        :class:`payloads.InvalidPayload` if it is not a well-formed image.
+        """
+        decoded = decode_payload(payload, mime_type, kinds=(KIND_IMAGE,))
+        return cls(decoded.data, decoded.mime_type, size=(decoded.width, decoded.height))
+
+    def __len__(self):
+        return len(self._data)
+
+    def undecoded(self):
+        """This asset without its decoded pixels or re-encodings; bytes and hash are shared."""
+        if self._image is None and not self._encodings:
+            return self
+        asset = ImageAsset(self._data, self.mime_type, size=self._size)
+        asset._digest = self._digest
+        return asset
+
+    @property
+    def data(self) -> bytes:
+        """The original encoded bytes (shared, not copied)."""
+        return self._data
+
+    @property
+    def view(self) -> memoryview:
+        """A zero-copy view of the original bytes for hashing and file writes."""
+        return memoryview(self._data)
+
+    @property
+    def format(self) -> str:
+        return FORMATS.get(self.mime_type, "PNG")
+
+    @property
+    def digest(self) -> str:
+        if self._digest is None:
+            self._digest = hashlib.sha256(self._data).hexdigest()
+        return self._digest
+
+    @property
+    def size(self) -> tuple:
+        """``(width, height)``, from the header when known, otherwise from the pixels."""
+        if self._size is None:
+            self._size = self.image.size
+        return self._size
+
+    @property
+    def decoded(self) -> bool:
+        return self._image is not None
+
+    @property
+    def image(self) -> Image.Image:
+        """The decoded pixels; decoding happens on first access only.
+
+        Treat the result as read-only: it is shared by every consumer of the asset.
+        """
+        if self._image is None:
+            with self._lock:
+                if self._image is None:
+                    image = Image.open(BytesIO(self._data))
+                    image.load()
+                    self._image = image
+        return self._image
+
+    def encode(self, image_format, quality=None) -> bytes:
+        """Return the image encoded as ``image_format``.
+
+        The original bytes are returned as-is when they already have that
+        format; other encodings are computed once and memoized.
+        """
+        image_format = image_format.upper()
+        if image_format == "JPG":
+            image_format = "JPEG"
+        if image_format == self.format:
+            return self._data
+        key = (image_format, quality)
+        encoded = self._encodings.get(key)
+        if encoded is None:
+            image = self.image
+            if image_format == "JPEG" and image.mode != "RGB":
+                image = image.convert("RGB")
+            buf = BytesIO()
+            image.save(buf, format=image_format, **({"quality": quality} if quality else {}))
+            encoded = self._encodings.setdefault(key, buf.getvalue())
+        return encoded
+
+
+class AssetCache:
+    """Small LRU of :class:`ImageAsset` objects keyed by digest, bounded by encoded bytes.
+
+    Kept per session so an edit can be chained on an earlier input or output
+    without the user uploading it again. Assets are stored without decoded
+    pixels, so ``max_bytes`` bounds what the cache really holds. The most
+    recently used asset is always kept, even if it alone exceeds ``max_bytes``.
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, max_items=16):
+        self.max_bytes = max_bytes
+        self.max_items = max_items
+        self._items = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+
+    def put(self, asset) -> str:
+        """Keep ``asset`` and return the key to get it back with."""
+        key = asset.digest
+        with self._lock:
+            if key in self._items:
+                self._items.move_to_end(key)
+                return key
+            self._items[key] = asset.undecoded()
+            self._total_bytes += len(asset)
+            while len(self._items) > 1 and (self._total_bytes > self.max_bytes or len(self._items) > self.max_items):
+                _, evicted = self._items.popitem(last=False)
+                self._total_bytes -= len(evicted)
+        return key
+
+    def get(self, key):
+        with self._lock:
+            asset = self._items.get(key)
+            if asset is not None:
+                self._items.move_to_end(key)
+            return asset
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._items), "bytes": self._total_bytes}
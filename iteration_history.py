@@ -0,0 +1,160 @@
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import closing
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Optional
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS iterations (
+    node_id TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    root_id TEXT NOT NULL,
+    parent_id TEXT,
+    depth INTEGER NOT NULL,
+    style TEXT NOT NULL,
+    base_prompt TEXT NOT NULL,
+    feedback TEXT NOT NULL DEFAULT '',
+    prompt TEXT NOT NULL,
+    negative_prompt TEXT NOT NULL DEFAULT '',
+    image_ref TEXT NOT NULL,
+    timings TEXT NOT NULL DEFAULT '{}',
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS iterations_root ON iterations (root_id, created_at);
+"""
+COLUMNS = ("node_id, owner, kind, root_id, parent_id, depth, style, base_prompt, feedback, prompt, "
+           "negative_prompt, image_ref, timings, created_at")
+
+
+@dataclass
+class IterationNode:
+    """One generated image in a feedback tree.
+
+    ``base_prompt`` is the prompt of the tree's first generation and
+    ``feedback`` what the user asked to change to get from the parent to this
+    node; ``prompt`` is what was actually sent to the model. ``image_ref`` is
+    the media-store path of the result.
+    """
+    node_id: str
+    owner: str
+    kind: str
+    root_id: str
+    parent_id: Optional[str]
+    depth: int
+    style: str
+    base_prompt: str
+    feedback: str
+    prompt: str
+    negative_prompt: str
+    image_ref: str
+    timings: dict = field(default_factory=dict)
+    created_at: float = 0.0
+
+    @classmethod
+    def from_row(cls, row):
+        *values, timings, created_at = row
+        return cls(*values, json.loads(timings), created_at)
+
+
+class HistoryStore:
+    """Feedback-iteration trees in SQLite (WAL mode).
+
+    Every generation and every regeneration from feedback is a node pointing
+    at its parent, so older iterations are kept and any of them can be picked
+    up again: continuing from a node only reads its row and its image, and the
+    next regeneration becomes a new branch under it. Image bytes live in the
+    media store; the table only holds their paths.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._write_lock = threading.Lock()
+        with closing(self._connect()) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+            conn.commit()
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    # --- Writes ---
+    def add(self, owner, kind, image_ref, prompt, style, parent=None, feedback="", negative_prompt="",
+            timings=None) -> IterationNode:
+        """Record a generation; without ``parent`` it starts a new tree whose base prompt is ``prompt``."""
+        node_id = uuid.uuid4().hex
+        node = IterationNode(
+            node_id=node_id,
+            owner=owner,
+            kind=kind,
+            root_id=parent.root_id if parent else node_id,
+            parent_id=parent.node_id if parent else None,
+            depth=parent.depth + 1 if parent else 1,
+            style=style or "",
+            base_prompt=parent.base_prompt if parent else prompt,
+            feedback=feedback,
+            prompt=prompt,
+            negative_prompt=negative_prompt or "",
+            image_ref=image_ref,
+            timings=dict(timings or {}),
+            created_at=time.time(),
+        )
+        with self._write_lock, closing(self._connect()) as conn, conn:
+            conn.execute(
+                f"INSERT INTO iterations ({COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (node.node_id, node.owner, node.kind, node.root_id, node.parent_id, node.depth, node.style,
+                 node.base_prompt, node.feedback, node.prompt, node.negative_prompt, node.image_ref,
+                 json.dumps(node.timings), node.created_at),
+            )
+        return node
+
+    def prune(self, max_age_seconds) -> int:
+        """Delete trees whose newest node is older than ``max_age_seconds``; returns nodes removed."""
+        cutoff = time.time() - max_age_seconds
+        with self._write_lock, closing(self._connect()) as conn, conn:
+            cursor = conn.execute(
+                "DELETE FROM iterations WHERE root_id IN "
+                "(SELECT root_id FROM iterations GROUP BY root_id HAVING MAX(created_at) < ?)",
+                (cutoff,),
+            )
+            return cursor.rowcount
+
+    # --- Reads ---
+    def get(self, node_id) -> Optional[IterationNode]:
+        with closing(self._connect()) as conn:
+            row = conn.execute(f"SELECT {COLUMNS} FROM iterations WHERE node_id = ?", (node_id,)).fetchone()
+        return IterationNode.from_row(row) if row else None
+
+    def lineage(self, node_id) -> list:
+        """Nodes from the root of ``node_id``'s tree down to ``node_id`` itself."""
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                f"WITH RECURSIVE up(id) AS (SELECT ? UNION ALL "
+                f"SELECT parent_id FROM iterations JOIN up ON iterations.node_id = up.id "
+                f"WHERE parent_id IS NOT NULL) "
+                f"SELECT {COLUMNS} FROM iterations WHERE node_id IN (SELECT id FROM up) ORDER BY depth",
+                (node_id,),
+            ).fetchall()
+        return [IterationNode.from_row(row) for row in rows]
+
+    def tree(self, root_id) -> list:
+        """Every node of a tree in depth-first order, each parent before its children."""
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                f"SELECT {COLUMNS} FROM iterations WHERE root_id = ? ORDER BY created_at", (root_id,)
+            ).fetchall()
+        nodes = [IterationNode.from_row(row) for row in rows]
+        children = {}
+        for node in nodes:
+            children.setdefault(node.parent_id, []).append(node)
+        ordered, todo = [], list(reversed(children.get(None, [])))
+        while todo:
+            node = todo.pop()
+            ordered.append(node)
+            todo.extend(reversed(children.get(node.node_id, [])))
+        return ordered
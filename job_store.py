@@ -0,0 +1,190 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import closing
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# --- Job States ---
+JOB_PENDING = "pending"
+JOB_RUNNING = "running"
+JOB_SUCCEEDED = "succeeded"
+JOB_FAILED = "failed"
+UNFINISHED = (JOB_PENDING, JOB_RUNNING)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    status TEXT NOT NULL,
+    request TEXT NOT NULL,
+    operation_name TEXT,
+    result_refs TEXT NOT NULL DEFAULT '[]',
+    error TEXT,
+    submitted_at REAL NOT NULL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_owner ON jobs (owner, kind, submitted_at);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, kind);
+"""
+COLUMNS = "job_id, owner, kind, status, request, operation_name, result_refs, error, submitted_at, finished_at"
+
+
+@dataclass
+class JobRecord:
+    """One generation request as persisted in the job table."""
+    job_id: str
+    owner: str
+    kind: str
+    status: str
+    request: dict = field(default_factory=dict)
+    operation_name: Optional[str] = None
+    result_refs: list = field(default_factory=list)
+    error: Optional[str] = None
+    submitted_at: float = 0.0
+    finished_at: Optional[float] = None
+
+    @property
+    def done(self) -> bool:
+        return self.status in (JOB_SUCCEEDED, JOB_FAILED)
+
+    @classmethod
+    def from_row(cls, row):
+        job_id, owner, kind, status, request, operation_name, result_refs, error, submitted_at, finished_at = row
+        return cls(job_id, owner, kind, status, json.loads(request), operation_name, json.loads(result_refs),
+                   error, submitted_at, finished_at)
+
+
+class JobStore:
+    """Durable record of generation jobs in SQLite (WAL mode).
+
+    Each job stores its request, the long-running operation name (for Veo),
+    its status and references to the result files in the media store. Because
+    the table outlives both the browser session and the server process, a
+    reloaded page can re-attach to its running or finished jobs and a restarted
+    server can resume polling outstanding operations, without calling the model
+    again. Result bytes themselves never go into the database.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._write_lock = threading.Lock()
+        with closing(self._connect()) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+            conn.commit()
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def _update(self, job_id, **values):
+        assignments = ", ".join(f"{column} = ?" for column in values)
+        with self._write_lock, closing(self._connect()) as conn, conn:
+            conn.execute(f"UPDATE jobs SET {assignments} WHERE job_id = ?", (*values.values(), job_id))
+
+    # --- Writes ---
+    def create(self, owner, kind, request) -> str:
+        """Record a newly submitted request and return its job id."""
+        job_id = uuid.uuid4().hex
+        with self._write_lock, closing(self._connect()) as conn, conn:
+            conn.execute(
+                "INSERT INTO jobs (job_id, owner, kind, status, request, submitted_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (job_id, owner, kind, JOB_PENDING, json.dumps(request, default=str), time.time()),
+            )
+        return job_id
+
+    def mark_running(self, job_id, operation_name=None):
+        if operation_name:
+            self._update(job_id, status=JOB_RUNNING, operation_name=operation_name)
+        else:
+            self._update(job_id, status=JOB_RUNNING)
+
+    def succeed(self, job_id, result_refs):
+        self._update(job_id, status=JOB_SUCCEEDED, result_refs=json.dumps(list(result_refs)), finished_at=time.time())
+
+    def fail(self, job_id, error):
+        self._update(job_id, status=JOB_FAILED, error=str(error), finished_at=time.time())
+
+    def prune(self, max_age_seconds) -> int:
+        """Delete finished jobs older than ``max_age_seconds``; returns how many went."""
+        cutoff = time.time() - max_age_seconds
+        with self._write_lock, closing(self._connect()) as conn, conn:
+            cursor = conn.execute("DELETE FROM jobs WHERE status IN (?, ?) AND finished_at < ?",
+                                  (JOB_SUCCEEDED, JOB_FAILED, cutoff))
+            return cursor.rowcount
+
+    # --- Reads ---
+    def get(self, job_id) -> Optional[JobRecord]:
+        with closing(self._connect()) as conn:
+            row = conn.execute(f"SELECT {COLUMNS} FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return JobRecord.from_row(row) if row else None
+
+    def latest(self, owner, kind, max_age_seconds=None) -> Optional[JobRecord]:
+        """``owner``'s most recent job of ``kind``, optionally only if submitted recently."""
+        since = time.time() - max_age_seconds if max_age_seconds else 0
+        with closing(self._connect()) as conn:
+            row = conn.execute(
+                f"SELECT {COLUMNS} FROM jobs WHERE owner = ? AND kind = ? AND submitted_at >= ? "
+                "ORDER BY submitted_at DESC LIMIT 1",
+                (owner, kind, since),
+            ).fetchone()
+        return JobRecord.from_row(row) if row else None
+
+    def unfinished(self, kind) -> list:
+        """Jobs of ``kind`` that were pending or running when last recorded."""
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                f"SELECT {COLUMNS} FROM jobs WHERE kind = ? AND status IN (?, ?) ORDER BY submitted_at",
+                (kind, *UNFINISHED),
+            ).fetchall()
+        return [JobRecord.from_row(row) for row in rows]
+
+
+def track_futures(store, job_id, futures, save):
+    """Record the outcome of ``futures`` on ``job_id`` once all of them have finished.
+
+    ``save`` receives the results of the futures that succeeded (in order) and
+    returns the result references to store. It runs on whichever thread
+    completes the last future, so it still runs if the page that started the
+    job has been reloaded in the meantime.
+    """
+    futures = list(futures)
+    remaining = [len(futures)]
+    lock = threading.Lock()
+
+    def on_done(_):
+        with lock:
+            remaining[0] -= 1
+            if remaining[0]:
+                return
+        results, errors = [], []
+        for future in futures:
+            if future.cancelled():
+                errors.append("cancelled")
+            elif future.exception() is not None:
+                errors.append(str(future.exception()) or type(future.exception()).__name__)
+            else:
+                results.append(future.result())
+        try:
+            if not results:
+                store.fail(job_id, errors[0] if errors else "No results")
+                return
+            store.succeed(job_id, save(results))
+        except Exception as e:
+            logger.exception("Could not record the result of job %s", job_id)
+            try:
+                store.fail(job_id, f"Could not save the result: {e}")
+            except Exception:
+                pass
+
+    store.mark_running(job_id)
+    for future in futures:
+        future.add_done_callback(on_done)
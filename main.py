@@ -1,146 +1,435 @@
 import streamlit as st
+import streamlit.components.v1 as components
 import os
-import base64
-import time
-from google.oauth2 import service_account
-import vertexai
-from vertexai.preview.vision_models import ImageGenerationModel
-from vertexai.generative_models import GenerativeModel, Part
-from google import genai
-from google.genai import types
-import logging
-from io import BytesIO
-import certifi
-import tempfile
+import re
 import threading
-from pathlib import Path
-from PIL import Image
-import io
-
-# --- Configuration ---
-PROJECT_ID = "your_project_id"
-LOCATION = "project_account_location"
-script_dir = os.path.dirname(os.path.abspath(__file__))
-SERVICE_ACCOUNT_PATH = r"your service account path"
-IMAGEN_MODEL_NAME = "imagen-4.0-generate-001"
-GEMINI_MODEL_NAME = "gemini-2.5-flash"
-VIDEO_MODEL_NAME = "veo-3.0-generate-preview"
-client = None
+import time
+import uuid
+from concurrent.futures import as_completed
+from functools import lru_cache, partial, wraps
+from config import (
+    script_dir, VIDEO_MODEL_NAME,
+    VIDEO_POLL_WORKERS, VIDEO_POLL_INITIAL_DELAY, VIDEO_POLL_MAX_DELAY, VIDEO_STATUS_REFRESH_SECONDS,
+    VIDEO_MAX_POLL_ERRORS, VIDEO_MAX_AGE_SECONDS,
+    CACHE_DIR, IMAGEN_CACHE_MAX_BYTES, IMAGEN_CACHE_TTL_SECONDS,
+    ANALYSIS_CACHE_MAX_BYTES, ANALYSIS_CACHE_TTL_SECONDS, ANALYSIS_CACHE_MEMORY_ITEMS,
+    FAVORITES_DIR, FAVORITES_PAGE_SIZE, FAVORITES_THUMBNAIL_WIDTH,
+    FAVORITES_DUPLICATE_DISTANCE, FAVORITES_INDEX_OWNERS, ANONYMOUS_OWNER_COOKIE, ANONYMOUS_OWNER_COOKIE_DAYS,
+    PREPROCESS_ENABLED, PREPROCESS_MAX_EDGE, PREPROCESS_FORMAT, PREPROCESS_QUALITY, PREPROCESS_CACHE_ITEMS,
+    PREVIEW_CACHE_MAX_BYTES, MEDIA_DIR, MEDIA_RETENTION_SECONDS, MEDIA_MAX_BYTES, MEDIA_GC_INTERVAL_SECONDS,
+    VIDEO_OUTPUT_GCS_URI,
+    METRICS_HTTP_PORT, METRICS_HTTP_HOST, METRICS_JSONL_PATH, SHOW_DIAGNOSTICS, WARM_UP_ON_BOOT,
+    JOBS_DB_PATH, JOB_REATTACH_SECONDS, JOB_RETENTION_SECONDS,
+    PREFETCH_ENABLED, PREFETCH_BUDGET_PER_MINUTE, PREFETCH_BURST, PREFETCH_STALE_SECONDS,
+    GEMINI_STREAM_BUFFER_BYTES, GEMINI_HEDGES_PER_MINUTE, GEMINI_HEDGE_BURST,
+    GEMINI_SESSION_ASSET_BYTES, GEMINI_SESSION_ASSET_ITEMS,
+    HISTORY_DB_PATH, HISTORY_RETENTION_SECONDS, FEEDBACK_PROMPT_MAX_CHARS,
+)
+from styles import registry as style_registry, reference_analysis_prompt, compose_reference_prompt, \
+    compact_feedback_prompt, edit_instruction, edit_feedback_instruction
+from video_jobs import VideoJob, VideoJobManager, JOB_FAILED, JOB_KIND as VIDEO_JOB_KIND
+from job_store import JobStore, JOB_SUCCEEDED, track_futures
+from iteration_history import HistoryStore
+from generation_cache import AnalysisCache, DiskCache
+from services import ModelServices
+from favorites_store import FavoritesStore
+from previews import PreviewCache
+from media_store import MediaStore
+from image_asset import AssetCache, ImageAsset
+from previews import render_preview
+from preprocess import Preprocessor
+from prefetch import AnalysisPrefetcher
+from edit_stream import HedgedEdit, EVENT_IMAGE, EVENT_TEXT
+from rate_limit import TokenBucket
+import metrics
+from metrics import stage, start_trace
 
 # --- Load External CSS ---
+CSS_PATH = os.path.join(script_dir, "style.css")
+
+@st.cache_data(show_spinner=False)
+def read_css(path, mtime_ns):
+    """Return the stylesheet wrapped in a <style> tag; the mtime key picks up edits."""
+    with open(path) as f:
+        return f'<style>{f.read()}</style>'
+
 def load_css():
     """Load external CSS file"""
-    css_file = os.path.join(script_dir, "style.css")
-    if os.path.exists(css_file):
-        with open(css_file) as f:
-            st.markdown(f'<style>{f.read()}</style>', unsafe_allow_html=True)
-    else:
+    try:
+        mtime_ns = os.stat(CSS_PATH).st_mtime_ns
+    except OSError:
         st.warning("CSS file not found. Using default styling.")
+        return
+    st.markdown(read_css(CSS_PATH, mtime_ns), unsafe_allow_html=True)
+
+# --- Static Markup ---
+APP_HEADER_HTML = """
+<div class="app-header">
+    <h1 class="app-title">AI Content Generator</h1>
+    <p class="app-subtitle">Transform your ideas into stunning images and videos</p>
+</div>
+"""
+
+@lru_cache(maxsize=None)
+def section_header_html(icon, title, description):
+    """Markup for a tab's header block, built once per tab."""
+    return (f'<div class="section-header"><div class="icon">{icon}</div><div>{title}</div></div>'
+            f'<div class="section-description">{description}</div>')
 
 # --- Utility Functions ---
-def downscale_image_for_display(pil_image, target_width: int):
+def preview(image, target_width: int):
+    """Return cached preview bytes of an image (bytes or ImageAsset) for st.image."""
+    with stage("thumbnail"):
+        cache = get_preview_cache()
+        if isinstance(image, ImageAsset):
+            # Reuse the asset's hash, and its pixels if they are already decoded
+            loader = partial(render_preview, image.image, target_width, cache.image_format,
+                             cache.quality) if image.decoded else None
+            return cache.get(image.data, target_width, key=image.digest, loader=loader)
+        return cache.get(image, target_width)
+
+def set_generated_image(image_bytes):
+    """Make ``image_bytes`` the current generated image (not yet part of any iteration history)."""
+    st.session_state.generated_image = ImageAsset(image_bytes)
+    st.session_state.history_node_id = None
+
+def add_favorite(image, prompt, style, iteration) -> bool:
+    """Save ``image`` to this user's favorites unless a near-identical image is already there."""
+    favorites = get_favorites_store()
+    owner = current_user_id()
+    with stage("favorites_dedup"):
+        if favorites.find_similar(owner, image, FAVORITES_DUPLICATE_DISTANCE):
+            return False
+    with stage("favorites_save"):
+        favorites.add(owner, image, prompt, style, iteration)
+    return True
+
+def prepare_upload(uploaded_file):
+    """Preprocess an uploaded image once; the result is shared by analysis, edit and video."""
+    prepared = get_preprocessor().prepare(uploaded_file.getvalue(), uploaded_file.type)
+    if prepared.bytes_saved:
+        st.caption(f"📉 Upload optimized for the model: {prepared.original_bytes / 1024:.0f} KB → "
+                   f"{len(prepared.asset) / 1024:.0f} KB")
+    return prepared.asset
+
+def render_style_card(style_name):
+    """Show the badge and one-line description of a style (markup is prebuilt by the registry)."""
+    style = style_registry().get(style_name)
+    st.markdown(style.badge_html, unsafe_allow_html=True)
+    st.info(style.hint_markdown)
+
+def signed_in_user():
+    """Email of the signed-in user, or None when the app runs without authentication."""
+    user = getattr(st, "user", None) or getattr(st, "experimental_user", None)
     try:
-        width, height = pil_image.size
-        if width <= target_width:
-            return pil_image
-        target_height = int(height * (target_width / float(width)))
-        return pil_image.resize((target_width, target_height), resample=Image.LANCZOS)
+        return user.get("email") if user is not None else None
     except Exception:
-        return pil_image
+        return None
 
-# --- Authentication Functions ---
-@st.cache_resource
-def authenticate_and_initialize():
-    """Authenticate with Google Cloud and initialize Vertex AI."""
-    try: 
-        if not os.path.exists(SERVICE_ACCOUNT_PATH):
-            st.error(f"Error: Service account file not found at '{SERVICE_ACCOUNT_PATH}'")
-            st.stop()
-        
-        credentials = service_account.Credentials.from_service_account_file(
-            SERVICE_ACCOUNT_PATH,
-            scopes=['https://www.googleapis.com/auth/cloud-platform']
-        )
-        
-        os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = SERVICE_ACCOUNT_PATH
-        os.environ["GOOGLE_CLOUD_PROJECT"] = PROJECT_ID
+def browser_id():
+    """A random id for this browser, kept in a cookie so new tabs and reloads find the same gallery.
 
-        vertexai.init(
-            project=PROJECT_ID,
-            location=LOCATION,
-            credentials=credentials
-        )
-        
-        global client
-        if client is None:
-            client = genai.Client(vertexai=True, project=PROJECT_ID, location=LOCATION)
-        
-        return True
-        
-    except Exception as e:
-        st.error(f"Authentication failed: {str(e)}")
-        st.stop()
+    It only separates anonymous visitors from each other; it is not a login.
+    The cookie is written from a zero-height component the first time, and the
+    id is kept in session state until the next page load can read it back.
+    """
+    if 'browser_id' not in st.session_state:
+        cookie = st.context.cookies.get(ANONYMOUS_OWNER_COOKIE, "")
+        if re.fullmatch(r"[0-9a-f]{32}", cookie):
+            st.session_state.browser_id = cookie
+        else:
+            st.session_state.browser_id = uuid.uuid4().hex
+            max_age = ANONYMOUS_OWNER_COOKIE_DAYS * 24 * 3600
+            components.html(
+                f"<script>window.parent.document.cookie = '{ANONYMOUS_OWNER_COOKIE}="
+                f"{st.session_state.browser_id}; max-age={max_age}; path=/; SameSite=Strict';</script>",
+                height=0,
+            )
+    return st.session_state.browser_id
+
+def current_user_id():
+    """Identify whose favorites and jobs these are: the signed-in user, or this browser's cookie id."""
+    email = signed_in_user()
+    if email:
+        return email
+    return f"browser:{browser_id()}"
+
+# --- Durable Jobs ---
+def save_images(media, blobs):
+    """Write generated images to the media store; their paths become the job's result refs."""
+    assets = [ImageAsset(blob) for blob in blobs]
+    return [media.save_content(asset.data, f".{asset.format.lower()}", asset.digest) for asset in assets]
+
+def run_image_job(services, generation_params, cache, request):
+    """Run one Imagen request as a durable job and wait for ``(image_bytes_list, cache_hit)``.
+
+    The call runs on the service loop and its result is recorded even if this
+    page is reloaded before it finishes.
+    """
+    store, media = get_job_store(), get_media_store()
+    job_id = store.create(current_user_id(), "image", request)
+    st.session_state.image_job_id = job_id
+    future = services.submit(services.generate_images(generation_params, cache))
+    track_futures(store, job_id, [future], lambda results: save_images(media, results[0][0]))
+    return future.result()
+
+def start_image_fan_out(services, generation_params, cache, request, postprocess=None):
+    """Durable-job counterpart of ``services.fan_out_images``; returns one future per image."""
+    store, media = get_job_store(), get_media_store()
+    job_id = store.create(current_user_id(), "image", request)
+    st.session_state.image_job_id = job_id
+    futures = services.fan_out_images(generation_params, cache, postprocess=postprocess)
+    track_futures(store, job_id, futures, lambda results: save_images(media, [result[0] for result in results]))
+    return futures
+
+def restore_image_job(record) -> bool:
+    """Make a finished image job's first result the current image; False if its files are gone."""
+    media = get_media_store()
+    paths = [path for path in record.result_refs if media.exists(path)]
+    if not paths:
+        return False
+    with open(paths[0], "rb") as f:
+        set_generated_image(f.read())
+    request = record.request
+    st.session_state.current_prompt = request.get("prompt", "")
+    st.session_state.final_prompt = request.get("final_prompt", "")
+    st.session_state.negative_prompt = request.get("negative_prompt", "")
+    st.session_state.current_style = request.get("style")
+    st.session_state.iteration_count = request.get("iteration", 1)
+    return True
+
+def reattach_jobs():
+    """On a new session (e.g. after a reload), pick up this user's latest recent jobs."""
+    if 'image_job_id' not in st.session_state:
+        record = get_job_store().latest(current_user_id(), "image", JOB_REATTACH_SECONDS)
+        st.session_state.image_job_id = record.job_id if record is not None else None
+        if record is not None and record.status == JOB_SUCCEEDED and restore_image_job(record):
+            st.toast("Restored your last generated image.")
+    if 'video_job_id' not in st.session_state:
+        record = get_job_store().latest(current_user_id(), VIDEO_JOB_KIND, JOB_REATTACH_SECONDS)
+        st.session_state.video_job_id = record.job_id if record is not None else None
+
+def render_image_job_status():
+    """Wait for an image job this session lost track of, and show its result once it lands."""
+    record = get_job_store().get(st.session_state.get('image_job_id') or "")
+    if record is None or st.session_state.generated_image is not None:
+        return
+    if not record.done:
+        st.info(f"⏳ Your image request from {int(time.time() - record.submitted_at)}s ago is still being generated...")
+        return
+    if record.status == JOB_SUCCEEDED and restore_image_job(record):
+        st.rerun()
+    st.session_state.image_job_id = None
+    st.session_state.image_job_error = record.error or "The generated images are no longer available."
+    st.rerun()
+
+# --- Feedback History ---
+def trace_timings():
+    """Seconds per stage of this run's trace, stored with each iteration."""
+    trace = st.session_state.get('last_trace')
+    timings = {}
+    for entry in trace.stages if trace is not None else ():
+        timings[entry["stage"]] = round(timings.get(entry["stage"], 0.0) + entry["seconds"], 4)
+    return timings
+
+def record_iteration(kind, asset, prompt, style, parent=None, feedback="", negative_prompt="", timings=None):
+    """Save ``asset`` to the media store (once per content) and add it to the iteration history under ``parent``."""
+    image_ref = get_media_store().save_content(asset.data, f".{asset.format.lower()}", asset.digest)
+    return get_history_store().add(current_user_id(), kind, image_ref, prompt, style, parent=parent, feedback=feedback,
+                                   negative_prompt=negative_prompt, timings=timings)
 
+def current_image_node():
+    """History node of the current Imagen image; a fresh generation starts a new tree on first use."""
+    node = get_history_store().get(st.session_state.get('history_node_id') or "")
+    if node is None:
+        node = record_iteration("image", st.session_state.generated_image, st.session_state.final_prompt,
+                                st.session_state.get('current_style') or style_registry().default,
+                                negative_prompt=st.session_state.get('negative_prompt') or "",
+                                timings=st.session_state.get('generation_timings'))
+        st.session_state.history_node_id = node.node_id
+    return node
+
+def load_iteration_image(node):
+    """Read a history node's image back from the media store (no model call)."""
+    with open(node.image_ref, "rb") as f:
+        return ImageAsset(f.read())
+
+def history_thumbnail(node, width=120):
+    cache = get_preview_cache()
+    return cache.get(None, width, key=f"history:{node.node_id}",
+                     loader=lambda: render_preview(load_iteration_image(node).image, width, cache.image_format,
+                                                   cache.quality))
+
+def render_iteration_history(node_id, key_prefix):
+    """List the feedback tree around ``node_id``; returns the node the user chose to continue from."""
+    store, media = get_history_store(), get_media_store()
+    current = store.get(node_id or "")
+    if current is None:
+        return None
+    nodes = store.tree(current.root_id)
+    if len(nodes) < 2:
+        return None
+    picked = None
+    with st.expander(f"🕘 Iteration history ({len(nodes)} versions)"):
+        st.caption("Continue from any earlier version: your next feedback starts a new branch from it.")
+        for node in nodes:
+            available = media.exists(node.image_ref)
+            thumb_col, text_col, action_col = st.columns([1, 4, 1])
+            with thumb_col:
+                if available:
+                    st.image(history_thumbnail(node))
+                else:
+                    st.caption("Image expired")
+            with text_col:
+                indent = "\u00a0" * 4 * (node.depth - 1) + ("↳ " if node.depth > 1 else "")
+                marker = " ← current" if node.node_id == current.node_id else ""
+                st.markdown(f"{indent}**#{node.depth}** {node.feedback or 'Original generation'}{marker}")
+                model_seconds = node.timings.get("model_call")
+                st.caption(f"{time.strftime('%H:%M', time.localtime(node.created_at))} · {node.style}"
+                           + (f" · {model_seconds:.1f}s" if model_seconds else ""))
+            with action_col:
+                if st.button("↩️ Continue", key=f"{key_prefix}_history_{node.node_id}",
+                             disabled=not available or node.node_id == current.node_id):
+                    picked = node
+    return picked
+
+# --- Model Services ---
 @st.cache_resource
-def create_imagen_model():
-    """Create and return Imagen model instance."""
+def get_services():
+    """Authenticate with Google Cloud and create the shared model service layer."""
     try:
-        model = ImageGenerationModel.from_pretrained(IMAGEN_MODEL_NAME)
-        return model
+        return ModelServices.from_config()
     except Exception as e:
-        st.error(f"Failed to load {IMAGEN_MODEL_NAME}: {str(e)}")
+        st.error(f"Authentication failed: {str(e)}")
         st.stop()
 
 @st.cache_resource
-def create_gemini_model():
-    """Create and return Gemini model instance."""
-    try:
-        model = GenerativeModel(GEMINI_MODEL_NAME)
-        return model
-    except Exception as e:
-        st.error(f"Failed to load {GEMINI_MODEL_NAME}: {str(e)}")
-        st.stop()
+def start_warm_up():
+    """Load the SDKs and model handles in the background once per server."""
+    services = get_services()
+    if WARM_UP_ON_BOOT and services:
+        threading.Thread(target=services.warm_up, name="model-warm-up", daemon=True).start()
+    return True
 
 @st.cache_resource
-def create_veo_model():
-    """Create and return VEO model instance."""
-    try:
-        model = GenerativeModel(VIDEO_MODEL_NAME)
-        return model
-    except Exception as e:
-        st.error(f"Failed to load {VIDEO_MODEL_NAME}: {str(e)}")
-        st.stop()
+def get_metrics():
+    """Start the metrics endpoint and optional JSONL sink once per server."""
+    if METRICS_JSONL_PATH:
+        os.makedirs(os.path.dirname(METRICS_JSONL_PATH) or ".", exist_ok=True)
+        metrics.REGISTRY.add_sink(metrics.JsonlSink(METRICS_JSONL_PATH))
+    if METRICS_HTTP_PORT:
+        metrics.start_http_server(METRICS_HTTP_PORT, host=METRICS_HTTP_HOST)
+    return metrics.REGISTRY
 
-def generate_video_from_image(image_bytes, prompt):
-    """Generate a video using Veo with optional image + text prompt."""
-    try:
-        global client
-        if client is None:
-            if os.environ.get("GOOGLE_APPLICATION_CREDENTIALS") != SERVICE_ACCOUNT_PATH:
-                os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = SERVICE_ACCOUNT_PATH
-            if os.environ.get("GOOGLE_CLOUD_PROJECT") != PROJECT_ID:
-                os.environ["GOOGLE_CLOUD_PROJECT"] = PROJECT_ID
-            
-            client = genai.Client(vertexai=True, project=PROJECT_ID, location=LOCATION)
+@st.cache_resource
+def get_imagen_cache():
+    """Create the persistent on-disk cache for Imagen results."""
+    return DiskCache(
+        os.path.join(CACHE_DIR, "imagen"),
+        max_bytes=IMAGEN_CACHE_MAX_BYTES,
+        ttl_seconds=IMAGEN_CACHE_TTL_SECONDS,
+    )
+
+@st.cache_resource
+def get_analysis_cache():
+    """Create the shared cache of Gemini reference-image descriptions."""
+    disk = DiskCache(
+        os.path.join(CACHE_DIR, "analysis"),
+        max_bytes=ANALYSIS_CACHE_MAX_BYTES,
+        ttl_seconds=ANALYSIS_CACHE_TTL_SECONDS,
+    )
+    return AnalysisCache(disk, max_items=ANALYSIS_CACHE_MEMORY_ITEMS)
+
+@st.cache_resource
+def get_prefetcher():
+    """Create the shared speculative analyzer for uploaded reference images."""
+    return AnalysisPrefetcher(get_services(), get_analysis_cache(), per_minute=PREFETCH_BUDGET_PER_MINUTE,
+                              burst=PREFETCH_BURST, stale_seconds=PREFETCH_STALE_SECONDS)
+
+@st.cache_resource
+def get_hedge_budget():
+    """Create the process-wide budget for hedged (extra, parallel) Gemini edit requests."""
+    return TokenBucket(GEMINI_HEDGES_PER_MINUTE, GEMINI_HEDGE_BURST)
+
+@st.cache_resource
+def get_preview_cache():
+    """Create the shared in-memory cache of display previews."""
+    return PreviewCache(max_bytes=PREVIEW_CACHE_MAX_BYTES)
+
+@st.cache_resource
+def get_preprocessor():
+    """Create the shared upload preprocessor and its cache."""
+    return Preprocessor(PREPROCESS_MAX_EDGE, PREPROCESS_FORMAT, PREPROCESS_QUALITY,
+                        PREPROCESS_CACHE_ITEMS, enabled=PREPROCESS_ENABLED)
+
+@st.cache_resource
+def get_favorites_store():
+    """Open the persistent favorites store shared by all sessions."""
+    return FavoritesStore(FAVORITES_DIR, thumbnail_width=FAVORITES_THUMBNAIL_WIDTH,
+                          max_indexes=FAVORITES_INDEX_OWNERS)
+
+@st.cache_resource
+def get_media_store():
+    """Open the managed directory that generated images and videos are written to."""
+    return MediaStore(MEDIA_DIR, retention_seconds=MEDIA_RETENTION_SECONDS, max_bytes=MEDIA_MAX_BYTES,
+                      gc_interval_seconds=MEDIA_GC_INTERVAL_SECONDS)
+
+@st.cache_resource
+def get_job_store():
+    """Open the durable job table shared by all sessions."""
+    store = JobStore(JOBS_DB_PATH)
+    store.prune(JOB_RETENTION_SECONDS)
+    # Imagen calls run in-process, so any left unfinished died with the previous server
+    for record in store.unfinished("image"):
+        store.fail(record.job_id, "Image generation was interrupted by a server restart.")
+    return store
+
+@st.cache_resource
+def get_history_store():
+    """Open the feedback-iteration history shared by all sessions."""
+    store = HistoryStore(HISTORY_DB_PATH)
+    store.prune(HISTORY_RETENTION_SECONDS)
+    return store
+
+def video_operation_from_name(name):
+    """Rebuild a Veo operation handle from its stored name so polling can resume."""
+    from google.genai import types
+    return types.GenerateVideosOperation(name=name)
 
+@st.cache_resource
+def get_video_job_manager():
+    """Create the process-wide background manager for Veo jobs.
+
+    Outstanding operations recorded by a previous server process resume polling here.
+    """
+    services = get_services()
+    return VideoJobManager(
+        client_factory=lambda: services.genai_client,
+        max_workers=VIDEO_POLL_WORKERS,
+        initial_delay=VIDEO_POLL_INITIAL_DELAY,
+        max_delay=VIDEO_POLL_MAX_DELAY,
+        max_poll_errors=VIDEO_MAX_POLL_ERRORS,
+        max_age_seconds=VIDEO_MAX_AGE_SECONDS,
+        guard=services.guards["veo"],
+        media_store=get_media_store(),
+        store=get_job_store(),
+        operation_from_name=video_operation_from_name,
+    )
+
+def submit_video_job(image, prompt):
+    """Submit a Veo job with an optional source ImageAsset + text prompt and return its job id."""
+    from google.genai import types
+
+    try:
         generate_kwargs = {
             "prompt": prompt,
             "model": VIDEO_MODEL_NAME,
         }
         
-        video_bytes = None
-        
-        if image_bytes is not None:
+        if image is not None:
             try:
-                image = Image.open(io.BytesIO(image_bytes))
-                if image.mode != 'RGB':
-                    image = image.convert('RGB')
-                
-                img_byte_arr = io.BytesIO()
-                image.save(img_byte_arr, format='JPEG', quality=95)
-                img_byte_arr = img_byte_arr.getvalue()
-                
-                image_obj = types.Image(image_bytes=img_byte_arr, mime_type="image/jpeg")
+                # JPEG sources are passed through untouched; others are encoded once per asset
+                image_obj = types.Image(image_bytes=image.encode("JPEG", quality=95), mime_type="image/jpeg")
                 generate_kwargs["image"] = image_obj
                 
             except Exception as e:
@@ -155,37 +444,1088 @@ def generate_video_from_image(image_bytes, prompt):
             person_generation="allow_adult",
             enhance_prompt=True,
             generate_audio=True,
+            **({"output_gcs_uri": VIDEO_OUTPUT_GCS_URI} if VIDEO_OUTPUT_GCS_URI else {}),
         )
         
-        try:
-            operation = client.models.generate_videos(**generate_kwargs)
-        except TypeError as e:
-            st.error(f"TypeError: {e}")
-        
-        while not operation.done:
-            time.sleep(45)
-            operation = client.operations.get(operation)
-
-        if operation.response:
-            if hasattr(operation.response, 'generated_videos') and len(operation.response.generated_videos) > 0:
-                video_obj = operation.response.generated_videos[0]
-                if hasattr(video_obj, 'video') and hasattr(video_obj.video, 'video_bytes'):
-                    video_bytes = video_obj.video.video_bytes
-            
-            if video_bytes is not None:
-                if isinstance(video_bytes, bytes) and video_bytes.startswith(b'AAAA'):
-                    return base64.b64decode(video_bytes)
-                return video_bytes
-            
-            return operation
+        return get_video_job_manager().submit(generate_kwargs, owner=current_user_id())
 
     except Exception as e:
         st.error(f"❌ Video generation request failed: {e}")
         return None
 
+def find_video_job(job_id):
+    """Look up a Veo job; only one that is still running needs the background manager."""
+    record = get_job_store().get(job_id or "")
+    if record is None:
+        return None
+    if record.done:
+        return VideoJob.from_record(record)
+    # Just after a restart the manager may still be resuming it; show the stored state meanwhile
+    return get_video_job_manager().get(job_id) or VideoJob.from_record(record)
+
+def render_video_job_status():
+    """Render the status of this session's Veo job from session state."""
+    job_id = st.session_state.get('video_job_id')
+    if not job_id:
+        return
+    job = find_video_job(job_id)
+    if job is None:
+        st.session_state.video_job_id = None
+        return
+
+    if not job.done:
+        st.info(f"⏳ Video is being generated... {int(job.elapsed)}s elapsed "
+                f"({job.poll_count} status checks). You can keep using the other tabs.")
+        return
+
+    if job.status == JOB_FAILED:
+        st.error(f"❌ {job.error}")
+        return
+
+    if st.session_state.get('video_job_shown') != job_id:
+        st.session_state.generated_video = job.video_path
+        st.session_state.video_iteration_count = 1
+        st.session_state.video_job_shown = job_id
+        st.success(f"Video generated successfully in {int(job.elapsed)}s!")
+    
+    video_path = st.session_state.generated_video
+    if not get_media_store().exists(video_path):
+        st.warning("This video has expired from the media store. Please generate it again.")
+        return
+    
+    # Streamlit serves the file over HTTP instead of inlining it into the page
+    st.video(video_path, format="video/mp4")
+    st.caption(f"Video size: {os.path.getsize(video_path)} bytes | Format: MP4")
+    
+    with open(video_path, "rb") as video_file:
+        st.download_button(
+            label="💾 Download Video",
+            data=video_file,
+            file_name="generated_video.mp4",
+            mime="video/mp4",
+            key="download_generated_video"
+        )
+
+@st.fragment
+def render_diagnostics():
+    """Show the last request's stage timings and process-wide latency stats."""
+    with st.expander("🩺 Diagnostics", expanded=False):
+        # Tab fragments don't rerun this panel; refreshing it reruns only the panel
+        st.button("🔄 Refresh", key="refresh_diagnostics")
+        trace = st.session_state.get('last_trace')
+        if trace is not None:
+            st.markdown(f"**Last request:** `{trace.name}` ({trace.trace_id}) — {trace.total_seconds:.2f}s")
+            st.table(trace.stages)
+        snapshot = get_metrics().snapshot()
+        if snapshot["stages"]:
+            st.markdown("**Stage latency (all sessions)**")
+            st.table([
+                {"stage": name, "count": row["count"], "error rate": f"{row['error_rate']:.1%}",
+                 "mean (s)": round(row["mean_s"], 3), "p50 (s)": row["p50_s"],
+                 "p95 (s)": row["p95_s"], "p99 (s)": row["p99_s"]}
+                for name, row in snapshot["stages"].items()
+            ])
+        if snapshot["counters"]:
+            st.json(snapshot["counters"])
+        st.caption(f"Imagen cache: {get_imagen_cache().stats()} | Previews: {get_preview_cache().stats()} | "
+                   f"Upload preprocessing: {get_preprocessor().stats()}")
+        if METRICS_HTTP_PORT:
+            st.caption(f"Prometheus metrics: http://{METRICS_HTTP_HOST}:{METRICS_HTTP_PORT}/metrics")
+
+# --- Gemini Streaming ---
+def cancel_gemini_stream():
+    """on_click of the Cancel button: stop the edit this session is streaming."""
+    edit = st.session_state.pop('gemini_stream', None)
+    if edit is not None:
+        # Usually already cancelled by stream_gemini_edit when the click interrupted it
+        edit.cancel()
+        st.session_state.gemini_stream_cancelled = True
+
+def gemini_session_assets():
+    """This session's bounded cache of Gemini edit inputs and outputs."""
+    if 'gemini_assets' not in st.session_state:
+        st.session_state.gemini_assets = AssetCache(GEMINI_SESSION_ASSET_BYTES, GEMINI_SESSION_ASSET_ITEMS)
+    return st.session_state.gemini_assets
+
+def gemini_edit_request(image_asset, instruction):
+    """Contents and config of a Gemini image edit: one image and one instruction."""
+    from google.genai import types
+
+    contents = [
+        types.Content(
+            role="user",
+            parts=[
+                types.Part(
+                    inline_data=types.Blob(
+                        mime_type=image_asset.mime_type,
+                        data=image_asset.data,
+                    )
+                ),
+                types.Part.from_text(text=instruction),
+            ],
+        )
+    ]
+    config = types.GenerateContentConfig(
+        temperature=0.3,
+        top_p=0.95,
+        top_k=40,
+        max_output_tokens=8192,
+        response_modalities=["image", "text"],
+        safety_settings=[
+            types.SafetySetting(
+                category="HARM_CATEGORY_CIVIC_INTEGRITY",
+                threshold="OFF",
+            ),
+        ],
+    )
+    return contents, config
+
+def current_gemini_node():
+    """History node of the current Gemini image; the first feedback edit makes it a tree root."""
+    node = get_history_store().get(st.session_state.get('gemini_node_id') or "")
+    if node is None:
+        node = record_iteration("gemini", st.session_state.gemini_generated_image,
+                                st.session_state.get('gemini_original_prompt') or "",
+                                st.session_state.get('gemini_current_style') or style_registry().default,
+                                timings=st.session_state.get('gemini_generation_timings'))
+        st.session_state.gemini_node_id = node.node_id
+    return node
+
+def set_gemini_image(asset, node):
+    """Make ``asset`` (the image of history ``node``) the current Gemini image."""
+    st.session_state.gemini_generated_image = asset
+    st.session_state.gemini_output_key = gemini_session_assets().put(asset)
+    st.session_state.gemini_node_id = node.node_id
+    st.session_state.gemini_iteration_count = node.depth
+    st.session_state.gemini_current_style = node.style
+
+def stream_gemini_edit(services, style_name, contents, config):
+    """Run a streamed Gemini edit, showing text and the image on the page as they arrive.
+
+    The style's candidate models are raced as a :class:`HedgedEdit`: the next
+    one starts when the current one is slow to produce an image or fails.
+    Returns the attempt to show (an :class:`EditStream`) and the placeholder
+    showing its image.
+    """
+    style = style_registry().get(style_name)
+    hedge_budget = get_hedge_budget()
+    edit = HedgedEdit(
+        lambda model_name, stream: services.submit(
+            services.edit_image_stream(model_name, contents, config, stream.feed)
+        ),
+        style.edit_models,
+        hedge_after_seconds=style.hedge_after_seconds,
+        may_hedge=hedge_budget.try_acquire,
+        buffer_bytes=GEMINI_STREAM_BUFFER_BYTES,
+    )
+    cancel_slot, status_slot, text_slot, image_slot = st.empty(), st.empty(), st.empty(), st.empty()
+    cancel_slot.button("⏹ Cancel", key="gemini_cancel_btn", on_click=cancel_gemini_stream)
+    st.session_state.gemini_stream = edit
+    started = time.monotonic()
+    finished = False
+    try:
+        for stream, kind, value in edit.events():
+            if kind == EVENT_TEXT:
+                text_slot.info("\n".join(stream.text_chunks[-3:]))
+            elif kind == EVENT_IMAGE:
+                try:
+                    # Decoded once here; the preview and later checks reuse these pixels
+                    value.image
+                    image_slot.image(preview(value, 1024), caption="Gemini Generated Image",
+                                     use_container_width=True)
+                except Exception:
+                    pass
+            running = [attempt.model_name for attempt, _ in edit.attempts if not attempt.closed]
+            status_slot.caption(f"⏳ Streaming from Gemini ({', '.join(running) or 'finishing'})... "
+                                f"{time.monotonic() - started:.0f}s")
+        finished = True
+        st.session_state.pop('gemini_stream', None)
+        return edit.result, image_slot
+    finally:
+        if not finished:
+            # Interrupted by a rerun (a click on Cancel or any other widget): stop paying for the
+            # attempts now, but leave the entry for cancel_gemini_stream and the abandoned-stream check
+            edit.cancel()
+        # The caller shows the final text alongside the result
+        cancel_slot.empty()
+        status_slot.empty()
+        text_slot.empty()
+
+def regenerate_gemini_with_feedback(services, feedback, style_name, from_original=False) -> bool:
+    """Apply ``feedback`` to the current Gemini image as a chained edit; True once the new image is current.
+
+    Only the previous output (re-encoded by the upload preprocessor) and a
+    short delta instruction are sent, instead of the original upload plus the
+    full style instruction. With ``from_original`` the full edit runs again on
+    the original upload, with the feedback added to the original instructions and
+    avoid-text. Both images come from this session's asset cache, so nothing has to be uploaded again.
+    """
+    assets = gemini_session_assets()
+    source_key = st.session_state.get('gemini_input_key' if from_original else 'gemini_output_key')
+    source = assets.get(source_key)
+    if source is None:
+        st.warning("That image is no longer cached for this session. Please upload it again and run the edit.")
+        return False
+    try:
+        parent = current_gemini_node()
+        if from_original:
+            original = st.session_state.get('gemini_user_instructions') or ""
+            instruction = edit_instruction(
+                style_name,
+                f"{original.rstrip('. ')}. {feedback}" if original else feedback,
+                st.session_state.get('gemini_user_avoid') or "",
+            )
+        else:
+            instruction = edit_feedback_instruction(feedback, style_name)
+            source = get_preprocessor().prepare(source.data, source.mime_type).asset
+        contents, config = gemini_edit_request(source, instruction)
+
+        st.session_state.last_trace = start_trace("gemini_feedback")
+        with stage("model_call"):
+            stream, _ = stream_gemini_edit(services, style_name, contents, config)
+        output_asset = stream.image
+        if output_asset is None:
+            if stream.rejected:
+                st.warning(f"Received bytes could not be decoded as an image ({stream.rejected[-1]}).")
+            if stream.text_chunks:
+                st.code("\n".join(stream.text_chunks), language="markdown")
+            else:
+                st.error("Gemini did not return an image. Try rephrasing your feedback.")
+            return False
+        node = record_iteration("gemini", output_asset, instruction, style_name, parent=parent, feedback=feedback,
+                                timings=trace_timings())
+        set_gemini_image(output_asset, node)
+        return True
+    except Exception as e:
+        st.error(f"Error during Gemini regeneration: {e}")
+        return False
+
+# --- Tabs ---
+# Each tab is a fragment, so a widget change inside one tab reruns only that tab.
+# Actions whose result shows up in another tab (adding a favorite) still
+# rerun the whole app with st.rerun().
+def tab_fragment(func):
+    """``st.fragment`` that also detaches stage timings from the previous run's trace."""
+    @wraps(func)
+    def run(*args, **kwargs):
+        start_trace(None)
+        return func(*args, **kwargs)
+    return st.fragment(run)
+
+@tab_fragment
+def render_image_tab(services):
+    """Imagen generation from a prompt and/or reference image, plus feedback iterations."""
+    st.markdown('<div class="content-card">', unsafe_allow_html=True)
+    st.markdown(section_header_html('🎨', 'Image Generation',
+                                    'Create stunning images from text descriptions or reference images'),
+                unsafe_allow_html=True)
+
+    # Follow a request that was still running when this page was reloaded or rerun
+    if st.session_state.get('image_job_error'):
+        st.error(f"An error occurred during image generation: {st.session_state.pop('image_job_error')}")
+    image_job = get_job_store().get(st.session_state.get('image_job_id') or "")
+    if st.session_state.generated_image is None and image_job is not None and not image_job.done:
+        st.fragment(render_image_job_status, run_every=VIDEO_STATUS_REFRESH_SECONDS)()
+
+    col_left, col_right = st.columns([2, 1])
+
+    with col_left:
+        st.markdown('<div class="input-group">', unsafe_allow_html=True)
+        st.markdown('<div class="input-label">✍️ Image Prompt</div>', unsafe_allow_html=True)
+        st.markdown('<div class="input-description">Describe the image you want to create</div>', unsafe_allow_html=True)
+        prompt = st.text_area(
+            "Enter your image prompt:",
+            height=200,
+            placeholder="A futuristic cityscape at sunset, with flying cars and neon lights...",
+            key="prompt_input",
+            label_visibility="collapsed"
+        )
+        st.markdown('</div>', unsafe_allow_html=True)
+
+        # Style Choice Section
+        st.markdown('<div class="input-group">', unsafe_allow_html=True)
+        st.markdown('<div class="input-label">🎨 Image Style</div>', unsafe_allow_html=True)
+        st.markdown('<div class="input-description">Choose the style that best fits your image purpose</div>', unsafe_allow_html=True)
+        style_choice = st.selectbox(
+            "Select image style:",
+            style_registry().names,
+            key="style_choice",
+            label_visibility="collapsed"
+        )
+        render_style_card(style_choice)
+        st.markdown('</div>', unsafe_allow_html=True)
+
+        # Negative Prompt Section
+        st.markdown('<div class="input-group">', unsafe_allow_html=True)
+        st.markdown('<div class="input-label">🚫 Negative Prompt</div>', unsafe_allow_html=True)
+        st.markdown('<div class="input-description">Specify what you DON\'T want in the image</div>', unsafe_allow_html=True)
+        negative_prompt = st.text_area(
+            "Negative prompt:",
+            height=80,
+            placeholder="blurry, distorted, low quality, text overlay, watermarks...",
+            key="negative_prompt_input",
+            label_visibility="collapsed"
+        )
+        st.markdown('</div>', unsafe_allow_html=True)
+
+    with col_right:
+        st.markdown('<div class="input-group">', unsafe_allow_html=True)
+        st.markdown('<div class="input-label">📁 Reference Image (Optional)</div>', unsafe_allow_html=True)
+        st.markdown('<div class="input-description">Upload a product image to guide the AI generation</div>', unsafe_allow_html=True)
+        reference_image_file = st.file_uploader(
+            "Choose an image file:",
+            type=["png", "jpg", "jpeg", "webp"],
+            key="reference_upload",
+            label_visibility="collapsed"
+        )
+        st.markdown('</div>', unsafe_allow_html=True)
+
+        # Advanced Parameters
+        st.markdown('<div class="input-group">', unsafe_allow_html=True)
+        st.markdown('<div class="input-label">⚙️ Advanced Parameters</div>', unsafe_allow_html=True)
+        adv_col1, adv_col2 = st.columns(2)
+        with adv_col1:
+            num_images = st.slider(
+                "Number of images",
+                min_value=1,
+                max_value=4,
+                value=1,
+                key="num_images_selector",
+            )
+        with adv_col2:
+            guidance_scale = st.slider(
+                "Guidance scale",
+                min_value=1.0,
+                max_value=20.0,
+                value=7.5,
+                step=0.5,
+                key="guidance_scale_selector",
+            )
+        st.markdown('</div>', unsafe_allow_html=True)
+
+        use_cache = st.checkbox(
+            "♻️ Reuse cached results for identical requests",
+            value=True,
+            key="use_imagen_cache",
+            help="Uncheck to force a fresh call to the model and get new variations.",
+        )
+
+        progressive = st.checkbox(
+            "⚡ Show each image as soon as it is ready",
+            value=True,
+            key="progressive_generation",
+            help="Sends one request per image in parallel when generating more than one image.",
+        )
+
+        generate_clicked = st.button("✨ Generate Image", type="primary", key="generate_main")
+
+    st.markdown('</div>', unsafe_allow_html=True)
+
+    # Describe the reference image while the user is still editing, so Generate only waits for Imagen.
+    # Only a new upload or style starts one; other reruns leave the speculation (and the cache) alone.
+    if PREFETCH_ENABLED and not generate_clicked:
+        speculation = (reference_image_file.file_id, style_choice) if reference_image_file is not None else None
+        if speculation != st.session_state.get('prefetch_speculation'):
+            st.session_state.prefetch_speculation = speculation
+            if speculation is not None:
+                reference_asset = get_preprocessor().prepare(reference_image_file.getvalue(),
+                                                             reference_image_file.type).asset
+                get_prefetcher().speculate(current_user_id(), reference_asset.data, reference_asset.mime_type,
+                                           reference_analysis_prompt(style_choice))
+            else:
+                get_prefetcher().release(current_user_id())
+
+    # Generation logic
+    if generate_clicked:
+        if not prompt and reference_image_file is None:
+            st.warning("Please either enter a prompt or upload a reference image to generate an image.")
+        else:
+            final_prompt = prompt if prompt else ""
+            try:
+                # If a reference image is provided, use it to enhance the prompt
+                st.session_state.last_trace = start_trace("image_generation")
+                if reference_image_file is not None:
+                    with st.spinner("Analyzing reference image..."), stage("reference_analysis"):
+                        reference_asset = prepare_upload(reference_image_file)
+                        st.image(preview(reference_asset, 300), caption="Your Reference Image", width=300)
+                        style_prompt = reference_analysis_prompt(style_choice)
+                        image_description, analysis_hit = get_prefetcher().describe(
+                            current_user_id(), reference_asset.data, reference_asset.mime_type, style_prompt
+                        )
+                        if analysis_hit:
+                            st.caption("⚡ Reused cached analysis of this reference image.")
+
+                    with stage("prompt_build"):
+                        final_prompt = compose_reference_prompt(image_description, prompt)
+
+                    st.info(f"Enhanced Prompt ({style_choice}): {final_prompt}")
+
+                else:
+                    if prompt.strip():
+                        final_prompt = prompt
+                        st.info(f"User Prompt: {final_prompt}")
+                    else:
+                        st.warning("Please either enter a prompt or upload a reference image to generate an image.")
+                        st.stop()
+
+                # Generate image
+                generation_params = {
+                    "prompt": final_prompt,
+                    "number_of_images": num_images,
+                    "add_watermark": False,
+                }
+
+                if negative_prompt and negative_prompt.strip():
+                    generation_params["negative_prompt"] = negative_prompt.strip()
+
+                cache = get_imagen_cache() if use_cache else None
+                job_request = {
+                    "prompt": prompt,
+                    "final_prompt": final_prompt,
+                    "negative_prompt": generation_params.get("negative_prompt", ""),
+                    "style": style_choice,
+                    "iteration": 1,
+                }
+                option_cols = None
+                if progressive and num_images > 1:
+                    # One request per image; fill each slot as its request finishes
+                    futures = start_image_fan_out(services, generation_params, cache, job_request,
+                                                  postprocess=partial(get_preview_cache().get, width=320))
+                    option_cols = st.columns(min(4, num_images))
+                    slots = [option_cols[idx % len(option_cols)].empty() for idx in range(num_images)]
+                    for idx, slot in enumerate(slots):
+                        slot.info(f"⏳ Generating option {idx+1}...")
+                    results = [None] * num_images
+                    with stage("model_call"):
+                        for future in as_completed(futures):
+                            idx = futures.index(future)
+                            try:
+                                results[idx] = future.result()
+                                slots[idx].image(results[idx][2], caption=f"Option {idx+1}")
+                            except Exception as e:
+                                slots[idx].warning(f"Option {idx+1} failed: {e}")
+                    options = [(idx, result[0]) for idx, result in enumerate(results) if result]
+                    cache_hit = bool(options) and all(result[1] for result in results if result)
+                else:
+                    with st.spinner("Generating your image... This may take a moment."), stage("model_call"):
+                        image_blobs, cache_hit = run_image_job(services, generation_params, cache, job_request)
+                    options = list(enumerate(image_blobs))
+
+                if options:
+                    images = options
+                    primary_image = images[0][1]
+                    set_generated_image(primary_image)
+                    if cache_hit:
+                        st.caption("⚡ Served from the result cache (no API call made).")
+                    st.session_state.current_prompt = prompt
+                    st.session_state.final_prompt = final_prompt
+                    st.session_state.iteration_count = 1
+                    st.session_state.negative_prompt = negative_prompt.strip() if negative_prompt else ""
+                    st.session_state.current_style = style_choice
+                    st.session_state.generation_timings = trace_timings()
+
+                    count = len(images)
+                    if option_cols is not None and count < num_images:
+                        st.warning(f"⚠️ {num_images - count} of {num_images} images failed; showing the ones that succeeded.")
+                    if count > 1 or option_cols is not None:
+                        st.success(f"✅ {count} images generated! Select your favorite below.")
+                        cols = option_cols or st.columns(min(4, count))
+                        for idx, img_obj in images:
+                            with cols[idx % len(cols)]:
+                                if option_cols is None:
+                                    st.image(preview(img_obj, 320), caption=f"Option {idx+1}")
+                                if st.button(f"Use Option {idx+1}", key=f"use_option_{idx}"):
+                                    set_generated_image(img_obj)
+                                    st.success(f"✅ Selected Option {idx+1}")
+                                    st.rerun(scope="fragment")
+
+                        st.markdown("---")
+                        st.markdown("### Current Selection")
+                        st.image(preview(st.session_state.generated_image, 640), 
+                                caption=f"Generated Image for: '{final_prompt}'")
+                    else:
+                        st.success(f"Image generated successfully! (Iteration #{st.session_state.iteration_count})")
+                        disp_img = preview(primary_image, 640)
+                        st.image(disp_img, caption=f"Generated Image for: '{final_prompt}'")
+
+                    # Add to Favorites button
+                    col_fav1, col_fav2 = st.columns([1, 1])
+                    with col_fav1:
+                        if st.button("⭐ Add to Favorites", key="add_to_favorites_main"):
+                            if add_favorite(st.session_state.generated_image, final_prompt,
+                                            style_choice, st.session_state.iteration_count):
+                                st.success("✨ Image added to favorites!")
+                                st.rerun()
+                            else:
+                                st.warning("⚠️ This image is already in your favorites!")
+
+                    with col_fav2:
+                        st.markdown("💡 **Tip:** Add images to favorites to save them for later use!")
+                else:
+                    st.error("No images were generated by the model. Try a different prompt.")
+
+            except Exception as e:
+                st.error(f"An error occurred during image generation: {str(e)}")
+
+    # Feedback section
+    if st.session_state.generated_image is not None:
+        st.markdown('<div class="feedback-section">', unsafe_allow_html=True)
+        st.markdown('<div class="feedback-header">🔄 Improve Your Image</div>', unsafe_allow_html=True)
+
+        col1, col2 = st.columns([2, 1])
+
+        with col1:
+            st.markdown('<div class="image-display-card">', unsafe_allow_html=True)
+            disp_img = preview(st.session_state.generated_image, 640)
+            st.image(disp_img, caption=f"Current Image (Iteration #{st.session_state.iteration_count})")
+            st.markdown('</div>', unsafe_allow_html=True)
+
+            picked = render_iteration_history(st.session_state.get('history_node_id'), "image")
+            if picked is not None:
+                # Branch from an earlier iteration: its image and prompt come back from the store
+                st.session_state.generated_image = load_iteration_image(picked)
+                st.session_state.history_node_id = picked.node_id
+                st.session_state.final_prompt = picked.prompt
+                st.session_state.negative_prompt = picked.negative_prompt
+                st.session_state.current_style = picked.style
+                st.session_state.iteration_count = picked.depth
+                st.rerun(scope="fragment")
+
+        with col2:
+            st.markdown('<div class="feedback-input-card">', unsafe_allow_html=True)
+            st.markdown('<div class="feedback-title">💡 Not satisfied with the result?</div>', unsafe_allow_html=True)
+            st.markdown('<div class="feedback-subtitle">Describe what you\'d like to change or improve:</div>', unsafe_allow_html=True)
+
+            # Style choice for feedback regeneration
+            st.markdown('<div class="input-label">🎨 Style for Regeneration</div>', unsafe_allow_html=True)
+            feedback_style_choice = st.selectbox(
+                "Select style for regeneration:",
+                style_registry().names,
+                key="feedback_style_choice",
+                index=style_registry().index(st.session_state.get('current_style')),
+                label_visibility="collapsed"
+            )
+            render_style_card(feedback_style_choice)
+
+            feedback = st.text_area(
+                "Your feedback:",
+                height=120,
+                placeholder="e.g., Make it brighter, change the background to blue, add more detail...",
+                key="image_feedback",
+                label_visibility="collapsed"
+            )
+
+            if st.button("🔄 Regenerate with Feedback", type="secondary", key="regenerate_button"):
+                if not feedback.strip():
+                    st.warning("Please provide some feedback to improve the image.")
+                else:
+                    try:
+                        # Rebuild the prompt from the first generation plus all feedback along this branch,
+                        # compacted so it does not grow with every iteration
+                        parent = current_image_node()
+                        history_path = get_history_store().lineage(parent.node_id)
+                        feedback_prompt = compact_feedback_prompt(
+                            parent.base_prompt, [node.feedback for node in history_path] + [feedback.strip()],
+                            feedback_style_choice, FEEDBACK_PROMPT_MAX_CHARS,
+                        )
+
+                        st.session_state.last_trace = start_trace("image_feedback")
+                        with st.spinner("Regenerating image with your feedback..."), stage("model_call"):
+                            generation_params = {
+                                "prompt": feedback_prompt,
+                                "number_of_images": 1,
+                                "add_watermark": False,
+                            }
+
+                            if st.session_state.get('negative_prompt'):
+                                generation_params["negative_prompt"] = st.session_state.negative_prompt
+
+                            image_blobs, _ = run_image_job(services, generation_params, get_imagen_cache(), {
+                                "prompt": st.session_state.current_prompt,
+                                "final_prompt": feedback_prompt,
+                                "negative_prompt": st.session_state.get('negative_prompt') or "",
+                                "style": feedback_style_choice,
+                                "iteration": parent.depth + 1,
+                            })
+
+                        if image_blobs:
+                            set_generated_image(image_blobs[0])
+                            node = record_iteration("image", st.session_state.generated_image, feedback_prompt,
+                                                    feedback_style_choice, parent=parent, feedback=feedback.strip(),
+                                                    negative_prompt=st.session_state.get('negative_prompt') or "",
+                                                    timings=trace_timings())
+                            st.session_state.history_node_id = node.node_id
+                            st.session_state.final_prompt = feedback_prompt
+                            st.session_state.iteration_count = node.depth
+
+                            st.success(f"✨ Image regenerated successfully! (Iteration #{st.session_state.iteration_count})")
+                            st.rerun(scope="fragment")
+                        else:
+                            st.error("Failed to regenerate image. Please try again.")
+
+                    except Exception as e:
+                        st.error(f"Error during regeneration: {str(e)}")
+
+            st.markdown('</div>', unsafe_allow_html=True)
+
+        # Reset button
+        if st.button("🗑️ Start Over", key="reset_button"):
+            for key in ['generated_image', 'current_prompt', 'final_prompt', 'negative_prompt', 'iteration_count']:
+                if key in st.session_state:
+                    st.session_state[key] = None if key == 'generated_image' else "" if key != 'iteration_count' else 0
+            st.session_state.history_node_id = None
+            st.rerun(scope="fragment")
+
+        st.markdown('</div>', unsafe_allow_html=True)
+
+
+@tab_fragment
+def render_video_tab():
+    """Veo video generation from a prompt and an optional source image."""
+    st.markdown('<div class="content-card">', unsafe_allow_html=True)
+    st.markdown(section_header_html('🎬', 'Video Generation',
+                                    'Create stunning videos from text descriptions or animate existing images'),
+                unsafe_allow_html=True)
+
+    # Source image selection
+    source_choice = st.radio(
+        "Source Image (optional):",
+        ["No image (prompt only)", "Use generated image", "Upload image"],
+        horizontal=True,
+        key="video_source_choice",
+    )
+
+    uploaded_video_image = None
+    source_image = None
+
+    if source_choice == "Use generated image":
+        if st.session_state.generated_image is None:
+            st.warning("No generated image found. Please upload an image or generate one first.")
+        else:
+            source_image = st.session_state.generated_image
+            st.image(preview(source_image, 300), caption="Source Image", width=300)
+    elif source_choice == "Upload image":
+        uploaded_video_image = st.file_uploader(
+            "Upload an image for the video",
+            type=["png", "jpg", "jpeg", "webp"],
+            key="video_image_upload",
+        )
+        if uploaded_video_image is not None:
+            source_image = prepare_upload(uploaded_video_image)
+            st.image(preview(source_image, 300), caption="Source Image", width=300)
+    else:
+        st.info("Using prompt only. No image will be provided to the video model.")
+
+    # Video prompt
+    st.markdown('<div class="input-group">', unsafe_allow_html=True)
+    st.markdown('<div class="input-label">🎬 Video Prompt</div>', unsafe_allow_html=True)
+    st.markdown('<div class="input-description">Describe the video motion and style you want to create</div>', unsafe_allow_html=True)
+
+    video_prompt = st.text_area(
+        "Enter your video prompt:",
+        height=200,
+        placeholder="A smooth camera rotation around the product, highlighting its features with cinematic lighting...",
+        key="video_prompt_input",
+        label_visibility="collapsed"
+    )
+    st.markdown('</div>', unsafe_allow_html=True)
+
+    if st.button("🎬 Generate Video", type="primary", key="generate_video_button"):
+        if not video_prompt.strip():
+            st.warning("Please enter a video prompt describing the motion or action.")
+        else:
+            job_id = submit_video_job(source_image, video_prompt)
+            if job_id:
+                st.session_state.video_job_id = job_id
+
+    # Poll the job from a fragment so only this panel reruns while the video is pending
+    pending_job = get_job_store().get(st.session_state.get('video_job_id') or "")
+    refresh_every = VIDEO_STATUS_REFRESH_SECONDS if pending_job is not None and not pending_job.done else None
+    st.fragment(render_video_job_status, run_every=refresh_every)()
+
+    st.markdown('</div>', unsafe_allow_html=True)
+
+
+def favorite_thumbnail(favorites, favorite):
+    """Preview for a favorite card: the stored thumbnail, else one rendered from the image, else None."""
+    previews = get_preview_cache()
+    try:
+        return previews.get(None, FAVORITES_THUMBNAIL_WIDTH, key=favorite.image_hash,
+                            loader=lambda: favorites.thumbnail_bytes(favorite))
+    except OSError:
+        pass
+    try:
+        return previews.get(favorites.image_bytes(favorite), FAVORITES_THUMBNAIL_WIDTH, key=favorite.image_hash)
+    except OSError:
+        return None
+
+
+@tab_fragment
+def render_favorites_tab(owner):
+    """The current page of ``owner``'s saved favorites."""
+    st.markdown('<div class="content-card">', unsafe_allow_html=True)
+    st.markdown(section_header_html('⭐', 'Your Favorite Images',
+                                    'Manage and download your favorite generated images'),
+                unsafe_allow_html=True)
+
+    favorites = get_favorites_store()
+    favorites_total = favorites.count(owner)
+    if favorites_total:
+        st.markdown(f"**Saved Images ({favorites_total})**")
+
+        page_count = (favorites_total + FAVORITES_PAGE_SIZE - 1) // FAVORITES_PAGE_SIZE
+        page = min(st.session_state.get('favorites_page', 0), page_count - 1)
+        if page_count > 1:
+            col_prev, col_page, col_next = st.columns([1, 2, 1])
+            with col_prev:
+                if st.button("◀ Previous", key="favorites_prev", disabled=page == 0):
+                    st.session_state.favorites_page = page - 1
+                    st.rerun(scope="fragment")
+            with col_page:
+                st.markdown(f"Page {page + 1} of {page_count}")
+            with col_next:
+                if st.button("Next ▶", key="favorites_next", disabled=page >= page_count - 1):
+                    st.session_state.favorites_page = page + 1
+                    st.rerun(scope="fragment")
+
+        # Display the current page of favorites
+        for i, favorite in enumerate(favorites.page(owner, page * FAVORITES_PAGE_SIZE, FAVORITES_PAGE_SIZE),
+                                     start=page * FAVORITES_PAGE_SIZE):
+            st.markdown('<div class="favorite-item">', unsafe_allow_html=True)
+            col1, col2 = st.columns([3, 1])
+
+            with col1:
+                thumb = favorite_thumbnail(favorites, favorite)
+                if thumb is not None:
+                    st.image(thumb, caption=f"Favorite #{i+1}", width=400)
+                else:
+                    st.warning(f"Favorite #{i+1}: the image file is missing.")
+
+            with col2:
+                st.markdown(f"**Prompt:** {favorite.prompt[:150]}...")
+
+                favorite_style = favorite.style or style_registry().default
+                st.markdown(style_registry().badge_html(favorite_style), unsafe_allow_html=True)
+
+                st.markdown(f"**Date:** {favorite.date}")
+                st.markdown(f"**Iteration:** #{favorite.iteration}")
+
+                col_btn1, col_btn2 = st.columns(2)
+                with col_btn1:
+                    if st.button(f"🗑️ Remove", key=f"remove_fav_{favorite.id}"):
+                        favorites.remove(owner, favorite.id)
+                        st.rerun(scope="fragment")
+
+                with col_btn2:
+                    try:
+                        image_bytes = favorites.image_bytes(favorite)
+                    except OSError:
+                        image_bytes = None
+                    if image_bytes is not None:
+                        st.download_button(
+                            label="💾 Download",
+                            data=image_bytes,
+                            file_name=f"favorite_image_{i+1}.{favorite.extension}",
+                            mime=favorite.mime_type,
+                            key=f"download_fav_{favorite.id}"
+                        )
+                    else:
+                        st.button("💾 Download", key=f"download_fav_{favorite.id}", disabled=True)
+
+            st.markdown('</div>', unsafe_allow_html=True)
+
+        if st.button("🗑️ Clear All Favorites", key="clear_all_favorites"):
+            favorites.clear(owner)
+            st.session_state.favorites_page = 0
+            st.rerun(scope="fragment")
+
+    else:
+        st.markdown('''
+        <div class="no-content-message">
+            <div class="no-content-icon">⭐</div>
+            <div class="no-content-title">No Favorites Yet</div>
+            <div class="no-content-description">Generate some images first, then add them to your favorites to see them here!</div>
+        </div>
+        ''', unsafe_allow_html=True)
+
+    st.markdown('</div>', unsafe_allow_html=True)
+
+
+@tab_fragment
+def render_gemini_tab(services):
+    """Gemini editing of an uploaded image, plus feedback iterations."""
+    st.markdown('<div class="content-card">', unsafe_allow_html=True)
+    st.markdown(section_header_html('🧪', 'Experimental Gemini Image Generation',
+                                    "Transform existing images using Gemini's experimental image generation capabilities"),
+                unsafe_allow_html=True)
+
+    col_g_left, col_g_right = st.columns([1, 2])
+
+    with col_g_left:
+        st.markdown('<div class="input-group">', unsafe_allow_html=True)
+        st.markdown('<div class="input-label">📁 Input Image</div>', unsafe_allow_html=True)
+        gemini_input_image = st.file_uploader(
+            "Choose an image file:",
+            type=["png", "jpg", "jpeg", "webp"],
+            key="gemini_image_upload",
+            label_visibility="collapsed"
+        )
+        if gemini_input_image is not None:
+            st.image(preview(gemini_input_image.getvalue(), 300), caption="Input Image", width=300)
+        st.markdown('</div>', unsafe_allow_html=True)
+
+    with col_g_right:
+        st.markdown('<div class="input-group">', unsafe_allow_html=True)
+        st.markdown('<div class="input-label">✍️ Text Instruction</div>', unsafe_allow_html=True)
+        st.markdown('<div class="input-description">Instructions for transforming the image</div>', unsafe_allow_html=True)
+        gemini_text_prompt = st.text_area(
+            "Enter instruction for image generation:",
+            height=200,
+            placeholder="please color this beautifully using red, green, blue",
+            key="gemini_text_prompt",
+            label_visibility="collapsed"
+        )
+        st.markdown('</div>', unsafe_allow_html=True)
+
+        # Style Choice Section for Gemini
+        st.markdown('<div class="input-group">', unsafe_allow_html=True)
+        st.markdown('<div class="input-label">🎨 Generation Style</div>', unsafe_allow_html=True)
+        st.markdown('<div class="input-description">Choose the style for the image transformation</div>', unsafe_allow_html=True)
+        gemini_style_choice = st.selectbox(
+            "Select image style:",
+            style_registry().names,
+            key="gemini_style_choice",
+            label_visibility="collapsed"
+        )
+        render_style_card(gemini_style_choice)
+        st.markdown('</div>', unsafe_allow_html=True)
+
+        # Negative Prompt (optional)
+        st.markdown('<div class="input-group">', unsafe_allow_html=True)
+        st.markdown('<div class="input-label">🚫 Negative Prompt</div>', unsafe_allow_html=True)
+        st.markdown('<div class="input-description">Specify what you DON\'T want in the image</div>', unsafe_allow_html=True)
+        gemini_negative_prompt = st.text_area(
+            "Negative prompt:",
+            height=60,
+            placeholder="blurry, distorted, low quality, text overlay, watermarks, multiple objects, cluttered background...",
+            key="gemini_negative_prompt",
+            label_visibility="collapsed"
+        )
+        st.markdown('</div>', unsafe_allow_html=True)
+
+        gemini_generate_clicked = st.button("🧪 Generate with Gemini", type="primary", key="gemini_generate_btn")
+
+    # A rerun abandons any edit this page was streaming; stop it instead of paying for it unseen
+    abandoned_stream = st.session_state.pop('gemini_stream', None)
+    if abandoned_stream is not None:
+        abandoned_stream.cancel()
+    if st.session_state.pop('gemini_stream_cancelled', False):
+        st.warning("⏹ Gemini edit cancelled.")
+
+    if gemini_generate_clicked:
+        if gemini_input_image is None:
+            st.warning("Please upload an image to transform.")
+        else:
+            try:
+                # Prepare contents for the Gemini image generation model
+                input_asset = prepare_upload(gemini_input_image)
+
+                # Style guidance plus the user's prompt and negative prompt
+                _text_instruction = edit_instruction(
+                    gemini_style_choice,
+                    gemini_text_prompt.strip(),
+                    gemini_negative_prompt.strip() if gemini_negative_prompt else "",
+                )
+
+                # Show the enhanced prompt to user
+                st.info(f"🎨 **Style-Enhanced Prompt ({gemini_style_choice})**: {_text_instruction}")
+
+                contents, generate_content_config = gemini_edit_request(input_asset, _text_instruction)
+
+                st.session_state.last_trace = start_trace("gemini_edit")
+                with stage("model_call"):
+                    stream, image_slot = stream_gemini_edit(services, gemini_style_choice, contents,
+                                                            generate_content_config)
+                text_chunks = stream.text_chunks
+                output_asset = stream.image
+
+                if output_asset is not None:
+                    with stage("decode_verify"):
+                        # Headers were checked by the payload decoder; the pixels were decoded once for
+                        # display and that decode is reused here and by every later step
+                        try:
+                            output_asset.image
+                            valid_image = True
+                        except Exception:
+                            valid_image = False
+
+                    if valid_image:
+                        st.success("✅ Image generated successfully!")
+                        # Store generated image in session state for feedback functionality
+                        st.session_state.gemini_generated_image = output_asset
+                        st.session_state.gemini_iteration_count = 1
+                        st.session_state.gemini_current_style = gemini_style_choice
+                        st.session_state.gemini_original_prompt = _text_instruction
+                        # What the user asked for, so a restart from the upload can add feedback to it
+                        st.session_state.gemini_user_instructions = gemini_text_prompt.strip()
+                        st.session_state.gemini_user_avoid = gemini_negative_prompt.strip() if gemini_negative_prompt else ""
+                        # Keep the input and output for feedback edits, so neither has to be uploaded again
+                        assets = gemini_session_assets()
+                        st.session_state.gemini_input_key = assets.put(input_asset)
+                        st.session_state.gemini_output_key = assets.put(output_asset)
+                        st.session_state.gemini_node_id = None
+                        st.session_state.gemini_generation_timings = trace_timings()
+
+                        image_slot.image(preview(output_asset, 1024), caption="Gemini Generated Image",
+                                         use_container_width=True)
+                        st.download_button(
+                            label="💾 Download Image",
+                            data=output_asset.data,
+                            file_name="gemini_output.jpg" if output_asset.format == "JPEG" else "gemini_output.png",
+                            mime=output_asset.mime_type,
+                            key="download_gemini_image",
+                        )
+
+                        # Add to Favorites button for main generation
+                        if st.button("⭐ Add to Favorites", key="add_to_favorites_gemini_main"):
+                            if add_favorite(
+                                st.session_state.gemini_generated_image,
+                                f"Gemini: {gemini_text_prompt if gemini_text_prompt else 'Image transformation'}",
+                                gemini_style_choice,
+                                st.session_state.gemini_iteration_count,
+                            ):
+                                st.success("Added to favorites! ⭐")
+                                st.rerun()
+                            else:
+                                st.warning("⚠️ This image is already in your favorites!")
+
+                        if text_chunks:
+                            st.info("\n".join(text_chunks[-3:]))
+                    else:
+                        st.warning("Received bytes could not be decoded as an image. Showing text response if available.")
+                        if text_chunks:
+                            st.code("\n".join(text_chunks), language="markdown")
+                        else:
+                            st.error("Gemini did not return a decodable image or text. Try adjusting your prompt.")
+                elif stream.rejected:
+                    st.warning(f"Received bytes could not be decoded as an image ({stream.rejected[-1]}). "
+                               "Showing text response if available.")
+                    if text_chunks:
+                        st.code("\n".join(text_chunks), language="markdown")
+                    else:
+                        st.error("Gemini did not return a decodable image or text. Try adjusting your prompt.")
+                else:
+                    if text_chunks:
+                        st.warning("No image bytes found in the stream. Showing text response:")
+                        st.code("\n".join(text_chunks), language="markdown")
+                    else:
+                        st.error("Gemini did not return an image or text. Try adjusting your prompt.")
+            except Exception as e:
+                st.error(f"Gemini image generation failed: {e}")
+
+    # --- Gemini Feedback Section ---
+    if st.session_state.get('gemini_generated_image') is not None:
+        st.markdown('<div class="feedback-section">', unsafe_allow_html=True)
+        st.markdown('<div class="feedback-header">🔄 Improve Your Gemini Image</div>', unsafe_allow_html=True)
+
+        col1, col2 = st.columns([2, 1])
+
+        with col1:
+            st.markdown('<div class="image-display-card">', unsafe_allow_html=True)
+            disp_img = preview(st.session_state.gemini_generated_image, 640)
+            st.image(disp_img, caption=f"Current Gemini Image (Iteration #{st.session_state.get('gemini_iteration_count', 1)})")
+
+            # Add to Favorites button for feedback section
+            col_fav_fb1, col_fav_fb2 = st.columns([1, 1])
+            with col_fav_fb1:
+                if st.button("⭐ Add to Favorites", key="add_to_favorites_gemini_feedback"):
+                    if add_favorite(
+                        st.session_state.gemini_generated_image,
+                        f"Gemini Feedback: Iteration #{st.session_state.get('gemini_iteration_count', 1)}",
+                        st.session_state.get('gemini_current_style') or style_registry().default,
+                        st.session_state.get('gemini_iteration_count', 1),
+                    ):
+                        st.success("Added to favorites! ⭐")
+                        st.rerun()
+                    else:
+                        st.warning("⚠️ This image is already in your favorites!")
+
+            with col_fav_fb2:
+                # Download button for feedback section
+                gemini_asset = st.session_state.get('gemini_generated_image')
+                if gemini_asset is not None:
+                    st.download_button(
+                        label="💾 Download",
+                        data=gemini_asset.data,
+                        file_name=f"gemini_feedback_iteration_{st.session_state.get('gemini_iteration_count', 1)}.{'jpg' if gemini_asset.format == 'JPEG' else 'png'}",
+                        mime=gemini_asset.mime_type,
+                        key="download_gemini_feedback"
+                    )
+
+            st.markdown('</div>', unsafe_allow_html=True)
+
+            picked = render_iteration_history(st.session_state.get('gemini_node_id'), "gemini")
+            if picked is not None:
+                set_gemini_image(load_iteration_image(picked), picked)
+                st.rerun(scope="fragment")
+
+        with col2:
+            st.markdown('<div class="feedback-input-card">', unsafe_allow_html=True)
+            st.markdown('<div class="feedback-title">💡 Not satisfied with the result?</div>', unsafe_allow_html=True)
+            st.markdown('<div class="feedback-subtitle">Describe what you\'d like to change or improve:</div>', unsafe_allow_html=True)
+
+            # Style choice for feedback regeneration
+            st.markdown('<div class="input-label">🎨 Style for Regeneration</div>', unsafe_allow_html=True)
+            gemini_feedback_style_choice = st.selectbox(
+                "Select style for regeneration:",
+                style_registry().names,
+                key="gemini_feedback_style_choice",
+                index=style_registry().index(st.session_state.get('gemini_current_style')),
+                label_visibility="collapsed"
+            )
+            render_style_card(gemini_feedback_style_choice)
+
+            gemini_feedback = st.text_area(
+                "Your feedback:",
+                height=120,
+                placeholder="e.g., Make it brighter, change the background to blue, add more detail, use different lighting...",
+                key="gemini_feedback",
+                label_visibility="collapsed"
+            )
+            gemini_from_original = st.checkbox(
+                "Start again from the original upload",
+                key="gemini_feedback_from_original",
+                help="By default the feedback is applied to the current image. Tick this to re-run the full "
+                     "style edit on your original upload instead.",
+            )
+
+            if st.button("🔄 Regenerate with Feedback", type="secondary", key="regenerate_gemini_button"):
+                if not gemini_feedback.strip():
+                    st.warning("Please provide some feedback to improve the image.")
+                else:
+                    if regenerate_gemini_with_feedback(services, gemini_feedback.strip(),
+                                                       gemini_feedback_style_choice, gemini_from_original):
+                        st.rerun(scope="fragment")
+
+            st.markdown('</div>', unsafe_allow_html=True)
+
+        st.markdown('</div>', unsafe_allow_html=True)
+
+        # Start Over button for Gemini
+        if st.button("🗑️ Start Over (Gemini)", key="reset_gemini_button"):
+            for key in ['gemini_generated_image', 'gemini_iteration_count', 'gemini_current_style', 'gemini_original_prompt',
+                        'gemini_user_instructions', 'gemini_user_avoid',
+                        'gemini_input_key', 'gemini_output_key', 'gemini_node_id', 'gemini_assets']:
+                if key in st.session_state:
+                    del st.session_state[key]
+            st.rerun(scope="fragment")
+
+    st.markdown('</div>', unsafe_allow_html=True)
+
+
 # --- Main App ---
 def main():
-    # Page configuration
+    # Page configuration (must be the first Streamlit call of the run)
     st.set_page_config(
         page_title="AI Content Generator",
         layout="wide",
@@ -193,16 +1533,16 @@ def main():
         initial_sidebar_state="collapsed"
     )
 
+    # Stage timings only attach to a trace started during this run
+    start_trace(None)
+    get_metrics()
+    start_warm_up()
+
     # Load external CSS
     load_css()
 
     # App header
-    st.markdown("""
-    <div class="app-header">
-        <h1 class="app-title">AI Content Generator</h1>
-        <p class="app-subtitle">Transform your ideas into stunning images and videos</p>
-    </div>
-    """, unsafe_allow_html=True)
+    st.markdown(APP_HEADER_HTML, unsafe_allow_html=True)
 
     # Initialize session state
     if 'generated_image' not in st.session_state:
@@ -215,8 +1555,9 @@ def main():
         st.session_state.negative_prompt = ""
     if 'iteration_count' not in st.session_state:
         st.session_state.iteration_count = 0
-    if 'favorites' not in st.session_state:
-        st.session_state.favorites = []
+    if 'favorites_page' not in st.session_state:
+        st.session_state.favorites_page = 0
+    favorites_owner = current_user_id()
     if 'generated_video' not in st.session_state:
         st.session_state.generated_video = None
     if 'video_iteration_count' not in st.session_state:
@@ -226,970 +1567,24 @@ def main():
     tab1, tab2, tab3, tab4 = st.tabs(["🖼️ Image Generation", "🎬 Video Generation", "⭐ Favorites", "🧪 Gemini Image Gen"])
 
     # Authenticate and initialize models
-    if authenticate_and_initialize():
-        imagen_model = create_imagen_model()
-        gemini_model = create_gemini_model()
-        veo_model = create_veo_model()
-        
-        # --- IMAGE GENERATION TAB ---
+    services = get_services()
+    if services:
+        reattach_jobs()
         with tab1:
-            st.markdown('<div class="content-card">', unsafe_allow_html=True)
-            st.markdown('''
-            <div class="section-header">
-                <div class="icon">🎨</div>
-                <div>
-                    <div>Image Generation</div>
-                </div>
-            </div>
-            <div class="section-description">Create stunning images from text descriptions or reference images</div>
-            ''', unsafe_allow_html=True)
-            
-            col_left, col_right = st.columns([2, 1])
-            
-            with col_left:
-                st.markdown('<div class="input-group">', unsafe_allow_html=True)
-                st.markdown('<div class="input-label">✍️ Image Prompt</div>', unsafe_allow_html=True)
-                st.markdown('<div class="input-description">Describe the image you want to create</div>', unsafe_allow_html=True)
-                prompt = st.text_area(
-                    "Enter your image prompt:",
-                    height=200,
-                    placeholder="A futuristic cityscape at sunset, with flying cars and neon lights...",
-                    key="prompt_input",
-                    label_visibility="collapsed"
-                )
-                st.markdown('</div>', unsafe_allow_html=True)
-                
-                # Style Choice Section
-                st.markdown('<div class="input-group">', unsafe_allow_html=True)
-                st.markdown('<div class="input-label">🎨 Image Style</div>', unsafe_allow_html=True)
-                st.markdown('<div class="input-description">Choose the style that best fits your image purpose</div>', unsafe_allow_html=True)
-                style_choice = st.selectbox(
-                    "Select image style:",
-                    ["E-commerce Product", "Real-world Lifestyle", "Creative Artistic"],
-                    key="style_choice",
-                    label_visibility="collapsed"
-                )
-                
-                # Style descriptions
-                style_descriptions = {
-                    "E-commerce Product": "Clean, professional photos with studio lighting, neutral backgrounds, and commercial appeal - perfect for product catalogs and online retail.",
-                    "Real-world Lifestyle": "Natural, authentic images showing products in everyday use with natural lighting and relatable settings - ideal for lifestyle marketing.",
-                    "Creative Artistic": "Dramatic, artistic photos with creative lighting, artistic backgrounds, and artistic composition - great for creative campaigns and social media."
-                }
-                
-                if style_choice in style_descriptions:
-                    style_class = {
-                        "E-commerce Product": "ecommerce",
-                        "Real-world Lifestyle": "lifestyle", 
-                        "Creative Artistic": "creative"
-                    }.get(style_choice, "ecommerce")
-                    
-                    st.markdown(f'<div class="style-badge {style_class}">🎨 {style_choice}</div>', unsafe_allow_html=True)
-                    st.info(f"💡 **{style_choice}**: {style_descriptions[style_choice]}")
-                st.markdown('</div>', unsafe_allow_html=True)
-                
-                # Negative Prompt Section
-                st.markdown('<div class="input-group">', unsafe_allow_html=True)
-                st.markdown('<div class="input-label">🚫 Negative Prompt</div>', unsafe_allow_html=True)
-                st.markdown('<div class="input-description">Specify what you DON\'T want in the image</div>', unsafe_allow_html=True)
-                negative_prompt = st.text_area(
-                    "Negative prompt:",
-                    height=80,
-                    placeholder="blurry, distorted, low quality, text overlay, watermarks...",
-                    key="negative_prompt_input",
-                    label_visibility="collapsed"
-                )
-                st.markdown('</div>', unsafe_allow_html=True)
-            
-            with col_right:
-                st.markdown('<div class="input-group">', unsafe_allow_html=True)
-                st.markdown('<div class="input-label">📁 Reference Image (Optional)</div>', unsafe_allow_html=True)
-                st.markdown('<div class="input-description">Upload a product image to guide the AI generation</div>', unsafe_allow_html=True)
-                reference_image_file = st.file_uploader(
-                    "Choose an image file:",
-                    type=["png", "jpg", "jpeg", "webp"],
-                    key="reference_upload",
-                    label_visibility="collapsed"
-                )
-                st.markdown('</div>', unsafe_allow_html=True)
-                
-                # Advanced Parameters
-                st.markdown('<div class="input-group">', unsafe_allow_html=True)
-                st.markdown('<div class="input-label">⚙️ Advanced Parameters</div>', unsafe_allow_html=True)
-                adv_col1, adv_col2 = st.columns(2)
-                with adv_col1:
-                    num_images = st.slider(
-                        "Number of images",
-                        min_value=1,
-                        max_value=4,
-                        value=1,
-                        key="num_images_selector",
-                    )
-                with adv_col2:
-                    guidance_scale = st.slider(
-                        "Guidance scale",
-                        min_value=1.0,
-                        max_value=20.0,
-                        value=7.5,
-                        step=0.5,
-                        key="guidance_scale_selector",
-                    )
-                st.markdown('</div>', unsafe_allow_html=True)
-                
-                generate_clicked = st.button("✨ Generate Image", type="primary", key="generate_main")
-            
-            st.markdown('</div>', unsafe_allow_html=True)
-            
-            # Generation logic
-            if generate_clicked:
-                if not prompt and reference_image_file is None:
-                    st.warning("Please either enter a prompt or upload a reference image to generate an image.")
-                else:
-                    final_prompt = prompt if prompt else ""
-                    try:
-                        # If a reference image is provided, use it to enhance the prompt
-                        if reference_image_file is not None:
-                            with st.spinner("Analyzing reference image..."):
-                                st.image(reference_image_file, caption="Your Reference Image", width=300)
-                                image_bytes = reference_image_file.getvalue()
-                                mime_type = reference_image_file.type
-                                image_part = Part.from_data(image_bytes, mime_type=mime_type)
-
-                                # Style-specific description prompts
-                                style_prompts = {
-                                   "E-commerce Product": """You are an expert in e-commerce product imagery. Analyze the provided product image and generate ONE cohesive paragraph (150–250 words). 
-Begin exactly with:
-
-"Create a professional e commerce product image, showing the exact same product with all details preserved [add — specifically the \"<BRAND> <MODEL>\" — if you could read them], in a clean commercial photography style suitable for online retail,"
-
-Constraints:
-- Do NOT modify the product itself: preserve shape, proportions, dimensions, colors, materials, textures, logos, texts, branding elements, and surface finishes.
-- Only modify the background, scene, lighting, or camera angle.
-- Keep realistic shadows, reflections, and perspective.
-- Product must stay centered, sharp, and in focus.
-
-Style:
-- Neutral or white background
-- Studio lighting (soft key light, subtle rim light)
-- Minimal clutter, catalog-ready composition
-- Confident, precise wording: "exactly", "identical", "specifically", "not altered"
-""",
-
-    "Real-world Lifestyle": """You are a lifestyle photography expert. Analyze the provided product image and generate ONE cohesive paragraph (150–250 words). 
-Begin exactly with:
-
-"Create a realistic lifestyle image, showing the exact same product with all details preserved [add — specifically the \"<BRAND> <MODEL>\" — if you could read them], in a natural, everyday setting that demonstrates how people would actually use this product,"
-
-Constraints:
-- Preserve the product's physical features exactly: shape, size, colors, logos, branding, text, textures.
-- Only adjust background, lighting, environment, or perspective.
-- Keep natural shadows, realistic reflections, and perspective.
-
-Style:
-- Natural lighting (window light, outdoor ambient)
-- Authentic home, office, or outdoor context
-- Relatable props, warm atmosphere
-- Composition must look natural, not staged
-- Confident, precise wording: "exactly", "identical", "specifically", "not altered"
-""",
-
-    "Creative Artistic": """You are a creative photography expert. Analyze the provided product image and generate ONE cohesive paragraph (150–250 words). 
-Begin exactly with:
-
-"Create an artistic, creative image, showing the exact same product with all details preserved [add — specifically the \"<BRAND> <MODEL>\" — if you could read them], in a creative artistic style with dramatic lighting and artistic composition,"
-
-Constraints:
-- Preserve the product's features exactly: dimensions, materials, branding, text, logos.
-- Do NOT alter or distort the product in any way.
-- Only modify lighting, artistic background, composition, or camera angle.
-
-Style:
-- Dramatic or experimental lighting (shadows, colored gels, patterns)
-- Abstract or textured backgrounds
-- Artistic composition and unique perspective
-- Confident, precise wording: "exactly", "identical", "specifically", "not altered"
-"""
-                                }
-
-                                style_prompt = style_prompts.get(style_choice, style_prompts["E-commerce Product"])
-                                description_response = gemini_model.generate_content([style_prompt, image_part])
-                                image_description = description_response.text
-
-                                if prompt.strip():
-                                    final_prompt = f"{image_description}. Additionally, {prompt}"
-                                else:
-                                    final_prompt = image_description
-                                
-                                st.info(f"Enhanced Prompt ({style_choice}): {final_prompt}")
-
-                        else:
-                            if prompt.strip():
-                                final_prompt = prompt
-                                st.info(f"User Prompt: {final_prompt}")
-                            else:
-                                st.warning("Please either enter a prompt or upload a reference image to generate an image.")
-                                st.stop()
-
-                        # Generate image
-                        with st.spinner("Generating your image... This may take a moment."):
-                            generation_params = {
-                                "prompt": final_prompt,
-                                "number_of_images": num_images,
-                                "add_watermark": False,
-                            }
-                            
-                            if negative_prompt and negative_prompt.strip():
-                                generation_params["negative_prompt"] = negative_prompt.strip()
-                            
-                            try:
-                                response = imagen_model.generate_images(**generation_params)
-                            except TypeError:
-                                response = imagen_model.generate_images(**generation_params)
-                        
-                        if response and hasattr(response, 'images') and response.images:
-                            images = response.images
-                            primary_image = images[0]
-                            st.session_state.generated_image = primary_image._pil_image
-                            st.session_state.current_prompt = prompt
-                            st.session_state.final_prompt = final_prompt
-                            st.session_state.iteration_count = 1
-                            st.session_state.negative_prompt = negative_prompt.strip() if negative_prompt else ""
-                            st.session_state.current_style = style_choice
-                            
-                            count = len(images)
-                            if count > 1:
-                                st.success(f"✅ {count} images generated! Select your favorite below.")
-                                cols = st.columns(min(4, count))
-                                for idx, img_obj in enumerate(images):
-                                    with cols[idx % len(cols)]:
-                                        thumb = downscale_image_for_display(img_obj._pil_image, 320)
-                                        st.image(thumb, caption=f"Option {idx+1}")
-                                        if st.button(f"Use Option {idx+1}", key=f"use_option_{idx}"):
-                                            st.session_state.generated_image = img_obj._pil_image
-                                            st.success(f"✅ Selected Option {idx+1}")
-                                            st.rerun()
-                                
-                                st.markdown("---")
-                                st.markdown("### Current Selection")
-                                st.image(downscale_image_for_display(st.session_state.generated_image, 640), 
-                                        caption=f"Generated Image for: '{final_prompt}'")
-                            else:
-                                st.success(f"Image generated successfully! (Iteration #{st.session_state.iteration_count})")
-                                disp_img = downscale_image_for_display(primary_image._pil_image, 640)
-                                st.image(disp_img, caption=f"Generated Image for: '{final_prompt}'")
-                            
-                            # Add to Favorites button
-                            col_fav1, col_fav2 = st.columns([1, 1])
-                            with col_fav1:
-                                if st.button("⭐ Add to Favorites", key="add_to_favorites_main"):
-                                    img_byte_arr = BytesIO()
-                                    st.session_state.generated_image.save(img_byte_arr, format='PNG')
-                                    img_bytes = img_byte_arr.getvalue()
-                                    
-                                    favorite_entry = {
-                                        'image': st.session_state.generated_image,
-                                        'image_bytes': img_bytes,
-                                        'prompt': final_prompt,
-                                        'date': time.strftime("%Y-%m-%d %H:%M"),
-                                        'iteration': st.session_state.iteration_count,
-                                        'style': style_choice
-                                    }
-                                    
-                                    is_duplicate = any(fav['prompt'] == final_prompt for fav in st.session_state.favorites)
-                                    if not is_duplicate:
-                                        st.session_state.favorites.append(favorite_entry)
-                                        st.success("✨ Image added to favorites!")
-                                        st.rerun()
-                                    else:
-                                        st.warning("⚠️ This image is already in your favorites!")
-                            
-                            with col_fav2:
-                                st.markdown("💡 **Tip:** Add images to favorites to save them for later use!")
-                        else:
-                            st.error("No images were generated by the model. Try a different prompt.")
-
-                    except Exception as e:
-                        st.error(f"An error occurred during image generation: {str(e)}")
-            
-            # Feedback section
-            if st.session_state.generated_image is not None:
-                st.markdown('<div class="feedback-section">', unsafe_allow_html=True)
-                st.markdown('<div class="feedback-header">🔄 Improve Your Image</div>', unsafe_allow_html=True)
-                
-                col1, col2 = st.columns([2, 1])
-                
-                with col1:
-                    st.markdown('<div class="image-display-card">', unsafe_allow_html=True)
-                    disp_img = downscale_image_for_display(st.session_state.generated_image, 640)
-                    st.image(disp_img, caption=f"Current Image (Iteration #{st.session_state.iteration_count})")
-                    st.markdown('</div>', unsafe_allow_html=True)
-                
-                with col2:
-                    st.markdown('<div class="feedback-input-card">', unsafe_allow_html=True)
-                    st.markdown('<div class="feedback-title">💡 Not satisfied with the result?</div>', unsafe_allow_html=True)
-                    st.markdown('<div class="feedback-subtitle">Describe what you\'d like to change or improve:</div>', unsafe_allow_html=True)
-                    
-                    # Style choice for feedback regeneration
-                    st.markdown('<div class="input-label">🎨 Style for Regeneration</div>', unsafe_allow_html=True)
-                    feedback_style_choice = st.selectbox(
-                        "Select style for regeneration:",
-                        ["E-commerce Product", "Real-world Lifestyle", "Creative Artistic"],
-                        key="feedback_style_choice",
-                        index=["E-commerce Product", "Real-world Lifestyle", "Creative Artistic"].index(st.session_state.get('current_style', 'E-commerce Product')) if 'current_style' in st.session_state else 0,
-                        label_visibility="collapsed"
-                    )
-                    
-                    # Style descriptions for feedback
-                    feedback_style_descriptions = {
-                        "E-commerce Product": "Clean, professional photos with studio lighting, neutral backgrounds, and commercial appeal - perfect for product catalogs and online retail.",
-                        "Real-world Lifestyle": "Natural, authentic images showing products in everyday use with natural lighting and relatable settings - ideal for lifestyle marketing.",
-                        "Creative Artistic": "Dramatic, artistic photos with creative lighting, artistic backgrounds, and artistic composition - great for creative campaigns and social media."
-                    }
-                    
-                    if feedback_style_choice in feedback_style_descriptions:
-                        # Create style badge for feedback
-                        feedback_style_class = {
-                            "E-commerce Product": "ecommerce",
-                            "Real-world Lifestyle": "lifestyle", 
-                            "Creative Artistic": "creative"
-                        }.get(feedback_style_choice, "ecommerce")
-                        
-                        st.markdown(f'<div class="style-badge {feedback_style_class}">🎨 {feedback_style_choice}</div>', unsafe_allow_html=True)
-                        st.info(f"💡 **{feedback_style_choice}**: {feedback_style_descriptions[feedback_style_choice]}")
-                    
-                    feedback = st.text_area(
-                        "Your feedback:",
-                        height=120,
-                        placeholder="e.g., Make it brighter, change the background to blue, add more detail...",
-                        key="image_feedback",
-                        label_visibility="collapsed"
-                    )
-                    
-                    if st.button("🔄 Regenerate with Feedback", type="secondary", key="regenerate_button"):
-                        if not feedback.strip():
-                            st.warning("Please provide some feedback to improve the image.")
-                        else:
-                            try:
-                                # Create enhanced prompt with feedback and style
-                                style_enhancements = {
-                                    "E-commerce Product": "Maintain clean, commercial photography style suitable for online retail with studio lighting and professional composition.",
-                                    "Real-world Lifestyle": "Keep the natural, everyday setting with natural lighting and authentic atmosphere. For food, plants, or small objects: maintain macro lens perspective with precise focusing and detailed textures.",
-                                    "Creative Artistic": "Maintain artistic, creative style with dramatic lighting and artistic composition."
-                                }
-                                
-                                style_enhancement = style_enhancements.get(feedback_style_choice, "")
-                                if style_enhancement:
-                                    feedback_prompt = f"{st.session_state.final_prompt}. IMPROVEMENT NEEDED: {feedback.strip()}. STYLE: {style_enhancement}"
-                                else:
-                                    feedback_prompt = f"{st.session_state.final_prompt}. IMPROVEMENT NEEDED: {feedback.strip()}"
-                                
-                                with st.spinner("Regenerating image with your feedback..."):
-                                    generation_params = {
-                                        "prompt": feedback_prompt,
-                                        "number_of_images": 1,
-                                        "add_watermark": False,
-                                    }
-                                    
-                                    if st.session_state.get('negative_prompt'):
-                                        generation_params["negative_prompt"] = st.session_state.negative_prompt
-                                    
-                                    response = imagen_model.generate_images(**generation_params)
-                                
-                                if response and hasattr(response, 'images') and response.images:
-                                    new_image = response.images[0]
-                                    st.session_state.generated_image = new_image._pil_image
-                                    st.session_state.final_prompt = feedback_prompt
-                                    st.session_state.iteration_count += 1
-                                    
-                                    st.success(f"✨ Image regenerated successfully! (Iteration #{st.session_state.iteration_count})")
-                                    st.rerun()
-                                else:
-                                    st.error("Failed to regenerate image. Please try again.")
-                                    
-                            except Exception as e:
-                                st.error(f"Error during regeneration: {str(e)}")
-                    
-                    st.markdown('</div>', unsafe_allow_html=True)
-                
-                # Reset button
-                if st.button("🗑️ Start Over", key="reset_button"):
-                    for key in ['generated_image', 'current_prompt', 'final_prompt', 'negative_prompt', 'iteration_count']:
-                        if key in st.session_state:
-                            st.session_state[key] = None if key == 'generated_image' else "" if key != 'iteration_count' else 0
-                    st.rerun()
-                
-                st.markdown('</div>', unsafe_allow_html=True)
-        
-        # --- VIDEO GENERATION TAB ---
+            render_image_tab(services)
         with tab2:
-            st.markdown('<div class="content-card">', unsafe_allow_html=True)
-            st.markdown('''
-            <div class="section-header">
-                <div class="icon">🎬</div>
-                <div>Video Generation</div>
-            </div>
-            <div class="section-description">Create stunning videos from text descriptions or animate existing images</div>
-            ''', unsafe_allow_html=True)
-            
-            # Source image selection
-            source_choice = st.radio(
-                "Source Image (optional):",
-                ["No image (prompt only)", "Use generated image", "Upload image"],
-                horizontal=True,
-                key="video_source_choice",
-            )
-
-            uploaded_video_image = None
-            image_bytes = None
-
-            if source_choice == "Use generated image":
-                if st.session_state.generated_image is None:
-                    st.warning("No generated image found. Please upload an image or generate one first.")
-                else:
-                    st.image(st.session_state.generated_image, caption="Source Image", width=300)
-                    img_byte_arr = BytesIO()
-                    st.session_state.generated_image.save(img_byte_arr, format='PNG')
-                    image_bytes = img_byte_arr.getvalue()
-            elif source_choice == "Upload image":
-                uploaded_video_image = st.file_uploader(
-                    "Upload an image for the video",
-                    type=["png", "jpg", "jpeg", "webp"],
-                    key="video_image_upload",
-                )
-                if uploaded_video_image is not None:
-                    st.image(uploaded_video_image, caption="Source Image", width=300)
-                    image_bytes = uploaded_video_image.getvalue()
-            else:
-                st.info("Using prompt only. No image will be provided to the video model.")
-
-            # Video prompt
-            st.markdown('<div class="input-group">', unsafe_allow_html=True)
-            st.markdown('<div class="input-label">🎬 Video Prompt</div>', unsafe_allow_html=True)
-            st.markdown('<div class="input-description">Describe the video motion and style you want to create</div>', unsafe_allow_html=True)
-            
-            video_prompt = st.text_area(
-                "Enter your video prompt:",
-                height=200,
-                placeholder="A smooth camera rotation around the product, highlighting its features with cinematic lighting...",
-                key="video_prompt_input",
-                label_visibility="collapsed"
-            )
-            st.markdown('</div>', unsafe_allow_html=True)
-            
-            if st.button("🎬 Generate Video", type="primary", key="generate_video_button"):
-                if not video_prompt.strip():
-                    st.warning("Please enter a video prompt describing the motion or action.")
-                else:
-                    try:
-                        with st.spinner("Generating video... This may take several minutes."):
-                            video_result = generate_video_from_image(image_bytes, video_prompt)
-
-                            if isinstance(video_result, str):
-                                try:
-                                    video_result = base64.b64decode(video_result)
-                                except Exception:
-                                    pass
-
-                            if isinstance(video_result, bytes) and video_result.startswith(b'AAAA'):
-                                try:
-                                    video_result = base64.b64decode(video_result)
-                                except Exception:
-                                    pass
-
-                            if isinstance(video_result, (bytes, bytearray)) and len(video_result) > 0:
-                                st.session_state.generated_video = video_result
-                                st.session_state.video_iteration_count = 1
-                                
-                                st.success("Video generated successfully!")
-                                
-                                try:
-                                    video_b64 = base64.b64encode(video_result).decode('utf-8')
-                                    video_html = f"""
-                                    <div style="margin: 20px 0;">
-                                        <video width="100%" height="auto" controls preload="metadata" style="border: 2px solid var(--primary-color); border-radius: var(--radius-lg);">
-                                            <source src="data:video/mp4;base64,{video_b64}" type="video/mp4">
-                                            Your browser does not support the video tag.
-                                        </video>
-                                        <p style="font-size: 12px; color: var(--text-secondary); margin-top: 5px;">
-                                            Video size: {len(video_result)} bytes | Format: MP4
-                                        </p>
-                                    </div>
-                                    """
-                                    st.markdown(video_html, unsafe_allow_html=True)
-                                except Exception as e1:
-                                    st.warning(f"Video display failed: {e1}")
-                                
-                                st.download_button(
-                                    label="💾 Download Video",
-                                    data=video_result,
-                                    file_name="generated_video.mp4",
-                                    mime="video/mp4",
-                                    key="download_generated_video"
-                                )
-                                
-                            else:
-                                st.error("Video generation did not return video bytes.")
-                    except Exception as e:
-                        st.error(f"An error occurred during video generation: {str(e)}")
-            
-            st.markdown('</div>', unsafe_allow_html=True)
-        
-        # --- FAVORITES TAB ---
+            render_video_tab()
         with tab3:
-            st.markdown('<div class="content-card">', unsafe_allow_html=True)
-            st.markdown('''
-            <div class="section-header">
-                <div class="icon">⭐</div>
-                <div>Your Favorite Images</div>
-            </div>
-            <div class="section-description">Manage and download your favorite generated images</div>
-            ''', unsafe_allow_html=True)
-            
-            if st.session_state.favorites:
-                st.markdown(f"**Saved Images ({len(st.session_state.favorites)})**")
-                
-                # Display favorites
-                for i, favorite in enumerate(st.session_state.favorites):
-                    st.markdown('<div class="favorite-item">', unsafe_allow_html=True)
-                    col1, col2 = st.columns([3, 1])
-                    
-                    with col1:
-                        st.image(favorite['image'], caption=f"Favorite #{i+1}", width=400)
-                    
-                    with col2:
-                        st.markdown(f"**Prompt:** {favorite['prompt'][:150]}...")
-                        
-                        favorite_style = favorite.get('style', 'E-commerce Product')
-                        favorite_style_class = {
-                            "E-commerce Product": "ecommerce",
-                            "Real-world Lifestyle": "lifestyle", 
-                            "Creative Artistic": "creative"
-                        }.get(favorite_style, "ecommerce")
-                        
-                        st.markdown(f'<div class="style-badge {favorite_style_class}">🎨 {favorite_style}</div>', unsafe_allow_html=True)
-                        
-                        st.markdown(f"**Date:** {favorite['date']}")
-                        st.markdown(f"**Iteration:** #{favorite['iteration']}")
-                        
-                        col_btn1, col_btn2 = st.columns(2)
-                        with col_btn1:
-                            if st.button(f"🗑️ Remove", key=f"remove_fav_{i}"):
-                                st.session_state.favorites.pop(i)
-                                st.rerun()
-                        
-                        with col_btn2:
-                            img_bytes = favorite['image_bytes']
-                            st.download_button(
-                                label="💾 Download",
-                                data=img_bytes,
-                                file_name=f"favorite_image_{i+1}.png",
-                                mime="image/png",
-                                key=f"download_fav_{i}"
-                            )
-                    
-                    st.markdown('</div>', unsafe_allow_html=True)
-                
-                if st.button("🗑️ Clear All Favorites", key="clear_all_favorites"):
-                    st.session_state.favorites = []
-                    st.rerun()
-                    
-            else:
-                st.markdown('''
-                <div class="no-content-message">
-                    <div class="no-content-icon">⭐</div>
-                    <div class="no-content-title">No Favorites Yet</div>
-                    <div class="no-content-description">Generate some images first, then add them to your favorites to see them here!</div>
-                </div>
-                ''', unsafe_allow_html=True)
-            
-            st.markdown('</div>', unsafe_allow_html=True)
-    
-        # --- GEMINI IMAGE GENERATION TAB ---
+            render_favorites_tab(favorites_owner)
         with tab4:
-            st.markdown('<div class="content-card">', unsafe_allow_html=True)
-            st.markdown('''
-            <div class="section-header">
-                <div class="icon">🧪</div>
-                <div>Experimental Gemini Image Generation</div>
-            </div>
-            <div class="section-description">Transform existing images using Gemini's experimental image generation capabilities</div>
-            ''', unsafe_allow_html=True)
-
-            col_g_left, col_g_right = st.columns([1, 2])
-
-            with col_g_left:
-                st.markdown('<div class="input-group">', unsafe_allow_html=True)
-                st.markdown('<div class="input-label">📁 Input Image</div>', unsafe_allow_html=True)
-                gemini_input_image = st.file_uploader(
-                    "Choose an image file:",
-                    type=["png", "jpg", "jpeg", "webp"],
-                    key="gemini_image_upload",
-                    label_visibility="collapsed"
-                )
-                if gemini_input_image is not None:
-                    st.image(gemini_input_image, caption="Input Image", width=300)
-                st.markdown('</div>', unsafe_allow_html=True)
-
-            with col_g_right:
-                st.markdown('<div class="input-group">', unsafe_allow_html=True)
-                st.markdown('<div class="input-label">✍️ Text Instruction</div>', unsafe_allow_html=True)
-                st.markdown('<div class="input-description">Instructions for transforming the image</div>', unsafe_allow_html=True)
-                gemini_text_prompt = st.text_area(
-                    "Enter instruction for image generation:",
-                    height=200,
-                    placeholder="please color this beautifully using red, green, blue",
-                    key="gemini_text_prompt",
-                    label_visibility="collapsed"
-                )
-                st.markdown('</div>', unsafe_allow_html=True)
-                
-                # Style Choice Section for Gemini
-                st.markdown('<div class="input-group">', unsafe_allow_html=True)
-                st.markdown('<div class="input-label">🎨 Generation Style</div>', unsafe_allow_html=True)
-                st.markdown('<div class="input-description">Choose the style for the image transformation</div>', unsafe_allow_html=True)
-                gemini_style_choice = st.selectbox(
-                    "Select image style:",
-                    ["E-commerce Product", "Real-world Lifestyle", "Creative Artistic"],
-                    key="gemini_style_choice",
-                    label_visibility="collapsed"
-                )
-                
-                # Style descriptions (reuse from Tab 1)
-                gemini_style_descriptions = {
-                    "E-commerce Product": "Clean, professional photos with studio lighting, neutral backgrounds, and commercial appeal - perfect for product catalogs and online retail.",
-                    "Real-world Lifestyle": "Natural, authentic images showing products in everyday use with natural lighting and relatable settings - ideal for lifestyle marketing.",
-                    "Creative Artistic": "Dramatic, artistic photos with creative lighting, artistic backgrounds, and artistic composition - great for creative campaigns and social media."
-                }
-                
-                if gemini_style_choice in gemini_style_descriptions:
-                    # Create style badge for Gemini
-                    gemini_style_class = {
-                        "E-commerce Product": "ecommerce",
-                        "Real-world Lifestyle": "lifestyle", 
-                        "Creative Artistic": "creative"
-                    }.get(gemini_style_choice, "ecommerce")
-                    
-                    st.markdown(f'<div class="style-badge {gemini_style_class}">🎨 {gemini_style_choice}</div>', unsafe_allow_html=True)
-                    st.info(f"💡 **{gemini_style_choice}**: {gemini_style_descriptions[gemini_style_choice]}")
-                st.markdown('</div>', unsafe_allow_html=True)
-                
-                # Negative Prompt (optional)
-                st.markdown('<div class="input-group">', unsafe_allow_html=True)
-                st.markdown('<div class="input-label">🚫 Negative Prompt</div>', unsafe_allow_html=True)
-                st.markdown('<div class="input-description">Specify what you DON\'T want in the image</div>', unsafe_allow_html=True)
-                gemini_negative_prompt = st.text_area(
-                    "Negative prompt:",
-                    height=60,
-                    placeholder="blurry, distorted, low quality, text overlay, watermarks, multiple objects, cluttered background...",
-                    key="gemini_negative_prompt",
-                    label_visibility="collapsed"
-                )
-                st.markdown('</div>', unsafe_allow_html=True)
-                
-                gemini_generate_clicked = st.button("🧪 Generate with Gemini", type="primary", key="gemini_generate_btn")
-
-            if gemini_generate_clicked:
-                if gemini_input_image is None:
-                    st.warning("Please upload an image to transform.")
-                else:
-                    try:
-                        # Prepare contents for the Gemini image generation model
-                        if client is None:
-                            if os.environ.get("GOOGLE_APPLICATION_CREDENTIALS") != SERVICE_ACCOUNT_PATH:
-                                os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = SERVICE_ACCOUNT_PATH
-                            if os.environ.get("GOOGLE_CLOUD_PROJECT") != PROJECT_ID:
-                                os.environ["GOOGLE_CLOUD_PROJECT"] = PROJECT_ID
-                            client = genai.Client(vertexai=True, project=PROJECT_ID, location=LOCATION)
-
-                        image_bytes = gemini_input_image.getvalue()
-                        mime_type = gemini_input_image.type
-
-                        # Use only the experimental Gemini image-capable model
-                        model_candidates = ["gemini-2.0-flash-preview-image-generation"]
-
-                        # Style-specific system prompts for Gemini image generation
-                        gemini_style_prompts = {
-                            "E-commerce Product": """Transform this image following e-commerce product photography standards. Create a clean, professional product image with: studio lighting (soft key light with subtle rim lighting), neutral or white background, sharp focus on product details, minimal clutter, commercial composition suitable for online retail catalogs. Maintain all original product details exactly while enhancing the professional presentation. Focus on clean, commercial photography suitable for product sales.""",
-                            
-                            "Real-world Lifestyle": """Transform this image to show the product in a natural, everyday lifestyle setting. Create an authentic environment that demonstrates how people would actually use this product in real life. Use natural lighting (soft window light or realistic indoor/outdoor lighting), realistic props and furniture, warm and inviting atmosphere. Show the product integrated naturally into daily life scenarios like homes, offices, or outdoor settings. Keep it authentic and relatable.""",
-                            
-                            "Creative Artistic": """Transform this image with artistic and creative vision. Apply dramatic lighting effects, creative composition, artistic backgrounds, and bold visual elements. Use creative techniques like dramatic shadows, colored lighting, artistic angles, and creative visual effects. Make the product the focal point while creating an artistic, memorable image that stands out. Emphasize creativity, drama, and artistic appeal."""
-                        }
-                        
-                        # Get the style-specific system prompt
-                        style_system_prompt = gemini_style_prompts.get(gemini_style_choice, gemini_style_prompts["E-commerce Product"])
-                        
-                        # Build final text instruction with style guidance, user prompt, and negative prompt
-                        _text_instruction = f"{style_system_prompt}\n\n"
-                        
-                        if gemini_text_prompt.strip():
-                            _text_instruction += f"Additional specific instructions: {gemini_text_prompt.strip()}\n\n"
-                        
-                        if gemini_negative_prompt and gemini_negative_prompt.strip():
-                            _text_instruction += f"Avoid these elements: {gemini_negative_prompt.strip()}\n\n"
-                            
-                        _text_instruction += "Please prioritize high visual fidelity, clean edges, accurate colors, high resolution, minimal artifacts, and photo-realistic rendering while following the specified style requirements."
-                        
-                        # Show the enhanced prompt to user
-                        st.info(f"🎨 **Style-Enhanced Prompt ({gemini_style_choice})**: {_text_instruction}")
-
-                        contents = [
-                            types.Content(
-                                role="user",
-                                parts=[
-                                    types.Part(
-                                        inline_data=types.Blob(
-                                            mime_type=mime_type,
-                                            data=image_bytes,
-                                        )
-                                    ),
-                                    types.Part.from_text(text=_text_instruction),
-                                ],
-                            )
-                        ]
-                        
-                        generate_content_config = types.GenerateContentConfig(
-                            temperature=0.3,
-                            top_p=0.95,
-                            top_k=40,
-                            max_output_tokens=8192,
-                            response_modalities=["image", "text"],
-                            safety_settings=[
-                                types.SafetySetting(
-                                    category="HARM_CATEGORY_CIVIC_INTEGRITY",
-                                    threshold="OFF",
-                                ),
-                            ],
-                        )
-
-                        output_image_bytes = None
-                        output_image_mime = None
-                        text_chunks = []
-
-                        with st.spinner("Generating image with Gemini..."):
-                            resp = None
-                            selected_model = None
-                            last_err = None
-                            for _model_name in model_candidates:
-                                try:
-                                    resp = client.models.generate_content(
-                                        model=_model_name,
-                                        contents=contents,
-                                        config=generate_content_config,
-                                    )
-                                    selected_model = _model_name
-                                    break
-                                except Exception as _e:
-                                    # Try the next candidate if model not found in this region/project
-                                    if "NOT_FOUND" in str(_e) or "not found" in str(_e).lower():
-                                        last_err = _e
-                                        continue
-                                    raise
-                            if resp is None:
-                                raise last_err or Exception("No suitable Gemini image-capable model found in this region.")
-
-                        try:
-                            if resp and getattr(resp, "candidates", None):
-                                for candidate in resp.candidates:
-                                    content = getattr(candidate, "content", None)
-                                    if not content:
-                                        continue
-                                    for part in getattr(content, "parts", []):
-                                        if hasattr(part, "inline_data") and part.inline_data and getattr(part.inline_data, "data", None):
-                                            output_image_bytes = part.inline_data.data
-                                            output_image_mime = getattr(part.inline_data, "mime_type", None)
-                                        if hasattr(part, "text") and part.text:
-                                            text_chunks.append(part.text)
-                        except Exception:
-                            pass
-
-                        if output_image_bytes:
-                            import io as _io
-                            import base64 as _b64
-                            display_bytes = output_image_bytes
-                            valid_image = False
-                            try:
-                                from PIL import Image as _PILImage
-                                _PILImage.open(_io.BytesIO(display_bytes)).verify()
-                                valid_image = True
-                            except Exception:
-                                try:
-                                    decoded = _b64.b64decode(display_bytes)
-                                    from PIL import Image as _PILImage
-                                    _PILImage.open(_io.BytesIO(decoded)).verify()
-                                    display_bytes = decoded
-                                    valid_image = True
-                                except Exception:
-                                    valid_image = False
-
-                            if valid_image:
-                                st.success("✅ Image generated successfully!")
-                                # Store generated image in session state for feedback functionality
-                                from PIL import Image as _PILImage
-                                st.session_state.gemini_generated_image = _PILImage.open(_io.BytesIO(display_bytes))
-                                st.session_state.gemini_image_bytes = display_bytes
-                                st.session_state.gemini_iteration_count = st.session_state.get('gemini_iteration_count', 0) + 1
-                                st.session_state.gemini_current_style = gemini_style_choice
-                                st.session_state.gemini_original_prompt = _text_instruction
-                                
-                                st.image(_io.BytesIO(display_bytes), caption="Gemini Generated Image", use_container_width=True)
-                                st.download_button(
-                                    label="💾 Download Image",
-                                    data=display_bytes,
-                                    file_name="gemini_output.jpg" if (output_image_mime or "").endswith("jpeg") or (output_image_mime or "").endswith("jpg") else "gemini_output.png",
-                                    mime=output_image_mime or "image/jpeg",
-                                    key="download_gemini_image",
-                                )
-                                
-                                # Add to Favorites button for main generation
-                                if st.button("⭐ Add to Favorites", key="add_to_favorites_gemini_main"):
-                                    if 'favorites' not in st.session_state:
-                                        st.session_state.favorites = []
-                                    
-                                    # Convert PIL image to bytes for storage
-                                    img_byte_arr = BytesIO()
-                                    st.session_state.gemini_generated_image.save(img_byte_arr, format='PNG')
-                                    img_bytes = img_byte_arr.getvalue()
-                                    
-                                    st.session_state.favorites.append({
-                                        'image': st.session_state.gemini_generated_image.copy(),
-                                        'image_bytes': img_bytes,
-                                        'prompt': f"Gemini: {gemini_text_prompt if gemini_text_prompt else 'Image transformation'}",
-                                        'style': gemini_style_choice,
-                                        'date': time.strftime("%Y-%m-%d %H:%M"),
-                                        'iteration': st.session_state.gemini_iteration_count
-                                    })
-                                    st.success("Added to favorites! ⭐")
-                                    st.rerun()
-                                
-                                if text_chunks:
-                                    st.info("\n".join(text_chunks[-3:]))
-                            else:
-                                st.warning("Received bytes could not be decoded as an image. Showing text response if available.")
-                                if text_chunks:
-                                    st.code("\n".join(text_chunks), language="markdown")
-                                else:
-                                    st.error("Gemini did not return a decodable image or text. Try adjusting your prompt.")
-                        else:
-                            if text_chunks:
-                                st.warning("No image bytes found in the stream. Showing text response:")
-                                st.code("\n".join(text_chunks), language="markdown")
-                            else:
-                                st.error("Gemini did not return an image or text. Try adjusting your prompt.")
-                    except Exception as e:
-                        st.error(f"Gemini image generation failed: {e}")
-            
-            # --- Gemini Feedback Section ---
-            if st.session_state.get('gemini_generated_image') is not None:
-                st.markdown('<div class="feedback-section">', unsafe_allow_html=True)
-                st.markdown('<div class="feedback-header">🔄 Improve Your Gemini Image</div>', unsafe_allow_html=True)
-                
-                col1, col2 = st.columns([2, 1])
-                
-                with col1:
-                    st.markdown('<div class="image-display-card">', unsafe_allow_html=True)
-                    disp_img = downscale_image_for_display(st.session_state.gemini_generated_image, 640)
-                    st.image(disp_img, caption=f"Current Gemini Image (Iteration #{st.session_state.get('gemini_iteration_count', 1)})")
-                    
-                    # Add to Favorites button for feedback section
-                    col_fav_fb1, col_fav_fb2 = st.columns([1, 1])
-                    with col_fav_fb1:
-                        if st.button("⭐ Add to Favorites", key="add_to_favorites_gemini_feedback"):
-                            if 'favorites' not in st.session_state:
-                                st.session_state.favorites = []
-                            
-                            # Convert PIL image to bytes for storage
-                            img_byte_arr = BytesIO()
-                            st.session_state.gemini_generated_image.save(img_byte_arr, format='PNG')
-                            img_bytes = img_byte_arr.getvalue()
-                            
-                            st.session_state.favorites.append({
-                                'image': st.session_state.gemini_generated_image.copy(),
-                                'image_bytes': img_bytes,
-                                'prompt': f"Gemini Feedback: Iteration #{st.session_state.get('gemini_iteration_count', 1)}",
-                                'style': st.session_state.get('gemini_current_style', 'E-commerce Product'),
-                                'date': time.strftime("%Y-%m-%d %H:%M"),
-                                'iteration': st.session_state.get('gemini_iteration_count', 1)
-                            })
-                            st.success("Added to favorites! ⭐")
-                            st.rerun()
-                    
-                    with col_fav_fb2:
-                        # Download button for feedback section
-                        if st.session_state.get('gemini_image_bytes'):
-                            st.download_button(
-                                label="💾 Download",
-                                data=st.session_state.gemini_image_bytes,
-                                file_name=f"gemini_feedback_iteration_{st.session_state.get('gemini_iteration_count', 1)}.jpg",
-                                mime="image/jpeg",
-                                key="download_gemini_feedback"
-                            )
-                    
-                    st.markdown('</div>', unsafe_allow_html=True)
-                
-                with col2:
-                    st.markdown('<div class="feedback-input-card">', unsafe_allow_html=True)
-                    st.markdown('<div class="feedback-title">💡 Not satisfied with the result?</div>', unsafe_allow_html=True)
-                    st.markdown('<div class="feedback-subtitle">Describe what you\'d like to change or improve:</div>', unsafe_allow_html=True)
-                    
-                    # Style choice for feedback regeneration
-                    st.markdown('<div class="input-label">🎨 Style for Regeneration</div>', unsafe_allow_html=True)
-                    gemini_feedback_style_choice = st.selectbox(
-                        "Select style for regeneration:",
-                        ["E-commerce Product", "Real-world Lifestyle", "Creative Artistic"],
-                        key="gemini_feedback_style_choice",
-                        index=["E-commerce Product", "Real-world Lifestyle", "Creative Artistic"].index(st.session_state.get('gemini_current_style', 'E-commerce Product')) if 'gemini_current_style' in st.session_state else 0,
-                        label_visibility="collapsed"
-                    )
-                    
-                    # Style descriptions for feedback
-                    gemini_feedback_style_descriptions = {
-                        "E-commerce Product": "Clean, professional photos with studio lighting, neutral backgrounds, and commercial appeal - perfect for product catalogs and online retail.",
-                        "Real-world Lifestyle": "Natural, authentic images showing products in everyday use with natural lighting and relatable settings - ideal for lifestyle marketing.",
-                        "Creative Artistic": "Dramatic, artistic photos with creative lighting, artistic backgrounds, and artistic composition - great for creative campaigns and social media."
-                    }
-                    
-                    if gemini_feedback_style_choice in gemini_feedback_style_descriptions:
-                        # Create style badge for feedback
-                        gemini_feedback_style_class = {
-                            "E-commerce Product": "ecommerce",
-                            "Real-world Lifestyle": "lifestyle", 
-                            "Creative Artistic": "creative"
-                        }.get(gemini_feedback_style_choice, "ecommerce")
-                        
-                        st.markdown(f'<div class="style-badge {gemini_feedback_style_class}">🎨 {gemini_feedback_style_choice}</div>', unsafe_allow_html=True)
-                        st.info(f"💡 **{gemini_feedback_style_choice}**: {gemini_feedback_style_descriptions[gemini_feedback_style_choice]}")
-                    
-                    gemini_feedback = st.text_area(
-                        "Your feedback:",
-                        height=120,
-                        placeholder="e.g., Make it brighter, change the background to blue, add more detail, use different lighting...",
-                        key="gemini_feedback",
-                        label_visibility="collapsed"
-                    )
-                
-                    if st.button("🔄 Regenerate with Feedback", type="secondary", key="regenerate_gemini_button"):
-                        if not gemini_feedback.strip():
-                            st.warning("Please provide some feedback to improve the image.")
-                        else:
-                            st.info("🧪 Gemini feedback regeneration requires the original input image to be available.")
-                    
-                    st.markdown('</div>', unsafe_allow_html=True)
-                
-                st.markdown('</div>', unsafe_allow_html=True)
-                
-                # Start Over button for Gemini
-                if st.button("🗑️ Start Over (Gemini)", key="reset_gemini_button"):
-                    for key in ['gemini_generated_image', 'gemini_image_bytes', 'gemini_iteration_count', 'gemini_current_style', 'gemini_original_prompt']:
-                        if key in st.session_state:
-                            del st.session_state[key]
-                    st.rerun()
-            
-            st.markdown('</div>', unsafe_allow_html=True)
+            render_gemini_tab(services)
     
     else:
         st.error("Application cannot start due to authentication failure.")
 
+    if SHOW_DIAGNOSTICS:
+        render_diagnostics()
+
     # Footer
     st.markdown("---")
     st.markdown("Powered by [Google Vertex AI](https://cloud.google.com/vertex-ai) and [Streamlit](https://streamlit.io).")
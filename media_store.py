@@ -0,0 +1,135 @@
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+import time
+import uuid
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+
+class MediaStore:
+    """Managed directory of generated media files with a retention policy.
+
+    Generated videos are written (or downloaded) here once and then served by
+    path, so neither session state nor the websocket carries the raw bytes.
+    Files older than ``retention_seconds`` are deleted, and the oldest files go
+    first whenever the directory grows past ``max_bytes``.
+
+    Writes only scan the directory at most once per ``gc_interval_seconds``,
+    or sooner once a tenth of ``max_bytes`` has been written since the last
+    scan. Images are saved by content (:meth:`save_content`), so saving the
+    same image again reuses its file instead of writing a copy.
+    """
+
+    def __init__(self, directory, retention_seconds=24 * 3600, max_bytes=2 * 1024 ** 3, gc_interval_seconds=60.0):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.retention_seconds = retention_seconds
+        self.max_bytes = max_bytes
+        self.gc_interval_seconds = gc_interval_seconds
+        self._gc_lock = threading.Lock()
+        self._written_lock = threading.Lock()
+        self._last_gc = 0.0
+        self._written_since_gc = 0
+        self.collect_garbage()
+
+    def _new_path(self, suffix) -> Path:
+        return self.directory / f"{time.strftime('%Y%m%d')}_{uuid.uuid4().hex}{suffix}"
+
+    def _write(self, path, data):
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".part")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        self._after_write(len(data))
+
+    def _after_write(self, size):
+        with self._written_lock:
+            self._written_since_gc += size
+            due = (time.monotonic() - self._last_gc >= self.gc_interval_seconds
+                   or self._written_since_gc * 10 >= self.max_bytes)
+        if due:
+            self.collect_garbage()
+
+    def save_bytes(self, data, suffix=".mp4") -> str:
+        """Write ``data`` to a new managed file and return its path."""
+        path = self._new_path(suffix)
+        self._write(path, data)
+        return str(path)
+
+    def save_content(self, data, suffix, digest=None) -> str:
+        """Return the path of the managed file holding ``data``, writing it only if it is not there yet.
+
+        Reusing a file renews its retention. ``digest`` is the SHA-256 hex of
+        ``data`` when the caller already has it.
+        """
+        path = self.directory / f"{digest or hashlib.sha256(data).hexdigest()}{suffix}"
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            self._write(path, data)
+        return str(path)
+
+    def fetch_uri(self, uri, suffix=".mp4") -> str:
+        """Stream a ``gs://`` object straight to a managed file and return its path."""
+        if not uri.startswith("gs://"):
+            raise ValueError(f"Unsupported media URI: {uri}")
+        from google.cloud import storage
+
+        bucket_name, _, blob_name = uri[len("gs://"):].partition("/")
+        path = self._new_path(suffix)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".part")
+        os.close(fd)
+        try:
+            storage.Client().bucket(bucket_name).blob(blob_name).download_to_filename(tmp_path)
+            os.replace(tmp_path, path)
+        except Exception:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            raise
+        self._after_write(path.stat().st_size)
+        return str(path)
+
+    def exists(self, path) -> bool:
+        return bool(path) and Path(path).is_file()
+
+    def collect_garbage(self) -> int:
+        """Apply the retention policy; returns the number of files removed."""
+        if not self._gc_lock.acquire(blocking=False):
+            return 0
+        with self._written_lock:
+            self._last_gc = time.monotonic()
+            self._written_since_gc = 0
+        try:
+            files = []
+            for path in self.directory.iterdir():
+                try:
+                    stat = path.stat()
+                except OSError:
+                    continue
+                if path.is_file():
+                    files.append((stat.st_mtime, stat.st_size, path))
+            files.sort()
+            cutoff = time.time() - self.retention_seconds
+            total = sum(size for _, size, _ in files)
+            removed = 0
+            for mtime, size, path in files:
+                # Skip in-progress writes unless they are stale leftovers
+                if path.suffix == ".part" and mtime >= cutoff:
+                    continue
+                if mtime >= cutoff and total <= self.max_bytes:
+                    break
+                try:
+                    path.unlink()
+                    removed += 1
+                    total -= size
+                except OSError as e:
+                    logger.warning("Could not remove expired media %s: %s", path, e)
+            return removed
+        finally:
+            self._gc_lock.release()
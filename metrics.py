@@ -0,0 +1,213 @@
+import json
+import logging
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0)
+METRIC_PREFIX = "imageai"
+
+_current_trace = ContextVar("imageai_trace", default=None)
+
+
+class Histogram:
+    """Cumulative-bucket latency histogram in the Prometheus style."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for idx, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[idx] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.total += value
+        self.count += 1
+
+    def quantile(self, q) -> float:
+        """Upper bucket bound containing quantile ``q`` (an estimate, like histogram_quantile)."""
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        for idx, bound in enumerate(self.buckets):
+            seen += self.counts[idx]
+            if seen >= target:
+                return bound
+        return float("inf")
+
+
+class Trace:
+    """Per-request stage timings, shown in the diagnostics panel."""
+
+    def __init__(self, name):
+        self.trace_id = uuid.uuid4().hex[:12]
+        self.name = name
+        self.started_at = time.time()
+        self.stages = []
+
+    def record(self, stage_name, seconds, error):
+        self.stages.append({"stage": stage_name, "seconds": round(seconds, 4), "error": error})
+
+    @property
+    def total_seconds(self) -> float:
+        return sum(entry["seconds"] for entry in self.stages)
+
+
+class JsonlSink:
+    """Appends every stage observation to a local JSONL file."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def __call__(self, event):
+        line = json.dumps(event, ensure_ascii=False) + "\n"
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(line)
+
+
+class MetricsRegistry:
+    """Process-wide stage histograms, error counts and plain counters."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._errors = {}
+        self._counters = {}
+        self._sinks = []
+
+    def add_sink(self, sink):
+        self._sinks.append(sink)
+
+    def observe(self, stage_name, seconds, error=False, trace_id=None):
+        with self._lock:
+            histogram = self._histograms.get(stage_name)
+            if histogram is None:
+                histogram = self._histograms[stage_name] = Histogram(self.buckets)
+            histogram.observe(seconds)
+            if error:
+                self._errors[stage_name] = self._errors.get(stage_name, 0) + 1
+        event = {"ts": time.time(), "stage": stage_name, "seconds": round(seconds, 6), "error": error}
+        if trace_id:
+            event["trace_id"] = trace_id
+        for sink in self._sinks:
+            try:
+                sink(event)
+            except Exception as e:
+                logger.warning("Metrics sink failed: %s", e)
+
+    def increment(self, name, value=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def snapshot(self) -> dict:
+        """Per-stage count, error rate, mean and p50/p95/p99 estimates."""
+        with self._lock:
+            stages = {}
+            for stage_name, histogram in sorted(self._histograms.items()):
+                errors = self._errors.get(stage_name, 0)
+                stages[stage_name] = {
+                    "count": histogram.count,
+                    "errors": errors,
+                    "error_rate": errors / histogram.count if histogram.count else 0.0,
+                    "mean_s": histogram.total / histogram.count if histogram.count else 0.0,
+                    "p50_s": histogram.quantile(0.50),
+                    "p95_s": histogram.quantile(0.95),
+                    "p99_s": histogram.quantile(0.99),
+                }
+            return {"stages": stages, "counters": dict(self._counters)}
+
+    def render_prometheus(self) -> str:
+        """Render all metrics in the Prometheus text exposition format."""
+        name = f"{METRIC_PREFIX}_stage_duration_seconds"
+        lines = [f"# HELP {name} Time spent in each generation stage.", f"# TYPE {name} histogram"]
+        with self._lock:
+            for stage_name, histogram in sorted(self._histograms.items()):
+                cumulative = 0
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{{stage="{stage_name}",le="{bound}"}} {cumulative}')
+                lines.append(f'{name}_bucket{{stage="{stage_name}",le="+Inf"}} {histogram.count}')
+                lines.append(f'{name}_sum{{stage="{stage_name}"}} {histogram.total}')
+                lines.append(f'{name}_count{{stage="{stage_name}"}} {histogram.count}')
+            errors = f"{METRIC_PREFIX}_stage_errors_total"
+            lines += [f"# HELP {errors} Failed executions of each stage.", f"# TYPE {errors} counter"]
+            for stage_name in sorted(self._histograms):
+                lines.append(f'{errors}{{stage="{stage_name}"}} {self._errors.get(stage_name, 0)}')
+            for counter_name, value in sorted(self._counters.items()):
+                metric = f"{METRIC_PREFIX}_{counter_name}_total"
+                lines += [f"# TYPE {metric} counter", f"{metric} {value}"]
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+
+@contextmanager
+def stage(stage_name, registry=None):
+    """Time a block as ``stage_name`` and record it to the registry and the current trace."""
+    registry = registry or REGISTRY
+    trace = _current_trace.get()
+    started = time.perf_counter()
+    error = False
+    try:
+        yield
+    except Exception:
+        error = True
+        raise
+    finally:
+        seconds = time.perf_counter() - started
+        registry.observe(stage_name, seconds, error, trace.trace_id if trace else None)
+        if trace is not None:
+            trace.record(stage_name, seconds, error)
+
+
+def start_http_server(port, host="127.0.0.1", registry=None):
+    """Serve ``/metrics`` in the Prometheus text format from a daemon thread."""
+    registry = registry or REGISTRY
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.render_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    try:
+        server = ThreadingHTTPServer((host, port), MetricsHandler)
+    except OSError as e:
+        logger.warning("Metrics endpoint not started on %s:%s: %s", host, port, e)
+        return None
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
+
+
+def start_trace(name):
+    """Begin a new trace for the rest of the current context; ``None`` stops tracing.
+
+    Streamlit reruns the script on the same thread, so the app calls this at the
+    top of every run to drop the previous request's trace.
+    """
+    trace = Trace(name) if name else None
+    _current_trace.set(trace)
+    return trace
@@ -0,0 +1,172 @@
+import base64
+import binascii
+import struct
+from dataclasses import dataclass
+from typing import Optional
+
+# --- Formats ---
+KIND_IMAGE = "image"
+KIND_VIDEO = "video"
+MIME_KINDS = {
+    "image/png": KIND_IMAGE,
+    "image/jpeg": KIND_IMAGE,
+    "image/webp": KIND_IMAGE,
+    "image/gif": KIND_IMAGE,
+    "video/mp4": KIND_VIDEO,
+}
+# Enough base64 characters to decode every signature checked by sniff_mime
+BASE64_HEAD_CHARS = 24
+JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+JPEG_STANDALONE_MARKERS = {0x01, 0xD8} | set(range(0xD0, 0xD8))
+
+
+class InvalidPayload(ValueError):
+    """Model output that is not a recognizable, well-formed image or video."""
+
+
+@dataclass(frozen=True)
+class Payload:
+    """Decoded model output: raw bytes plus what the header says they are."""
+    data: bytes
+    mime_type: str
+    width: Optional[int] = None
+    height: Optional[int] = None
+    was_base64: bool = False
+
+    @property
+    def kind(self) -> str:
+        return MIME_KINDS[self.mime_type]
+
+
+def sniff_mime(data) -> Optional[str]:
+    """Identify PNG/JPEG/WebP/GIF/MP4 bytes from their magic numbers, or None."""
+    header = bytes(data[:12])
+    if header.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if header.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if header[:4] == b"RIFF" and header[8:12] == b"WEBP":
+        return "image/webp"
+    if header[:6] in (b"GIF87a", b"GIF89a"):
+        return "image/gif"
+    if header[4:8] == b"ftyp":
+        return "video/mp4"
+    return None
+
+
+def _sniff_base64(data) -> Optional[str]:
+    # Decode only the first few characters; the full decode happens once, after a match
+    head = bytes(data[:BASE64_HEAD_CHARS * 2]).translate(None, b" \t\r\n")[:BASE64_HEAD_CHARS]
+    if len(head) < BASE64_HEAD_CHARS:
+        return None
+    try:
+        return sniff_mime(base64.b64decode(head, validate=True))
+    except (binascii.Error, ValueError):
+        return None
+
+
+# --- Header Validation ---
+def _png_size(view):
+    if len(view) < 33 or bytes(view[12:16]) != b"IHDR" or struct.unpack(">I", view[8:12])[0] != 13:
+        raise InvalidPayload("PNG is missing its IHDR header")
+    return struct.unpack(">II", view[16:24])
+
+
+def _jpeg_size(view):
+    pos, end = 2, len(view)
+    while pos + 4 <= end:
+        if view[pos] != 0xFF:
+            raise InvalidPayload("JPEG segment does not start with a marker")
+        marker = view[pos + 1]
+        if marker == 0xFF:
+            pos += 1  # fill byte
+            continue
+        if marker in JPEG_STANDALONE_MARKERS:
+            pos += 2
+            continue
+        if marker == 0xDA:
+            raise InvalidPayload("JPEG image data starts before the frame header")
+        length = struct.unpack(">H", view[pos + 2:pos + 4])[0]
+        if marker in JPEG_SOF_MARKERS:
+            if pos + 9 > end:
+                break
+            height, width = struct.unpack(">HH", view[pos + 5:pos + 9])
+            return width, height
+        pos += 2 + length
+    raise InvalidPayload("JPEG is truncated before its frame header")
+
+
+def _webp_size(view):
+    if len(view) < 30:
+        raise InvalidPayload("WebP header is truncated")
+    if struct.unpack("<I", view[4:8])[0] + 8 > len(view):
+        raise InvalidPayload("WebP is shorter than its RIFF header says")
+    chunk = bytes(view[12:16])
+    if chunk == b"VP8X":
+        return 1 + int.from_bytes(view[24:27], "little"), 1 + int.from_bytes(view[27:30], "little")
+    if chunk == b"VP8 ":
+        if bytes(view[23:26]) != b"\x9d\x01\x2a":
+            raise InvalidPayload("WebP VP8 frame has a bad start code")
+        width, height = struct.unpack("<HH", view[26:30])
+        return width & 0x3FFF, height & 0x3FFF
+    if chunk == b"VP8L":
+        if view[20] != 0x2F:
+            raise InvalidPayload("WebP VP8L frame has a bad signature")
+        bits = int.from_bytes(view[21:25], "little")
+        return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+    raise InvalidPayload(f"Unknown WebP chunk {chunk!r}")
+
+
+def _gif_size(view):
+    if len(view) < 10:
+        raise InvalidPayload("GIF header is truncated")
+    return struct.unpack("<HH", view[6:10])
+
+
+def _mp4_size(view):
+    box_size = struct.unpack(">I", view[0:4])[0]
+    if box_size not in (0, 1) and (box_size < 8 or box_size > len(view)):
+        raise InvalidPayload("MP4 ftyp box has an invalid size")
+    return None, None
+
+
+VALIDATORS = {
+    "image/png": _png_size,
+    "image/jpeg": _jpeg_size,
+    "image/webp": _webp_size,
+    "image/gif": _gif_size,
+    "video/mp4": _mp4_size,
+}
+
+
+def decode_payload(payload, mime_type=None, kinds=(KIND_IMAGE, KIND_VIDEO)) -> Payload:
+    """Identify, unwrap and header-check a model payload in one pass.
+
+    Accepts raw bytes or base64 (bytes or str) of PNG, JPEG, WebP, GIF or MP4.
+    The format comes from the magic bytes; ``mime_type`` as declared by the
+    API is only used in error messages. Base64 is recognized by decoding a
+    short prefix, so the full payload is base64-decoded at most once and only
+    when it really holds media. Validation reads the container header (for
+    images, the dimensions) without decoding any pixels.
+
+    Raises :class:`InvalidPayload` for anything else, or for a format whose
+    kind is not in ``kinds``.
+    """
+    if isinstance(payload, str):
+        payload = payload.encode("ascii", "ignore")
+    data = payload if isinstance(payload, bytes) else bytes(payload)
+    sniffed = sniff_mime(data)
+    was_base64 = False
+    if sniffed is None and _sniff_base64(data) is not None:
+        data = base64.b64decode(data)
+        sniffed = sniff_mime(data)
+        was_base64 = True
+    if sniffed is None:
+        raise InvalidPayload(f"Unrecognized {mime_type or 'model'} payload ({len(data)} bytes); "
+                             "expected PNG, JPEG, WebP, GIF or MP4")
+    if MIME_KINDS[sniffed] not in kinds:
+        raise InvalidPayload(f"Expected {' or '.join(kinds)} but got {sniffed}")
+    width, height = VALIDATORS[sniffed](memoryview(data))
+    if width is not None and (width <= 0 or height <= 0):
+        raise InvalidPayload(f"{sniffed} header has an empty size {width}x{height}")
+    return Payload(data, sniffed, width, height, was_base64)
@@ -0,0 +1,119 @@
+import itertools
+import math
+import threading
+
+import numpy as np
+from PIL import Image
+
+HASH_SIZE = 8
+PHASH_FACTOR = 4
+
+
+def _grayscale(image, width, height) -> np.ndarray:
+    small = image.convert("L").resize((width, height), Image.BILINEAR)
+    return np.asarray(small, dtype=np.float32)
+
+
+def _to_int(bits: np.ndarray) -> int:
+    return int.from_bytes(np.packbits(bits.ravel()).tobytes(), "big")
+
+
+def _dct_matrix(n) -> np.ndarray:
+    k = np.arange(n)[:, None]
+    x = np.arange(n)[None, :]
+    matrix = np.cos(math.pi * (2 * x + 1) * k / (2 * n)) * math.sqrt(2.0 / n)
+    matrix[0] /= math.sqrt(2.0)
+    return matrix.astype(np.float32)
+
+
+_DCT = _dct_matrix(HASH_SIZE * PHASH_FACTOR)
+
+
+def difference_hash(image) -> int:
+    """dHash: sign of the horizontal gradient of a 9x8 thumbnail."""
+    pixels = _grayscale(image, HASH_SIZE + 1, HASH_SIZE)
+    return _to_int(pixels[:, 1:] > pixels[:, :-1])
+
+
+def perceptual_hash(image) -> int:
+    """pHash: low-frequency 8x8 block of a 32x32 DCT thresholded at its median."""
+    pixels = _grayscale(image, HASH_SIZE * PHASH_FACTOR, HASH_SIZE * PHASH_FACTOR)
+    low = (_DCT @ pixels @ _DCT.T)[:HASH_SIZE, :HASH_SIZE]
+    # The DC term only reflects overall brightness
+    return _to_int(low > np.median(low.ravel()[1:]))
+
+
+def hamming(a, b) -> int:
+    return bin(a ^ b).count("1")
+
+
+class HammingIndex:
+    """Multi-index hashing over 64-bit hashes for Hamming-radius queries.
+
+    Each hash is split into ``chunks`` 16-bit substrings with one dict per
+    substring. Two hashes within distance ``r`` must agree to within
+    ``r // chunks`` bits on at least one substring, so a query only enumerates
+    those few nearby substring values and verifies the handful of candidates
+    they point to instead of scanning every stored hash.
+    """
+
+    def __init__(self, chunks=4, bits=64):
+        self.chunks = chunks
+        self.chunk_bits = bits // chunks
+        self._mask = (1 << self.chunk_bits) - 1
+        self._tables = [{} for _ in range(chunks)]
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._values)
+
+    def _split(self, value):
+        return [(value >> (idx * self.chunk_bits)) & self._mask for idx in range(self.chunks)]
+
+    def _neighbours(self, chunk, radius):
+        keys = [chunk]
+        for flips in range(1, radius + 1):
+            for positions in itertools.combinations(range(self.chunk_bits), flips):
+                key = chunk
+                for position in positions:
+                    key ^= 1 << position
+                keys.append(key)
+        return keys
+
+    def add(self, value, item_id):
+        with self._lock:
+            if item_id in self._values:
+                return
+            self._values[item_id] = value
+            for table, chunk in zip(self._tables, self._split(value)):
+                table.setdefault(chunk, set()).add(item_id)
+
+    def remove(self, item_id):
+        with self._lock:
+            value = self._values.pop(item_id, None)
+            if value is None:
+                return
+            for table, chunk in zip(self._tables, self._split(value)):
+                bucket = table.get(chunk)
+                if bucket is not None:
+                    bucket.discard(item_id)
+                    if not bucket:
+                        del table[chunk]
+
+    def search(self, value, max_distance) -> list:
+        """Return ``(distance, item_id)`` pairs within ``max_distance``, nearest first."""
+        radius = max_distance // self.chunks
+        matches = []
+        with self._lock:
+            seen = set()
+            for table, chunk in zip(self._tables, self._split(value)):
+                for key in self._neighbours(chunk, radius):
+                    for item_id in table.get(key, ()):
+                        if item_id in seen:
+                            continue
+                        seen.add(item_id)
+                        distance = hamming(value, self._values[item_id])
+                        if distance <= max_distance:
+                            matches.append((distance, item_id))
+        return sorted(matches)
@@ -0,0 +1,141 @@
+import logging
+import threading
+import time
+from dataclasses import dataclass, field
+
+from config import GEMINI_MODEL_NAME
+from generation_cache import MemoryLRU, analysis_cache_key
+from metrics import REGISTRY
+from rate_limit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+# --- Speculation Outcomes ---
+PREFETCH_READY = "ready"
+PREFETCH_RUNNING = "running"
+PREFETCH_STARTED = "started"
+PREFETCH_OVER_BUDGET = "over_budget"
+
+
+@dataclass
+class _Speculation:
+    future: object
+    started: float
+    owners: set = field(default_factory=set)
+
+
+class AnalysisPrefetcher:
+    """Starts reference-image analysis speculatively, before the user clicks Generate.
+
+    ``speculate`` is called whenever the uploaded image or style changes. It
+    starts the Gemini description in the background unless the analysis cache
+    already has it. The result lands in that cache, so the real request later
+    costs a cache hit, and ``describe`` joins a speculation that is still in
+    flight instead of calling the model a second time.
+
+    Each owner has at most one speculation at a time. A new image or style
+    supersedes the previous one, which is cancelled unless another owner is
+    waiting on it, and any speculation still unfinished after
+    ``stale_seconds`` is cancelled. Speculative calls are also limited per
+    owner by a token bucket (``per_minute``/``burst``). Over budget, nothing is
+    started and the click simply pays for the analysis as before.
+    """
+
+    def __init__(self, services, cache, per_minute=6, burst=3, stale_seconds=120.0, max_owners=1024):
+        self.services = services
+        self.cache = cache
+        self.per_minute = per_minute
+        self.burst = burst
+        self.stale_seconds = stale_seconds
+        self._budgets = MemoryLRU(max_owners)
+        self._inflight = {}
+        self._current = {}
+        # Re-entrant: a done callback can fire inline while the lock is held
+        self._lock = threading.RLock()
+
+    def speculate(self, owner, image_bytes, mime_type, style_prompt) -> str:
+        """Make sure an analysis of this image/style is cached or under way; returns the outcome."""
+        key = analysis_cache_key(GEMINI_MODEL_NAME, image_bytes, style_prompt)
+        if self.cache.get(key) is not None:
+            self.release(owner)
+            return PREFETCH_READY
+        with self._lock:
+            self._sweep_locked()
+            if self._current.get(owner) == key and key in self._inflight:
+                return PREFETCH_RUNNING
+            self._release_locked(owner)
+            entry = self._inflight.get(key)
+            outcome = PREFETCH_RUNNING
+            if entry is None:
+                if not self._budget(owner).try_acquire():
+                    REGISTRY.increment("prefetch_over_budget")
+                    return PREFETCH_OVER_BUDGET
+                future = self.services.submit(
+                    self.services.describe_image(image_bytes, mime_type, style_prompt, self.cache)
+                )
+                entry = self._inflight[key] = _Speculation(future, time.monotonic())
+                future.add_done_callback(lambda done, key=key: self._finished(key, done))
+                REGISTRY.increment("prefetch_started")
+                outcome = PREFETCH_STARTED
+            entry.owners.add(owner)
+            self._current[owner] = key
+            return outcome
+
+    def describe(self, owner, image_bytes, mime_type, style_prompt):
+        """Return ``(description, reused)``, joining a speculation in flight if there is one."""
+        key = analysis_cache_key(GEMINI_MODEL_NAME, image_bytes, style_prompt)
+        with self._lock:
+            entry = self._inflight.get(key)
+            if entry is not None:
+                # Claim it so a superseding speculation elsewhere doesn't cancel it
+                entry.owners.add(owner)
+        if entry is not None:
+            try:
+                description, _ = entry.future.result()
+                REGISTRY.increment("prefetch_joined")
+                return description, True
+            except Exception as e:
+                logger.info("Speculative analysis unusable, analyzing again: %s", e)
+        return self.services.run(self.services.describe_image(image_bytes, mime_type, style_prompt, self.cache))
+
+    def release(self, owner):
+        """Drop ``owner``'s speculation, e.g. when the reference image is removed."""
+        with self._lock:
+            self._release_locked(owner)
+
+    # --- Internals ---
+    def _budget(self, owner) -> TokenBucket:
+        bucket = self._budgets.get(owner)
+        if bucket is None:
+            bucket = TokenBucket(self.per_minute, self.burst)
+            self._budgets.put(owner, bucket)
+        return bucket
+
+    def _release_locked(self, owner):
+        entry = self._inflight.get(self._current.pop(owner, None))
+        if entry is None:
+            return
+        entry.owners.discard(owner)
+        if not entry.owners:
+            self._cancel_locked(entry)
+
+    def _cancel_locked(self, entry):
+        # Cancels the queued call; a call already running finishes and still fills the cache
+        if entry.future.cancel():
+            REGISTRY.increment("prefetch_cancelled")
+
+    def _sweep_locked(self):
+        cutoff = time.monotonic() - self.stale_seconds
+        for key, entry in list(self._inflight.items()):
+            if entry.started < cutoff:
+                # Cancelling can run _finished inline, which already drops the entry
+                self._cancel_locked(entry)
+                self._inflight.pop(key, None)
+
+    def _finished(self, key, future):
+        with self._lock:
+            entry = self._inflight.get(key)
+            if entry is not None and entry.future is future:
+                del self._inflight[key]
+        if not future.cancelled() and future.exception() is not None:
+            logger.info("Speculative analysis failed: %s", future.exception())
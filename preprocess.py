@@ -0,0 +1,108 @@
+import hashlib
+import logging
+import threading
+from dataclasses import dataclass
+from io import BytesIO
+
+from PIL import Image, ImageOps
+
+from generation_cache import MemoryLRU
+from image_asset import ImageAsset
+from metrics import REGISTRY, stage
+
+logger = logging.getLogger(__name__)
+
+ORIENTATION_TAG = 0x0112
+
+
+@dataclass
+class PreparedImage:
+    """An upload after preprocessing, plus what it cost before."""
+    asset: ImageAsset
+    original_bytes: int
+    transformed: bool
+
+    @property
+    def bytes_saved(self) -> int:
+        return max(0, self.original_bytes - len(self.asset))
+
+
+class Preprocessor:
+    """Normalizes uploaded images once before they are sent to any model.
+
+    Applies the EXIF orientation, bounds the longest edge to ``max_edge``,
+    normalizes the colour mode and re-encodes to ``image_format``. Results are
+    cached by the SHA-256 of the upload, so the reference analysis, Gemini edit
+    and video paths all reuse one payload. If nothing needed changing and the
+    re-encode would not be smaller, the original bytes are kept.
+    """
+
+    def __init__(self, max_edge=1536, image_format="JPEG", quality=90, max_items=64, enabled=True):
+        self.max_edge = max_edge
+        self.image_format = image_format
+        self.quality = quality
+        self.enabled = enabled
+        self._cache = MemoryLRU(max_items)
+        self._lock = threading.Lock()
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    def prepare(self, image_bytes, mime_type=None) -> PreparedImage:
+        if not self.enabled:
+            return PreparedImage(ImageAsset(image_bytes, mime_type), len(image_bytes), False)
+        key = hashlib.sha256(image_bytes).hexdigest()
+        prepared = self._cache.get(key)
+        if prepared is not None:
+            return prepared
+        with stage("preprocess"):
+            try:
+                prepared = self._transform(image_bytes, mime_type)
+            except Exception as e:
+                # Let the model see the upload as-is rather than failing the request
+                logger.warning("Could not preprocess uploaded image: %s", e)
+                prepared = PreparedImage(ImageAsset(image_bytes, mime_type), len(image_bytes), False)
+        self._cache.put(key, prepared)
+        with self._lock:
+            self.bytes_in += prepared.original_bytes
+            self.bytes_out += len(prepared.asset)
+        REGISTRY.increment("preprocess_bytes_saved", prepared.bytes_saved)
+        return prepared
+
+    def _transform(self, image_bytes, mime_type) -> PreparedImage:
+        image = Image.open(BytesIO(image_bytes))
+        original_size = image.size
+        if image.format == "JPEG" and max(image.size) > self.max_edge:
+            # Decode JPEGs at a reduced scale when that still covers max_edge
+            image.draft("RGB", (self.max_edge, self.max_edge))
+        changed = image.size != original_size
+        if image.getexif().get(ORIENTATION_TAG, 1) != 1:
+            image = ImageOps.exif_transpose(image)
+            changed = True
+
+        if max(image.size) > self.max_edge:
+            scale = self.max_edge / max(image.size)
+            image = image.resize((max(1, round(image.width * scale)), max(1, round(image.height * scale))),
+                                 Image.LANCZOS)
+            changed = True
+
+        has_alpha = "A" in image.getbands() or "transparency" in image.info
+        if self.image_format == "JPEG" and has_alpha:
+            # JPEG has no alpha channel; flatten onto white like a product backdrop
+            rgba = image.convert("RGBA")
+            image = Image.new("RGB", rgba.size, (255, 255, 255))
+            image.paste(rgba, mask=rgba.getchannel("A"))
+            changed = True
+        elif image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if has_alpha else "RGB")
+
+        buf = BytesIO()
+        image.save(buf, format=self.image_format, quality=self.quality)
+        encoded = buf.getvalue()
+        if not changed and len(encoded) >= len(image_bytes):
+            return PreparedImage(ImageAsset(image_bytes, mime_type), len(image_bytes), False)
+        return PreparedImage(ImageAsset(encoded), len(image_bytes), True)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"bytes_in": self.bytes_in, "bytes_out": self.bytes_out,
+                    "bytes_saved": max(0, self.bytes_in - self.bytes_out)}
@@ -0,0 +1,94 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from io import BytesIO
+
+from PIL import Image, features
+
+PREVIEW_FORMAT = "WEBP" if features.check("webp") else "JPEG"
+
+
+def render_preview(image_bytes, width, image_format=PREVIEW_FORMAT, quality=80) -> bytes:
+    """Encode a preview no wider than ``width``.
+
+    ``image_bytes`` may also be an already decoded PIL image, which is left
+    unmodified.
+    """
+    if isinstance(image_bytes, Image.Image):
+        image = image_bytes
+    else:
+        image = Image.open(BytesIO(image_bytes))
+        if image.width > width:
+            # JPEG can decode at a reduced scale directly; a no-op for other formats
+            image.draft("RGB", (width, max(1, int(image.height * width / image.width))))
+    if image.width > width:
+        height = max(1, int(image.height * (width / float(image.width))))
+        image = image.resize((width, height), resample=Image.LANCZOS)
+    if image_format == "JPEG" and image.mode != "RGB":
+        image = image.convert("RGB")
+    elif image.mode not in ("RGB", "RGBA"):
+        image = image.convert("RGBA" if "A" in image.getbands() else "RGB")
+    buf = BytesIO()
+    image.save(buf, format=image_format, quality=quality)
+    return buf.getvalue()
+
+
+class PreviewCache:
+    """Encoded previews at fixed widths, computed once per image hash.
+
+    Entries live in a byte-bounded in-process LRU shared by every session, so a
+    rerun that shows the same image again costs one hash and a dict lookup.
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, image_format=PREVIEW_FORMAT, quality=80):
+        self.max_bytes = max_bytes
+        self.image_format = image_format
+        self.quality = quality
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._items = OrderedDict()
+        self._total_bytes = 0
+
+    @property
+    def mime_type(self) -> str:
+        return f"image/{self.image_format.lower()}"
+
+    def get(self, image_bytes, width, key=None, loader=None) -> bytes:
+        """Return preview bytes for ``image_bytes``.
+
+        ``key`` skips hashing when the caller already knows the image hash, and
+        ``loader`` supplies an already-encoded preview (e.g. a thumbnail stored
+        on disk) instead of rendering one from ``image_bytes``.
+        """
+        cache_key = (key or hashlib.sha256(image_bytes).hexdigest(), width)
+        with self._lock:
+            preview = self._items.get(cache_key)
+            if preview is not None:
+                self._items.move_to_end(cache_key)
+                self.hits += 1
+                return preview
+            self.misses += 1
+        try:
+            if loader is not None:
+                preview = loader()
+            else:
+                preview = render_preview(image_bytes, width, self.image_format, self.quality)
+        except Exception:
+            # Undecodable payloads are shown as-is rather than failing the page
+            if image_bytes is None:
+                raise
+            return bytes(image_bytes)
+        with self._lock:
+            if cache_key not in self._items:
+                self._items[cache_key] = preview
+                self._total_bytes += len(preview)
+            while self._total_bytes > self.max_bytes and len(self._items) > 1:
+                _, evicted = self._items.popitem(last=False)
+                self._total_bytes -= len(evicted)
+        return preview
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses,
+                    "entries": len(self._items), "bytes": self._total_bytes}
@@ -0,0 +1,236 @@
+import asyncio
+import contextvars
+import functools
+import logging
+import random
+import re
+import threading
+import time
+from dataclasses import dataclass
+
+logger = logging.getLogger(__name__)
+
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+# Set by the awaiting side of a threaded call; once set, the worker stops retrying
+CALL_ABANDONED = contextvars.ContextVar("call_abandoned", default=None)
+# Status names the SDKs put in error messages when the code is not an attribute
+RETRYABLE_MARKERS = ("RESOURCE_EXHAUSTED", "UNAVAILABLE", "Too Many Requests")
+# api_core and genai errors start their message with the HTTP status, e.g. "429 Quota exceeded"
+STATUS_PREFIX = re.compile(r"\s*(\d{3})\b")
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised without calling the model while a family's circuit breaker is open."""
+
+    def __init__(self, name, retry_after):
+        super().__init__(f"{name} is temporarily unavailable after repeated errors; "
+                         f"try again in {int(retry_after) + 1}s.")
+        self.retry_after = retry_after
+
+
+def is_retryable(exc) -> bool:
+    """True for quota (429) and transient server errors from either Google SDK."""
+    for attr in ("code", "status_code"):
+        code = getattr(exc, attr, None)
+        try:
+            if int(code) in RETRYABLE_STATUS_CODES:
+                return True
+        except (TypeError, ValueError):
+            pass
+    message = str(exc)
+    status = STATUS_PREFIX.match(message)
+    if status and int(status.group(1)) in RETRYABLE_STATUS_CODES:
+        return True
+    return any(marker in message for marker in RETRYABLE_MARKERS)
+
+
+class TokenBucket:
+    """Thread-safe token bucket; ``per_minute`` of 0/None means unlimited.
+
+    Callers reserve a token up front and sleep for the returned delay, so waiting
+    callers are served in arrival order and the bucket works from threads and
+    coroutines alike.
+    """
+
+    def __init__(self, per_minute, burst=1):
+        self.rate = (per_minute or 0) / 60.0
+        self.capacity = max(1, burst)
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        if not self.rate:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    def try_acquire(self) -> bool:
+        """Take a token only if one is available now; never waits or goes into debt."""
+        if not self.rate:
+            return True
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+    def acquire(self):
+        delay = self.reserve()
+        if delay:
+            time.sleep(delay)
+
+    async def acquire_async(self):
+        delay = self.reserve()
+        if delay:
+            await asyncio.sleep(delay)
+
+
+class CircuitBreaker:
+    """Opens after ``failure_threshold`` consecutive failures and lets one trial through after ``reset_seconds``."""
+
+    def __init__(self, name, failure_threshold=5, reset_seconds=60.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            if time.monotonic() - self._opened_at >= self.reset_seconds:
+                return "half-open"
+            return "open"
+
+    def before_call(self) -> bool:
+        """Raise while open; returns True when this call is the half-open trial."""
+        with self._lock:
+            if self._opened_at is None:
+                return False
+            remaining = self.reset_seconds - (time.monotonic() - self._opened_at)
+            if remaining > 0 or self._trial_in_flight:
+                raise CircuitOpenError(self.name, max(remaining, 0.0))
+            self._trial_in_flight = True
+            return True
+
+    def release_trial(self):
+        """Give up the trial without a verdict, e.g. when the trial call was cancelled."""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial_in_flight or self._failures >= self.failure_threshold:
+                if self._opened_at is None:
+                    logger.warning("Circuit for %s opened after %d failures", self.name, self._failures)
+                self._opened_at = time.monotonic()
+            self._trial_in_flight = False
+
+
+@dataclass
+class RetryPolicy:
+    """Exponential backoff with full jitter."""
+    max_attempts: int = 4
+    base_delay: float = 1.0
+    max_delay: float = 30.0
+
+    def delay(self, attempt) -> float:
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+
+class CallGuard:
+    """Rate limiting, retries and circuit breaking for one model family."""
+
+    def __init__(self, name, bucket=None, breaker=None, policy=None):
+        self.name = name
+        self.bucket = bucket or TokenBucket(None)
+        self.breaker = breaker or CircuitBreaker(name)
+        self.policy = policy or RetryPolicy()
+
+    def call(self, fn, *args, **kwargs):
+        """Call ``fn`` from a worker thread, blocking while throttled or backing off.
+
+        Stops retrying (re-raising the last error) once :data:`CALL_ABANDONED`
+        is set, i.e. after the coroutine waiting for this thread gave up.
+        """
+        abandoned = CALL_ABANDONED.get() or threading.Event()
+        for attempt in range(self.policy.max_attempts):
+            trial = self.breaker.before_call()
+            try:
+                self.bucket.acquire()
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                if not self._should_retry(e, attempt, trial) or abandoned.wait(self.policy.delay(attempt)):
+                    raise
+            except BaseException:
+                if trial:
+                    self.breaker.release_trial()
+                raise
+            else:
+                self.breaker.record_success()
+                return result
+
+    async def call_async(self, make_coro):
+        """Await ``make_coro()``, re-creating the coroutine for each attempt."""
+        for attempt in range(self.policy.max_attempts):
+            trial = self.breaker.before_call()
+            try:
+                await self.bucket.acquire_async()
+                result = await make_coro()
+            except Exception as e:
+                if not self._should_retry(e, attempt, trial):
+                    raise
+                await asyncio.sleep(self.policy.delay(attempt))
+            except BaseException:
+                # Cancelled, or timed out by wait_for: no verdict on the service's health
+                if trial:
+                    self.breaker.release_trial()
+                raise
+            else:
+                self.breaker.record_success()
+                return result
+
+    def _should_retry(self, exc, attempt, trial=False) -> bool:
+        if not is_retryable(exc):
+            # A bad request says nothing about the service's health; leave the breaker as it is
+            if trial:
+                self.breaker.release_trial()
+            return False
+        self.breaker.record_failure()
+        if attempt + 1 >= self.policy.max_attempts:
+            return False
+        logger.info("%s call failed with retryable error (attempt %d): %s", self.name, attempt + 1, exc)
+        return True
+
+
+class GuardedModel:
+    """Proxy that routes every method call on ``target`` through a :class:`CallGuard`."""
+
+    def __init__(self, target, guard):
+        self._target = target
+        self._guard = guard
+
+    def __getattr__(self, name):
+        attr = getattr(self._target, name)
+        if not callable(attr):
+            return attr
+        return functools.partial(self._guard.call, attr)
@@ -0,0 +1,308 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
+from types import SimpleNamespace
+
+from config import (
+    PROJECT_ID, LOCATION, SERVICE_ACCOUNT_PATH,
+    IMAGEN_MODEL_NAME, GEMINI_MODEL_NAME,
+    SERVICE_MAX_THREADS, SERVICE_CONCURRENCY, SERVICE_TIMEOUTS,
+    RATE_LIMITS, RETRY_MAX_ATTEMPTS, RETRY_BASE_DELAY, RETRY_MAX_DELAY,
+    CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RESET_SECONDS,
+)
+from generation_cache import describe_image_cached, generate_images_cached
+from metrics import REGISTRY, stage
+from rate_limit import CALL_ABANDONED, CallGuard, CircuitBreaker, GuardedModel, RetryPolicy, TokenBucket
+
+logger = logging.getLogger(__name__)
+
+HANDLES = ("imagen_model", "gemini_model", "genai_client", "image_part")
+
+_vertex_lock = threading.Lock()
+_vertex_credentials = None
+
+
+# --- SDK Loaders ---
+# Each SDK is imported and each handle created on first use, so a session
+# that only browses favorites never pays for Vertex AI or GenAI start-up.
+def _init_vertexai():
+    """Load the service account and initialise Vertex AI once per process."""
+    global _vertex_credentials
+    with _vertex_lock:
+        if _vertex_credentials is None:
+            import vertexai
+            from google.oauth2 import service_account
+
+            credentials = service_account.Credentials.from_service_account_file(
+                SERVICE_ACCOUNT_PATH,
+                scopes=['https://www.googleapis.com/auth/cloud-platform']
+            )
+            os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = SERVICE_ACCOUNT_PATH
+            os.environ["GOOGLE_CLOUD_PROJECT"] = PROJECT_ID
+            vertexai.init(project=PROJECT_ID, location=LOCATION, credentials=credentials)
+            _vertex_credentials = credentials
+        return _vertex_credentials
+
+
+def _load_imagen_model():
+    _init_vertexai()
+    from vertexai.preview.vision_models import ImageGenerationModel
+    return ImageGenerationModel.from_pretrained(IMAGEN_MODEL_NAME)
+
+
+def _load_gemini_model():
+    _init_vertexai()
+    from vertexai.generative_models import GenerativeModel
+    return GenerativeModel(GEMINI_MODEL_NAME)
+
+
+def _load_image_part():
+    from vertexai.generative_models import Part
+    return Part.from_data
+
+
+def inline_image_part(data, mime_type):
+    """Image part for fake Gemini models, shaped like the SDK's inline data."""
+    return SimpleNamespace(inline_data=SimpleNamespace(data=data, mime_type=mime_type))
+
+
+def _load_genai_client():
+    credentials = _init_vertexai()
+    from google import genai
+    return genai.Client(vertexai=True, project=PROJECT_ID, location=LOCATION, credentials=credentials)
+
+
+DEFAULT_LOADERS = {
+    "imagen_model": _load_imagen_model,
+    "gemini_model": _load_gemini_model,
+    "genai_client": _load_genai_client,
+    "image_part": _load_image_part,
+}
+
+
+class ModelServices:
+    """Single entry point for every model call made by the UI and batch jobs.
+
+    Holds one shared client per model family and exposes ``async`` methods with
+    per-family timeouts and bounded concurrency. Coroutines run on one
+    process-wide event loop in a background thread; synchronous callers such as
+    Streamlit scripts use :meth:`run` or :meth:`submit` to reach it.
+
+    Every family also has a :class:`CallGuard` (token bucket, jittered retry of
+    quota/transient errors, circuit breaker). Because the service object is
+    shared, that state is shared by every session in the process.
+
+    Any of the model handles can be a fake object with the same methods, which
+    is how the layer is driven offline. Handles that are not passed in are
+    created on first use by the matching entry of ``loaders``. ``image_part``
+    builds the image part of a Gemini request from ``(data, mime_type)``; it
+    defaults to :func:`inline_image_part` unless a loader provides the SDK's.
+
+    Each family runs at most ``concurrency[family]`` blocking calls at once. A
+    call that times out keeps its slot until its worker thread returns, so
+    hung SDK calls cannot pile up past the limit.
+    """
+
+    def __init__(self, imagen_model=None, gemini_model=None, genai_client=None,
+                 concurrency=None, timeouts=None, max_threads=SERVICE_MAX_THREADS,
+                 rate_limits=None, retry_policy=None, loaders=None, image_part=None):
+        self._handles = {"imagen_model": imagen_model, "gemini_model": gemini_model, "genai_client": genai_client,
+                         "image_part": image_part}
+        self.loaders = {"image_part": lambda: inline_image_part, **(loaders or {})}
+        self._handle_lock = threading.Lock()
+        self.concurrency = {**SERVICE_CONCURRENCY, **(concurrency or {})}
+        self.timeouts = {**SERVICE_TIMEOUTS, **(timeouts or {})}
+        self.max_threads = max_threads
+        self.rate_limits = {**RATE_LIMITS, **(rate_limits or {})}
+        policy = retry_policy or RetryPolicy(RETRY_MAX_ATTEMPTS, RETRY_BASE_DELAY, RETRY_MAX_DELAY)
+        self.guards = {
+            family: CallGuard(
+                family,
+                TokenBucket(limit["per_minute"], limit["burst"]),
+                CircuitBreaker(family, CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RESET_SECONDS),
+                policy,
+            )
+            for family, limit in self.rate_limits.items()
+        }
+        self._semaphores = {}
+        self._loop = None
+        self._loop_lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, **kwargs):
+        """Create the service layer for the configured project.
+
+        Only the service account file is checked here; authentication and the
+        SDK clients are deferred until a model is first used or warmed up.
+        """
+        if not os.path.exists(SERVICE_ACCOUNT_PATH):
+            raise FileNotFoundError(f"Service account file not found at '{SERVICE_ACCOUNT_PATH}'")
+        return cls(loaders=DEFAULT_LOADERS, **kwargs)
+
+    # --- Model Handles ---
+    def _handle(self, name):
+        handle = self._handles[name]
+        if handle is not None:
+            return handle
+        with self._handle_lock:
+            if self._handles[name] is None:
+                loader = self.loaders.get(name)
+                if loader is None:
+                    raise RuntimeError(f"No {name} configured for this service layer")
+                with stage(f"load.{name}"):
+                    self._handles[name] = loader()
+            return self._handles[name]
+
+    @property
+    def imagen_model(self):
+        return self._handle("imagen_model")
+
+    @property
+    def gemini_model(self):
+        return self._handle("gemini_model")
+
+    @property
+    def genai_client(self):
+        return self._handle("genai_client")
+
+    @property
+    def image_part(self):
+        return self._handle("image_part")
+
+    def is_loaded(self, name) -> bool:
+        return self._handles[name] is not None
+
+    def warm_up(self, names=HANDLES):
+        """Create the given handles now (e.g. from a background thread at boot).
+
+        Failures are logged and left for the first real request to surface.
+        """
+        self._ensure_loop()
+        for name in names:
+            started = time.perf_counter()
+            try:
+                self._handle(name)
+            except Exception as e:
+                REGISTRY.increment("warm_up_failures")
+                logger.warning("Warm-up of %s failed: %s", name, e)
+                continue
+            logger.info("Warmed up %s in %.2fs", name, time.perf_counter() - started)
+
+    # --- Event Loop Bridge ---
+    def _ensure_loop(self):
+        with self._loop_lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                loop.set_default_executor(ThreadPoolExecutor(max_workers=self.max_threads, thread_name_prefix="model-call"))
+                threading.Thread(target=loop.run_forever, name="model-services", daemon=True).start()
+                self._loop = loop
+            return self._loop
+
+    def submit(self, coro):
+        """Schedule ``coro`` on the service loop and return a concurrent Future."""
+        return asyncio.run_coroutine_threadsafe(coro, self._ensure_loop())
+
+    def run(self, coro, timeout=None):
+        """Run ``coro`` on the service loop and block until it finishes.
+
+        On timeout the coroutine is cancelled and ``TimeoutError`` is raised.
+        """
+        future = self.submit(coro)
+        try:
+            return future.result(timeout)
+        except FuturesTimeoutError:
+            future.cancel()
+            raise TimeoutError("Model request timed out") from None
+
+    async def _call(self, family, fn, *args, **kwargs):
+        """Run a blocking SDK call in the shared thread pool under the family's limits."""
+        semaphore = self._semaphores.setdefault(family, asyncio.Semaphore(self.concurrency[family]))
+        # The worker thread inherits this flag and stops retrying once nobody is waiting for it
+        abandoned = threading.Event()
+        token = CALL_ABANDONED.set(abandoned)
+
+        def release(task):
+            # A timed-out call holds its slot until the thread actually returns
+            semaphore.release()
+            if not task.cancelled():
+                task.exception()  # retrieved, so an abandoned call's error is not reported as unhandled
+
+        try:
+            await semaphore.acquire()
+            task = asyncio.ensure_future(asyncio.to_thread(fn, *args, **kwargs))
+            task.add_done_callback(release)
+            with stage(f"model.{family}"):
+                return await asyncio.wait_for(asyncio.shield(task), self.timeouts[family])
+        except BaseException:
+            abandoned.set()
+            raise
+        finally:
+            CALL_ABANDONED.reset(token)
+
+    # --- Model Calls ---
+    async def generate_images(self, generation_params, cache=None):
+        """Generate Imagen images; returns ``(image_bytes_list, cache_hit)``."""
+        model = GuardedModel(self.imagen_model, self.guards["imagen"])
+        return await self._call("imagen", generate_images_cached,
+                                model, IMAGEN_MODEL_NAME, generation_params, cache)
+
+    async def generate_image_variant(self, generation_params, variant, cache=None, postprocess=None):
+        """Generate a single image for one slot of a fan-out.
+
+        Returns ``(image_bytes, cache_hit, postprocessed)`` where ``postprocess``
+        (e.g. thumbnailing) runs in the worker pool, off the caller's thread.
+        """
+        params = {**generation_params, "number_of_images": 1}
+        model = GuardedModel(self.imagen_model, self.guards["imagen"])
+        blobs, cache_hit = await self._call("imagen", generate_images_cached,
+                                            model, IMAGEN_MODEL_NAME, params, cache, variant)
+        if not blobs:
+            raise RuntimeError("The model returned no image for this request.")
+        extra = None
+        if postprocess:
+            with stage("thumbnail"):
+                extra = await asyncio.to_thread(postprocess, blobs[0])
+        return blobs[0], cache_hit, extra
+
+    def fan_out_images(self, generation_params, cache=None, postprocess=None):
+        """Split a multi-image request into parallel single-image requests.
+
+        Returns one concurrent Future per image so callers can render each
+        result as soon as it arrives and keep the others if one fails.
+        """
+        return [
+            self.submit(self.generate_image_variant(generation_params, idx, cache, postprocess))
+            for idx in range(generation_params.get("number_of_images", 1))
+        ]
+
+    async def describe_image(self, image_bytes, mime_type, style_prompt, cache=None):
+        """Describe a reference image with Gemini; returns ``(description, cache_hit)``."""
+        def describe():
+            image_part = self.image_part(image_bytes, mime_type=mime_type)
+            return self.guards["gemini"].call(self.gemini_model.generate_content, [style_prompt, image_part]).text
+
+        return await self._call("gemini", describe_image_cached,
+                                cache, GEMINI_MODEL_NAME, image_bytes, style_prompt, describe)
+
+    async def edit_image_stream(self, model_name, contents, config, on_chunk):
+        """Stream a Gemini image edit, calling ``on_chunk`` with each response chunk as it arrives.
+
+        Only opening the stream is retried; the timeout covers the whole stream.
+        Cancelling the returned task closes the stream.
+        """
+        semaphore = self._semaphores.setdefault("gemini_edit", asyncio.Semaphore(self.concurrency["gemini_edit"]))
+
+        async def consume():
+            stream = await self.guards["gemini_edit"].call_async(
+                lambda: self.genai_client.aio.models.generate_content_stream(model=model_name, contents=contents,
+                                                                             config=config)
+            )
+            async for chunk in stream:
+                on_chunk(chunk)
+
+        async with semaphore:
+            with stage("model.gemini_edit"):
+                await asyncio.wait_for(consume(), self.timeouts["gemini_edit"])
@@ -0,0 +1,318 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import string
+import threading
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+from config import GEMINI_EDIT_MODELS, GEMINI_HEDGE_AFTER_SECONDS, STYLES_PATH, STYLES_RELOAD_SECONDS
+
+logger = logging.getLogger(__name__)
+
+REQUIRED_STYLE_FIELDS = ("name", "css_class", "description", "analysis_prompt", "edit_prompt", "feedback_enhancement")
+REQUIRED_TEMPLATES = ("reference_prompt", "feedback_prompt", "feedback_prompt_plain", "edit_instruction",
+                      "edit_instructions_section", "edit_avoid_section", "style_badge", "style_hint", "edit_feedback")
+
+
+class Template:
+    """A ``str.format``-style template parsed once into literal and field segments."""
+
+    def __init__(self, source):
+        self.source = source
+        self._segments = []
+        for literal, field_name, format_spec, conversion in string.Formatter().parse(source):
+            if literal:
+                self._segments.append((True, literal))
+            if field_name is not None:
+                if not field_name.isidentifier() or format_spec or conversion:
+                    raise ValueError(f"Only plain {{name}} placeholders are supported, got {{{field_name}}}")
+                self._segments.append((False, field_name))
+        self.fields = frozenset(value for is_literal, value in self._segments if not is_literal)
+
+    def render(self, **values) -> str:
+        missing = self.fields - values.keys()
+        if missing:
+            raise KeyError(f"Template needs {', '.join(sorted(missing))}")
+        return "".join(value if is_literal else str(values[value]) for is_literal, value in self._segments)
+
+
+@dataclass(frozen=True)
+class Style:
+    """One entry of the style registry, with its static markup rendered at load time."""
+    name: str
+    css_class: str
+    description: str
+    analysis_prompt: str
+    edit_prompt: str
+    feedback_enhancement: str
+    badge_html: str
+    hint_markdown: str
+    edit_models: tuple = ()
+    hedge_after_seconds: Optional[float] = None
+
+
+def _text(value):
+    # Long prompts may be written as a list of lines in the file
+    return "\n".join(value) if isinstance(value, list) else str(value)
+
+
+def _edit_models(value, where) -> tuple:
+    if isinstance(value, str):
+        value = [value]
+    if not isinstance(value, list) or not value or not all(isinstance(name, str) and name for name in value):
+        raise ValueError(f"{where}: edit_models must be a non-empty list of model names")
+    return tuple(value)
+
+
+def _hedge_after(value, where) -> Optional[float]:
+    # null turns hedging off: candidates are then only tried after a failure
+    if value is None:
+        return None
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or value <= 0:
+        raise ValueError(f"{where}: hedge_after_seconds must be a positive number or null")
+    return float(value)
+
+
+class StyleRegistry:
+    """Styles and prompt templates loaded from a declarative JSON file.
+
+    The file is parsed, validated and compiled once; afterwards lookups are
+    dict accesses. ``version`` combines the file's declared version with a
+    content hash. The file is re-checked at most every ``check_interval``
+    seconds and reloaded when its mtime changes; an invalid edit is logged and
+    the previous styles stay active.
+    """
+
+    def __init__(self, path, check_interval=2.0):
+        self.path = path
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._checked_at = 0.0
+        self._mtime = None
+        self._state = None
+        self.reload()
+
+    def reload(self):
+        with open(self.path, "rb") as f:
+            raw = f.read()
+        mtime = os.stat(self.path).st_mtime_ns
+        state = self._compile(json.loads(raw.decode("utf-8")), hashlib.sha256(raw).hexdigest()[:8])
+        with self._lock:
+            self._state = state
+            self._mtime = mtime
+            self._checked_at = time.monotonic()
+        logger.info("Loaded %d styles (version %s)", len(state["styles"]), state["version"])
+
+    def reload_if_changed(self):
+        now = time.monotonic()
+        if now - self._checked_at < self.check_interval:
+            return
+        self._checked_at = now
+        try:
+            if os.stat(self.path).st_mtime_ns != self._mtime:
+                self.reload()
+        except Exception as e:
+            logger.warning("Keeping previous styles; could not reload %s: %s", self.path, e)
+
+    @staticmethod
+    def _compile(data, digest) -> dict:
+        templates = data.get("templates") or {}
+        missing = [name for name in REQUIRED_TEMPLATES if name not in templates]
+        if missing:
+            raise ValueError(f"styles file is missing templates: {', '.join(missing)}")
+        compiled = {name: Template(source) for name, source in templates.items()}
+        # Styles inherit the file's defaults, which inherit config.py's
+        default_models = _edit_models(data.get("edit_models", list(GEMINI_EDIT_MODELS)), "styles file")
+        default_hedge = _hedge_after(data.get("hedge_after_seconds", GEMINI_HEDGE_AFTER_SECONDS), "styles file")
+
+        styles = {}
+        for entry in data.get("styles") or []:
+            absent = [field for field in REQUIRED_STYLE_FIELDS if field not in entry]
+            if absent:
+                raise ValueError(f"style {entry.get('name', '?')!r} is missing {', '.join(absent)}")
+            name = entry["name"]
+            description = _text(entry["description"])
+            styles[name] = Style(
+                name=name,
+                css_class=entry["css_class"],
+                description=description,
+                analysis_prompt=_text(entry["analysis_prompt"]),
+                edit_prompt=_text(entry["edit_prompt"]),
+                feedback_enhancement=_text(entry["feedback_enhancement"]),
+                badge_html=compiled["style_badge"].render(css_class=entry["css_class"], name=name),
+                hint_markdown=compiled["style_hint"].render(name=name, description=description),
+                edit_models=_edit_models(entry["edit_models"], f"style {name!r}")
+                if "edit_models" in entry else default_models,
+                hedge_after_seconds=_hedge_after(entry["hedge_after_seconds"], f"style {name!r}")
+                if "hedge_after_seconds" in entry else default_hedge,
+            )
+        if not styles:
+            raise ValueError("styles file defines no styles")
+        default = data.get("default") or next(iter(styles))
+        if default not in styles:
+            raise ValueError(f"default style {default!r} is not defined")
+        return {
+            "version": f"{data.get('version', 0)}-{digest}",
+            "default": default,
+            "names": tuple(styles),
+            "styles": styles,
+            "templates": compiled,
+        }
+
+    # --- Lookups ---
+    @property
+    def version(self) -> str:
+        return self._state["version"]
+
+    @property
+    def default(self) -> str:
+        return self._state["default"]
+
+    @property
+    def names(self) -> tuple:
+        return self._state["names"]
+
+    def get(self, name) -> Style:
+        """Return the named style, falling back to the default style."""
+        state = self._state
+        return state["styles"].get(name) or state["styles"][state["default"]]
+
+    def index(self, name) -> int:
+        """Position of ``name`` in :attr:`names` (0 when unknown), for select boxes."""
+        names = self.names
+        return names.index(name) if name in names else 0
+
+    def badge_html(self, name) -> str:
+        """Badge markup for any style name, including ones no longer in the file."""
+        style = self._state["styles"].get(name)
+        if style is not None:
+            return style.badge_html
+        return self.render("style_badge", css_class=self.get(self.default).css_class, name=name)
+
+    def render(self, template_name, **values) -> str:
+        return self._state["templates"][template_name].render(**values)
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def registry() -> StyleRegistry:
+    """Process-wide style registry, hot-reloaded when the styles file changes."""
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = StyleRegistry(STYLES_PATH, STYLES_RELOAD_SECONDS)
+    _registry.reload_if_changed()
+    return _registry
+
+
+# --- Prompt Builders ---
+def reference_analysis_prompt(style):
+    """Return the reference-image analysis prompt for a style, falling back to the default."""
+    return registry().get(style).analysis_prompt
+
+
+def compose_reference_prompt(image_description, user_prompt):
+    """Combine a reference-image description with the user's own prompt."""
+    if user_prompt and user_prompt.strip():
+        return registry().render("reference_prompt", description=image_description, user_prompt=user_prompt)
+    return image_description
+
+
+def feedback_prompt(base_prompt, feedback, style):
+    """Build an Imagen regeneration prompt from the previous prompt and user feedback."""
+    styles = registry()
+    enhancement = styles.get(style).feedback_enhancement if style in styles.names else ""
+    if enhancement:
+        return styles.render("feedback_prompt", base_prompt=base_prompt, feedback=feedback, enhancement=enhancement)
+    return styles.render("feedback_prompt_plain", base_prompt=base_prompt, feedback=feedback)
+
+
+def _feedback_key(text):
+    return " ".join(re.sub(r"[^\w\s]", " ", text.lower()).split())
+
+
+def merge_feedback(items) -> list:
+    """Deduplicate accumulated feedback; a later request that repeats or extends an earlier one replaces it.
+
+    Only a later request that starts with the earlier one counts as extending
+    it, so "don't make it red" is kept alongside "make it red".
+    """
+    merged = []
+    for text in items:
+        text = " ".join(text.split()).rstrip(" .;")
+        key = _feedback_key(text)
+        if not key:
+            continue
+        merged = [(k, t) for k, t in merged if not f"{key} ".startswith(f"{k} ")]
+        merged.append((key, text))
+    return [text for _, text in merged]
+
+
+def _shorten(text, limit):
+    # Cut at the last sentence end that fits, else at a word boundary
+    if len(text) <= limit:
+        return text
+    head = text[:max(0, limit)]
+    cut = head.rfind(". ")
+    if cut < limit // 2:
+        cut = head.rfind(" ")
+    return head[:cut + 1].rstrip(" .") if cut > 0 else head
+
+
+def compact_feedback_prompt(base_prompt, feedback_items, style, max_chars):
+    """Build a regeneration prompt from a tree's first prompt and all feedback since, in ``max_chars``.
+
+    Repeated feedback is merged. If the prompt is still too long, the base
+    prompt is shortened first, down to half of the room left by the template,
+    so a long base prompt cannot crowd out the feedback. Only then is the
+    oldest feedback dropped, and the base shortened further if the newest
+    request alone does not fit, so the prompt stops growing with every
+    iteration. Anything still cut is cut at a word boundary.
+    """
+    items = merge_feedback(feedback_items)
+
+    def build():
+        return feedback_prompt(base_prompt, "; ".join(items), style)
+
+    prompt = build()
+    if len(prompt) > max_chars:
+        room = max_chars - len(feedback_prompt("", "", style))
+        keep = max(room // 2, len(base_prompt) - (len(prompt) - max_chars))
+        base_prompt = _shorten(base_prompt, keep)
+        prompt = build()
+    while len(prompt) > max_chars and len(items) > 1:
+        items = items[1:]
+        prompt = build()
+    if len(prompt) > max_chars:
+        base_prompt = _shorten(base_prompt, len(base_prompt) - (len(prompt) - max_chars))
+        prompt = build()
+    if len(prompt) > max_chars and items:
+        # Even the newest request alone is too long for the budget
+        items = [_shorten(items[-1], len(items[-1]) - (len(prompt) - max_chars))]
+        prompt = build()
+    return _shorten(prompt, max_chars)
+
+
+def edit_feedback_instruction(feedback, style):
+    """Build the short instruction for chaining a Gemini edit on the previous output."""
+    styles = registry()
+    return styles.render("edit_feedback", feedback=feedback.strip().rstrip("."),
+                         enhancement=styles.get(style).feedback_enhancement)
+
+
+def edit_instruction(style, instructions="", avoid=""):
+    """Build the Gemini edit instruction for a style plus optional extra and negative prompts."""
+    styles = registry()
+    return styles.render(
+        "edit_instruction",
+        edit_prompt=styles.get(style).edit_prompt,
+        instructions=styles.render("edit_instructions_section", text=instructions) if instructions else "",
+        avoid=styles.render("edit_avoid_section", text=avoid) if avoid else "",
+    )
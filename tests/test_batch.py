@@ -0,0 +1,87 @@
+import json
+
+import pytest
+
+from batch import RESULTS_FILE, load_manifest, run_batch
+from fake_backends import FakeGenerativeModel, FakeImagenModel, make_image_bytes
+from services import ModelServices
+from styles import registry
+
+STYLE = "E-commerce Product"
+
+
+def make_services(imagen_model, gemini_model=None):
+    unlimited = {family: {"per_minute": 0, "burst": 1} for family in ("imagen", "gemini", "gemini_edit", "veo")}
+    return ModelServices(imagen_model=imagen_model, gemini_model=gemini_model or FakeGenerativeModel(text_chars=40),
+                         rate_limits=unlimited)
+
+
+def read_results(out_dir):
+    with open(out_dir / RESULTS_FILE, encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def test_jsonl_manifest_resolves_reference_images_next_to_it(tmp_path):
+    manifest = tmp_path / "products.jsonl"
+    manifest.write_text(
+        json.dumps({"id": "mug", "prompt": "a red mug", "style": STYLE, "count": 2}) + "\n\n"
+        + json.dumps({"id": "lamp", "reference_image": "images/lamp.png"}) + "\n"
+        + json.dumps({"id": "chair", "reference_image": str(tmp_path / "abs.png")}) + "\n",
+        encoding="utf-8",
+    )
+    mug, lamp, chair = load_manifest(manifest)
+    assert (mug.item_id, mug.prompt, mug.style, mug.count) == ("mug", "a red mug", STYLE, 2)
+    assert lamp.reference_image == str(tmp_path / "images" / "lamp.png")
+    assert lamp.style == registry().default
+    assert chair.reference_image == str(tmp_path / "abs.png")
+
+
+def test_csv_manifest_derives_stable_ids(tmp_path):
+    manifest = tmp_path / "products.csv"
+    manifest.write_text("prompt, style ,count,negative_prompt\n"
+                        f"a red mug,{STYLE},1,blurry\n"
+                        f"a blue lamp,{STYLE},3,\n", encoding="utf-8")
+    mug, lamp = load_manifest(manifest)
+    assert (mug.prompt, mug.negative_prompt, lamp.count) == ("a red mug", "blurry", 3)
+    assert mug.item_id != lamp.item_id and len(mug.item_id) == 16
+    assert [item.item_id for item in load_manifest(manifest)] == [mug.item_id, lamp.item_id]
+
+
+@pytest.mark.parametrize("row, message", [
+    ({"id": "x"}, "row 1: needs a prompt or a reference_image"),
+    ({"prompt": "a mug", "style": "Watercolour"}, "unknown style"),
+    ({"prompt": "a mug", "count": 5}, "count must be between 1 and 4"),
+])
+def test_invalid_rows_are_rejected(tmp_path, row, message):
+    manifest = tmp_path / "products.jsonl"
+    manifest.write_text(json.dumps(row) + "\n", encoding="utf-8")
+    with pytest.raises(ValueError, match=message):
+        load_manifest(manifest)
+
+
+def test_rerun_skips_completed_items_and_retries_failed_ones(tmp_path):
+    (tmp_path / "lamp.png").write_bytes(make_image_bytes(32, 32, seed=1))
+    manifest = tmp_path / "products.jsonl"
+    manifest.write_text(json.dumps({"id": "mug", "prompt": "a red mug", "count": 2}) + "\n"
+                        + json.dumps({"id": "lamp", "reference_image": "lamp.png"}) + "\n", encoding="utf-8")
+    items = load_manifest(manifest)
+    out_dir = tmp_path / "out"
+
+    # The first Imagen call fails with a client error, which is not retried
+    imagen = FakeImagenModel(width=16, height=16, failures=[ValueError("400 INVALID_ARGUMENT")])
+    summary = run_batch(items, out_dir, make_services(imagen), concurrency=1, imagen_rpm=0, gemini_rpm=0)
+    assert (summary["ok"], summary["failed"], summary["skipped"]) == (1, 1, 0)
+    (failed_id,) = [record["id"] for record in read_results(out_dir) if record["status"] == "error"]
+
+    imagen = FakeImagenModel(width=16, height=16)
+    summary = run_batch(items, out_dir, make_services(imagen), concurrency=1, imagen_rpm=0, gemini_rpm=0)
+    assert (summary["ok"], summary["failed"], summary["skipped"]) == (1, 0, 1)
+    assert imagen.calls == 1
+    first, second, retried = read_results(out_dir)
+    assert retried["id"] == failed_id and retried["status"] == "ok"
+    images = {record["id"]: record["images"] for record in (first, second, retried) if record["status"] == "ok"}
+    assert len(images["mug"]) == 2 and len(images["lamp"]) == 1
+    assert all((out_dir / name).exists() for names in images.values() for name in names)
+
+    summary = run_batch(items, out_dir, make_services(FakeImagenModel()), imagen_rpm=0, gemini_rpm=0)
+    assert (summary["ok"], summary["failed"], summary["skipped"]) == (0, 0, 2)
@@ -0,0 +1,100 @@
+import asyncio
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from edit_stream import EVENT_DONE, EVENT_IMAGE, EVENT_TEXT, EditStream, HedgedEdit
+from fake_backends import make_image_bytes
+
+PNG = make_image_bytes(8, 8)
+
+
+def chunk(text=None, data=None):
+    inline = SimpleNamespace(data=data, mime_type="image/png") if data else None
+    return SimpleNamespace(candidates=[SimpleNamespace(content=SimpleNamespace(
+        parts=[SimpleNamespace(text=text, inline_data=inline)]))])
+
+
+@pytest.fixture(scope="module")
+def loop():
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    yield loop
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join()
+
+
+def run_edit(loop, plan, hedge_after=None, may_hedge=None, cancel_after=None):
+    """Race ``plan`` ({model: (seconds, "image" | "text" | "fail")}) and return the finished HedgedEdit."""
+    async def respond(model_name, stream):
+        seconds, outcome = plan[model_name]
+        stream.feed(chunk(text=f"{model_name} is thinking"))
+        await asyncio.sleep(seconds)
+        if outcome == "fail":
+            raise RuntimeError(f"{model_name} NOT_FOUND")
+        if outcome == "image":
+            stream.feed(chunk(data=PNG))
+        await asyncio.sleep(0.02)
+
+    edit = HedgedEdit(lambda model_name, stream: asyncio.run_coroutine_threadsafe(respond(model_name, stream), loop),
+                      list(plan), hedge_after_seconds=hedge_after, may_hedge=may_hedge)
+    started = time.monotonic()
+    for _ in edit.events(poll_seconds=0.01):
+        if cancel_after is not None and time.monotonic() - started > cancel_after:
+            edit.cancel()
+    return edit
+
+
+def test_stream_splits_text_and_image_events():
+    stream = EditStream()
+    stream.feed(chunk(text="Editing"))
+    stream.feed(chunk(data=PNG[:20]))
+    stream.feed(chunk(data=PNG[20:]))
+    stream.close()
+    kinds = [kind for kind, _ in stream.events(poll_seconds=0.01)]
+    assert kinds == [EVENT_TEXT, EVENT_IMAGE, EVENT_DONE]
+    assert stream.image.data == PNG and stream.text_chunks == ["Editing"]
+
+
+def test_fast_primary_is_not_hedged(loop):
+    edit = run_edit(loop, {"a": (0.05, "image"), "b": (0.05, "image")}, hedge_after=0.5)
+    assert edit.result.model_name == "a" and not edit.hedged
+    assert [stream.model_name for stream, _ in edit.attempts] == ["a"]
+
+
+def test_slow_primary_is_hedged_and_cancelled_when_the_hedge_wins(loop):
+    edit = run_edit(loop, {"a": (2.0, "image"), "b": (0.05, "image")}, hedge_after=0.1)
+    assert edit.hedged and edit.result.model_name == "b"
+    primary, primary_future = edit.attempts[0]
+    assert primary_future.cancelled() and primary.image is None
+
+
+def test_hedge_is_skipped_when_over_budget(loop):
+    edit = run_edit(loop, {"a": (0.3, "image"), "b": (0.05, "image")}, hedge_after=0.1, may_hedge=lambda: False)
+    assert not edit.hedged and edit.result.model_name == "a"
+    assert len(edit.attempts) == 1
+
+
+def test_failed_model_falls_back_to_the_next(loop):
+    edit = run_edit(loop, {"a": (0.01, "fail"), "b": (0.05, "image")})
+    assert edit.result.model_name == "b" and edit.result.image is not None
+
+
+def test_text_only_answer_is_the_result(loop):
+    edit = run_edit(loop, {"a": (0.01, "text"), "b": (0.01, "image")})
+    assert edit.result.model_name == "a" and edit.result.image is None
+
+
+def test_error_is_raised_when_every_model_fails(loop):
+    edit = run_edit(loop, {"a": (0.01, "fail"), "b": (0.01, "fail")})
+    with pytest.raises(RuntimeError, match="b NOT_FOUND"):
+        edit.result
+
+
+def test_cancel_stops_every_attempt(loop):
+    edit = run_edit(loop, {"a": (2.0, "image"), "b": (2.0, "image")}, hedge_after=0.1, cancel_after=0.2)
+    assert edit.cancelled and edit.winner is None
+    assert all(future.cancelled() for _, future in edit.attempts)
@@ -0,0 +1,76 @@
+import threading
+from io import BytesIO
+
+from PIL import Image
+
+from fake_backends import make_image_bytes
+from favorites_store import FavoritesStore
+from image_asset import ImageAsset
+
+IMAGE = make_image_bytes(64, 48, seed=1)
+OTHER = make_image_bytes(64, 48, seed=2)
+
+
+def test_add_lists_pages_and_thumbnails(tmp_path):
+    store = FavoritesStore(tmp_path, thumbnail_width=32)
+    first = store.add("alice", IMAGE, "a mug", "Style", 1)
+    store.add("alice", OTHER, "a lamp", "Style", 2)
+    store.add("bob", IMAGE, "a mug", "Style", 1)
+    assert store.count("alice") == 2 and store.count("bob") == 1
+    favorites = store.page("alice", offset=0, limit=1)
+    assert [(favorite.id, favorite.prompt, favorite.mime_type) for favorite in favorites] == \
+        [(first, "a mug", "image/png")]
+    assert store.image_bytes(favorites[0]) == IMAGE
+    assert ImageAsset(store.thumbnail_bytes(favorites[0])).image.size == (32, 24)
+    assert len(list(store.blob_dir.rglob("*"))) == 4  # two prefix directories, two blobs
+
+
+def test_find_similar_matches_re_encoded_copies_only(tmp_path):
+    store = FavoritesStore(tmp_path)
+    favorite_id = store.add("alice", IMAGE, "a mug", "Style", 1)
+    buf = BytesIO()
+    ImageAsset(IMAGE).image.resize((128, 96), Image.LANCZOS).save(buf, format="JPEG", quality=90)
+    resized = buf.getvalue()
+    assert [item_id for _, item_id in store.find_similar("alice", resized)] == [favorite_id]
+    assert store.find_similar("alice", OTHER) == []
+    assert store.find_similar("bob", IMAGE) == []
+
+
+def test_remove_keeps_blobs_other_owners_still_use(tmp_path):
+    store = FavoritesStore(tmp_path)
+    alice_id = store.add("alice", IMAGE, "a mug", "Style", 1)
+    store.add("bob", IMAGE, "a mug", "Style", 1)
+    store.remove("alice", alice_id)
+    assert store.find_similar("alice", IMAGE) == []
+    (favorite,) = store.page("bob")
+    assert store.image_bytes(favorite) == IMAGE
+    store.clear("bob")
+    assert not store.blob_path(favorite.image_hash).exists()
+    assert not store.thumbnail_path(favorite.image_hash).exists()
+
+
+def test_concurrent_remove_never_deletes_a_blob_being_added(tmp_path):
+    store = FavoritesStore(tmp_path, thumbnail_width=16)
+    asset = ImageAsset(IMAGE)
+
+    def churn():
+        for _ in range(30):
+            store.remove("bob", store.add("bob", asset, "a mug", "Style", 1))
+
+    thread = threading.Thread(target=churn)
+    thread.start()
+    for _ in range(30):
+        store.add("alice", asset, "a mug", "Style", 1)
+    thread.join()
+    assert store.blob_path(asset.digest).exists()
+    assert store.thumbnail_path(asset.digest).exists()
+
+
+def test_only_recent_owner_indexes_stay_in_memory(tmp_path):
+    store = FavoritesStore(tmp_path, max_indexes=2)
+    ids = {owner: store.add(owner, IMAGE, "a mug", "Style", 1) for owner in ("alice", "bob", "carol")}
+    for owner in ("alice", "bob", "carol"):
+        assert store.find_similar(owner, IMAGE) == [(0, ids[owner])]
+    assert list(store._indexes) == ["bob", "carol"]
+    assert store.find_similar("alice", IMAGE) == [(0, ids["alice"])]
+    assert list(store._indexes) == ["carol", "alice"]
@@ -0,0 +1,98 @@
+import os
+import time
+
+from generation_cache import AnalysisCache, DiskCache, describe_image_cached
+
+
+def test_put_get_and_reopen(tmp_path):
+    cache = DiskCache(tmp_path, max_bytes=1024)
+    cache.put("a", b"alpha")
+    assert cache.get("a") == b"alpha"
+    assert cache.get("b") is None
+    assert DiskCache(tmp_path).get("a") == b"alpha"
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+
+def test_least_recently_used_entry_is_evicted(tmp_path):
+    cache = DiskCache(tmp_path, max_bytes=250)
+    cache.put("a", b"a" * 100)
+    cache.put("b", b"b" * 100)
+    cache.get("a")
+    cache.put("c", b"c" * 100)
+    assert cache.get("b") is None
+    assert cache.get("a") == b"a" * 100
+    assert cache.stats()["bytes"] == 200
+
+
+def test_expired_entry_is_a_miss(tmp_path):
+    cache = DiskCache(tmp_path, ttl_seconds=60)
+    cache.put("a", b"alpha")
+    cache._index["a"] = (5, time.time() - 120)
+    assert cache.get("a") is None
+    assert not (tmp_path / "a.bin").exists()
+
+
+def test_entry_evicted_during_read_is_a_miss(tmp_path, monkeypatch):
+    cache = DiskCache(tmp_path)
+    cache.put("a", b"alpha")
+    read_bytes = type(tmp_path).read_bytes
+
+    def evict_then_read(path):
+        # Another thread evicts the entry between the index lookup and the file read
+        with cache._lock:
+            cache._remove_locked("a")
+        return read_bytes(path)
+
+    monkeypatch.setattr(type(tmp_path), "read_bytes", evict_then_read)
+    assert cache.get("a") is None
+    assert cache.stats() == {"hits": 0, "misses": 1, "hit_rate": 0.0, "entries": 0, "bytes": 0}
+
+
+def test_entry_rewritten_during_failed_read_is_kept(tmp_path, monkeypatch):
+    cache = DiskCache(tmp_path)
+    cache.put("a", b"old")
+
+    def rewrite_then_fail(path):
+        monkeypatch.undo()
+        cache.put("a", b"new")
+        raise OSError("stale handle")
+
+    monkeypatch.setattr(type(tmp_path), "read_bytes", rewrite_then_fail)
+    assert cache.get("a") is None
+    assert cache.get("a") == b"new"
+    assert os.path.getsize(tmp_path / "a.bin") == 3
+
+
+def test_analysis_cache_falls_back_to_disk_and_round_trips_utf8(tmp_path):
+    text = "Ein Becher — rot, glänzend ☕"
+    AnalysisCache(DiskCache(tmp_path)).put("key", text)
+    reopened = AnalysisCache(DiskCache(tmp_path))
+    assert reopened.memory.get("key") is None
+    assert reopened.get("key") == text
+    assert reopened.memory.get("key") == text
+    assert reopened.disk.stats()["hits"] == 1
+    reopened.get("key")
+    assert reopened.disk.stats()["hits"] == 1
+
+
+def test_describe_image_cached_calls_the_model_once(tmp_path):
+    cache = AnalysisCache(DiskCache(tmp_path))
+    calls = []
+
+    def describe():
+        calls.append(1)
+        return "a red mug"
+
+    assert describe_image_cached(cache, "gemini", b"image", "Describe", describe) == ("a red mug", False)
+    assert describe_image_cached(cache, "gemini", b"image", "Describe", describe) == ("a red mug", True)
+    assert describe_image_cached(cache, "gemini", b"image", "Other style", describe) == ("a red mug", False)
+    assert len(calls) == 2
+
+
+def test_empty_descriptions_are_not_cached(tmp_path):
+    cache = AnalysisCache(DiskCache(tmp_path))
+    answers = ["", "a red mug"]
+    describe = lambda: answers.pop(0)
+    assert describe_image_cached(cache, "gemini", b"image", "Describe", describe) == ("", False)
+    assert describe_image_cached(cache, "gemini", b"image", "Describe", describe) == ("a red mug", False)
+    assert cache.disk.stats()["entries"] == 1
@@ -0,0 +1,28 @@
+from fake_backends import make_image_bytes
+from image_asset import AssetCache, ImageAsset
+
+
+def test_asset_cache_stores_assets_without_pixels():
+    asset = ImageAsset(make_image_bytes(64, 64))
+    asset.image
+    cache = AssetCache(max_bytes=10 * len(asset), max_items=4)
+    key = cache.put(asset)
+    cached = cache.get(key)
+    assert cached.data is asset.data
+    assert cached.digest == asset.digest
+    assert not cached.decoded
+    assert asset.decoded
+
+
+def test_asset_cache_is_bounded_by_bytes_and_items():
+    assets = [ImageAsset(make_image_bytes(32, 32, seed=seed)) for seed in range(6)]
+    cache = AssetCache(max_bytes=3 * len(assets[0]) + 100, max_items=4)
+    keys = [cache.put(asset) for asset in assets]
+    assert [cache.get(key) is not None for key in keys] == [False, False, False, True, True, True]
+    assert cache.stats()["bytes"] <= cache.max_bytes
+
+
+def test_asset_cache_keeps_the_latest_asset_even_if_oversized():
+    cache = AssetCache(max_bytes=10, max_items=4)
+    key = cache.put(ImageAsset(make_image_bytes(32, 32)))
+    assert cache.get(key) is not None
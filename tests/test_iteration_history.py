@@ -0,0 +1,52 @@
+import time
+from contextlib import closing
+
+from iteration_history import HistoryStore
+
+
+def test_nodes_inherit_root_base_prompt_and_depth(tmp_path):
+    store = HistoryStore(tmp_path / "history.db")
+    root = store.add("alice", "image", "media/root.png", "A red mug", "E-commerce Product",
+                     timings={"model_call": 1.5})
+    child = store.add("alice", "image", "media/child.png", "A red mug. warmer", "E-commerce Product",
+                      parent=root, feedback="warmer")
+    assert (child.root_id, child.parent_id, child.depth, child.base_prompt) == \
+        (root.node_id, root.node_id, 2, "A red mug")
+    loaded = store.get(child.node_id)
+    assert loaded == child
+    assert store.get(root.node_id).timings == {"model_call": 1.5}
+    assert store.get("missing") is None
+
+
+def test_lineage_walks_from_the_root_to_the_node(tmp_path):
+    store = HistoryStore(tmp_path / "history.db")
+    root = store.add("alice", "image", "r.png", "A red mug", "Style")
+    first = store.add("alice", "image", "a.png", "p", "Style", parent=root, feedback="warmer")
+    second = store.add("alice", "image", "b.png", "p", "Style", parent=first, feedback="add shadow")
+    store.add("alice", "image", "c.png", "p", "Style", parent=root, feedback="cooler")
+    assert [node.node_id for node in store.lineage(second.node_id)] == \
+        [root.node_id, first.node_id, second.node_id]
+    assert [node.feedback for node in store.lineage(second.node_id)] == ["", "warmer", "add shadow"]
+
+
+def test_tree_lists_parents_before_their_children(tmp_path):
+    store = HistoryStore(tmp_path / "history.db")
+    root = store.add("alice", "image", "r.png", "A red mug", "Style")
+    left = store.add("alice", "image", "l.png", "p", "Style", parent=root, feedback="left")
+    right = store.add("alice", "image", "r2.png", "p", "Style", parent=root, feedback="right")
+    left_child = store.add("alice", "image", "lc.png", "p", "Style", parent=left, feedback="left child")
+    store.add("alice", "image", "other.png", "Another tree", "Style")
+    assert [node.node_id for node in store.tree(root.node_id)] == \
+        [root.node_id, left.node_id, left_child.node_id, right.node_id]
+
+
+def test_prune_removes_whole_idle_trees(tmp_path):
+    store = HistoryStore(tmp_path / "history.db")
+    old_root = store.add("alice", "image", "r.png", "Old", "Style")
+    store.add("alice", "image", "a.png", "Old", "Style", parent=old_root)
+    recent = store.add("alice", "image", "n.png", "New", "Style")
+    with closing(store._connect()) as conn, conn:
+        conn.execute("UPDATE iterations SET created_at = ? WHERE root_id = ?", (time.time() - 7200, old_root.node_id))
+    assert store.prune(3600) == 2
+    assert store.tree(old_root.node_id) == []
+    assert store.get(recent.node_id) is not None
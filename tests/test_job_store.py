@@ -0,0 +1,65 @@
+import time
+from concurrent.futures import Future
+
+from job_store import JOB_FAILED, JOB_PENDING, JOB_RUNNING, JOB_SUCCEEDED, JobStore, track_futures
+
+
+def test_job_lifecycle(tmp_path):
+    store = JobStore(tmp_path / "jobs.db")
+    job_id = store.create("alice", "video", {"prompt": "a mug", "has_image": False})
+    record = store.get(job_id)
+    assert (record.owner, record.kind, record.status, record.request) == \
+        ("alice", "video", JOB_PENDING, {"prompt": "a mug", "has_image": False})
+    store.mark_running(job_id, "operations/123")
+    assert (store.get(job_id).status, store.get(job_id).operation_name) == (JOB_RUNNING, "operations/123")
+    store.succeed(job_id, ["media/ab/abc.mp4"])
+    record = store.get(job_id)
+    assert record.done and record.status == JOB_SUCCEEDED and record.result_refs == ["media/ab/abc.mp4"]
+    assert record.finished_at is not None
+    assert store.get("missing") is None
+
+
+def test_latest_and_unfinished(tmp_path):
+    store = JobStore(tmp_path / "jobs.db")
+    older = store.create("alice", "video", {})
+    newer = store.create("alice", "video", {})
+    store.create("alice", "image", {})
+    store.create("bob", "video", {})
+    store.fail(older, "boom")
+    assert store.latest("alice", "video").job_id == newer
+    assert store.latest("carol", "video") is None
+    assert store.get(older).error == "boom"
+    assert [record.owner for record in store.unfinished("video")] == ["alice", "bob"]
+
+
+def test_latest_ignores_old_jobs_and_prune_drops_finished_ones(tmp_path):
+    store = JobStore(tmp_path / "jobs.db")
+    job_id = store.create("alice", "image", {})
+    store.succeed(job_id, [])
+    store._update(job_id, submitted_at=time.time() - 7200, finished_at=time.time() - 7200)
+    assert store.latest("alice", "image", max_age_seconds=3600) is None
+    assert store.latest("alice", "image").job_id == job_id
+    unfinished = store.create("alice", "image", {})
+    assert store.prune(3600) == 1
+    assert store.get(job_id) is None and store.get(unfinished) is not None
+
+
+def test_track_futures_records_partial_success(tmp_path):
+    store = JobStore(tmp_path / "jobs.db")
+    job_id = store.create("alice", "image", {})
+    futures = [Future(), Future()]
+    track_futures(store, job_id, futures, save=lambda results: [f"ref-{result}" for result in results])
+    assert store.get(job_id).status == JOB_RUNNING
+    futures[0].set_exception(RuntimeError("quota"))
+    assert store.get(job_id).status == JOB_RUNNING
+    futures[1].set_result("b")
+    assert (store.get(job_id).status, store.get(job_id).result_refs) == (JOB_SUCCEEDED, ["ref-b"])
+
+
+def test_track_futures_fails_when_nothing_succeeds(tmp_path):
+    store = JobStore(tmp_path / "jobs.db")
+    job_id = store.create("alice", "image", {})
+    future = Future()
+    track_futures(store, job_id, [future], save=lambda results: results)
+    future.set_exception(RuntimeError("quota"))
+    assert (store.get(job_id).status, store.get(job_id).error) == (JOB_FAILED, "quota")
@@ -0,0 +1,37 @@
+import os
+import time
+
+from media_store import MediaStore
+
+
+def test_save_content_reuses_the_file_and_renews_it(tmp_path):
+    store = MediaStore(tmp_path)
+    first = store.save_content(b"image bytes", ".png")
+    old = time.time() - 3600
+    os.utime(first, (old, old))
+    second = store.save_content(b"image bytes", ".png")
+    assert first == second
+    assert os.path.getmtime(second) > old + 1
+    assert store.save_content(b"other bytes", ".png") != first
+    assert len(list(tmp_path.iterdir())) == 2
+
+
+def test_saves_scan_the_directory_at_most_once_per_interval(tmp_path, monkeypatch):
+    store = MediaStore(tmp_path, max_bytes=10 ** 9, gc_interval_seconds=3600)
+    scans = []
+    monkeypatch.setattr(MediaStore, "collect_garbage", lambda self: scans.append(1) or 0)
+    for i in range(20):
+        store.save_bytes(f"video {i}".encode())
+    assert scans == []
+    store.save_bytes(b"x" * (10 ** 8))  # a tenth of max_bytes written since the last scan
+    assert scans == [1]
+
+
+def test_collect_garbage_drops_expired_and_oldest_files(tmp_path):
+    store = MediaStore(tmp_path, retention_seconds=60, max_bytes=25, gc_interval_seconds=3600)
+    expired, oldest, newest = (tmp_path / name for name in ("expired.mp4", "oldest.mp4", "newest.mp4"))
+    for path, size, age in ((expired, 5, 120), (oldest, 10, 30), (newest, 20, 0)):
+        path.write_bytes(b"x" * size)
+        os.utime(path, (time.time() - age, time.time() - age))
+    assert store.collect_garbage() == 2
+    assert not store.exists(expired) and not store.exists(oldest) and store.exists(newest)
@@ -0,0 +1,41 @@
+import base64
+
+import pytest
+
+from fake_backends import make_image_bytes
+from payloads import KIND_IMAGE, KIND_VIDEO, InvalidPayload, decode_payload
+
+MP4 = b"\x00\x00\x00\x18ftypmp42" + bytes(64)
+
+
+@pytest.mark.parametrize("image_format,mime_type", [("PNG", "image/png"), ("JPEG", "image/jpeg"),
+                                                    ("WEBP", "image/webp"), ("GIF", "image/gif")])
+def test_image_header_gives_type_and_size(image_format, mime_type):
+    payload = decode_payload(make_image_bytes(40, 30, image_format=image_format))
+    assert (payload.mime_type, payload.width, payload.height) == (mime_type, 40, 30)
+    assert payload.kind == KIND_IMAGE and not payload.was_base64
+
+
+def test_base64_payload_is_unwrapped():
+    raw = make_image_bytes(16, 8)
+    for encoded in (base64.b64encode(raw), base64.b64encode(raw).decode("ascii")):
+        payload = decode_payload(encoded, "image/png")
+        assert payload.data == raw and payload.was_base64
+        assert (payload.width, payload.height) == (16, 8)
+
+
+def test_video_payload():
+    payload = decode_payload(MP4, kinds=(KIND_VIDEO,))
+    assert payload.mime_type == "video/mp4" and payload.kind == KIND_VIDEO
+
+
+def test_unexpected_kind_is_rejected():
+    with pytest.raises(InvalidPayload, match="Expected image"):
+        decode_payload(MP4, kinds=(KIND_IMAGE,))
+
+
+@pytest.mark.parametrize("data", [b"", b"not an image at all", base64.b64encode(b"plain text, no media here"),
+                                  make_image_bytes(16, 16)[:20]])
+def test_garbage_and_truncated_payloads_are_rejected(data):
+    with pytest.raises(InvalidPayload):
+        decode_payload(data, "image/png")
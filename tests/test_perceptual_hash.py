@@ -0,0 +1,44 @@
+import random
+
+from perceptual_hash import HammingIndex, hamming
+
+
+def flip(value, bits):
+    for bit in bits:
+        value ^= 1 << bit
+    return value
+
+
+def test_search_finds_hashes_within_the_radius_nearest_first():
+    index = HammingIndex()
+    base = 0x0123456789ABCDEF
+    index.add(base, "same")
+    index.add(flip(base, [0, 17, 40]), "near")
+    index.add(flip(base, range(0, 64, 4)), "far")
+    assert index.search(base, 6) == [(0, "same"), (3, "near")]
+    assert index.search(base, 16) == [(0, "same"), (3, "near"), (16, "far")]
+
+
+def test_search_matches_a_linear_scan():
+    rng = random.Random(7)
+    index = HammingIndex()
+    values = {}
+    for item_id in range(300):
+        value = rng.getrandbits(64) if item_id % 3 else flip(0xFFFF0000FFFF0000, rng.sample(range(64), 5))
+        values[item_id] = value
+        index.add(value, item_id)
+    query = 0xFFFF0000FFFF0000
+    for max_distance in (0, 4, 8, 11):
+        expected = sorted((hamming(query, value), item_id) for item_id, value in values.items()
+                          if hamming(query, value) <= max_distance)
+        assert index.search(query, max_distance) == expected
+
+
+def test_removed_items_are_not_found():
+    index = HammingIndex()
+    index.add(42, "a")
+    index.add(42, "b")
+    index.remove("a")
+    index.remove("missing")
+    assert len(index) == 1
+    assert index.search(42, 0) == [(0, "b")]
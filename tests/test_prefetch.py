@@ -0,0 +1,53 @@
+import time
+
+import pytest
+
+from fake_backends import FakeGenerativeModel, FakeLatency, make_image_bytes
+from generation_cache import AnalysisCache, DiskCache
+from prefetch import PREFETCH_OVER_BUDGET, PREFETCH_READY, PREFETCH_RUNNING, PREFETCH_STARTED, AnalysisPrefetcher
+from services import ModelServices
+
+IMAGE = make_image_bytes(8, 8, seed=1)
+OTHER = make_image_bytes(8, 8, seed=2)
+
+
+@pytest.fixture
+def setup(tmp_path):
+    gemini = FakeGenerativeModel(latency=FakeLatency(0.2), text_chars=40)
+    unlimited = {family: {"per_minute": 0, "burst": 1} for family in ("imagen", "gemini", "gemini_edit", "veo")}
+    services = ModelServices(gemini_model=gemini, rate_limits=unlimited, concurrency={"gemini": 1})
+    cache = AnalysisCache(DiskCache(tmp_path))
+    return gemini, services, cache
+
+
+def test_describe_joins_the_speculation_in_flight(setup):
+    gemini, services, cache = setup
+    prefetcher = AnalysisPrefetcher(services, cache)
+    assert prefetcher.speculate("alice", IMAGE, "image/png", "Describe") == PREFETCH_STARTED
+    assert prefetcher.speculate("alice", IMAGE, "image/png", "Describe") == PREFETCH_RUNNING
+    description, reused = prefetcher.describe("alice", IMAGE, "image/png", "Describe")
+    assert description == gemini.text and reused
+    assert gemini.calls == 1
+    assert prefetcher.speculate("bob", IMAGE, "image/png", "Describe") == PREFETCH_READY
+
+
+def test_speculation_stops_once_the_budget_is_spent(setup):
+    gemini, services, cache = setup
+    prefetcher = AnalysisPrefetcher(services, cache, per_minute=1, burst=1)
+    assert prefetcher.speculate("alice", IMAGE, "image/png", "Describe") == PREFETCH_STARTED
+    assert prefetcher.speculate("alice", OTHER, "image/png", "Describe") == PREFETCH_OVER_BUDGET
+    # Budgets are per owner
+    assert prefetcher.speculate("bob", OTHER, "image/png", "Describe") == PREFETCH_STARTED
+
+
+def test_superseded_and_stale_speculations_are_cancelled(setup):
+    gemini, services, cache = setup
+    prefetcher = AnalysisPrefetcher(services, cache, stale_seconds=0.05)
+    prefetcher.speculate("alice", IMAGE, "image/png", "Describe")
+    queued = prefetcher.speculate("alice", IMAGE, "image/png", "Other style")
+    assert queued == PREFETCH_STARTED
+    (stale,) = [entry for entry in prefetcher._inflight.values() if "alice" in entry.owners]
+    time.sleep(0.1)
+    prefetcher.speculate("bob", OTHER, "image/png", "Describe")
+    assert stale.future.cancelled()
+    assert [entry.owners for entry in prefetcher._inflight.values()] == [{"bob"}]
@@ -0,0 +1,64 @@
+from io import BytesIO
+
+from PIL import Image
+
+from fake_backends import make_image_bytes
+from image_asset import ImageAsset
+from preprocess import ORIENTATION_TAG, Preprocessor
+
+
+def encode(image, image_format="PNG", **kwargs) -> bytes:
+    buf = BytesIO()
+    image.save(buf, format=image_format, **kwargs)
+    return buf.getvalue()
+
+
+def test_exif_orientation_is_applied():
+    exif = Image.Exif()
+    exif[ORIENTATION_TAG] = 6  # rotated 90° clockwise
+    upload = encode(Image.new("RGB", (40, 20), (200, 10, 10)), "JPEG", exif=exif)
+    prepared = Preprocessor(max_edge=100).prepare(upload, "image/jpeg")
+    assert prepared.transformed
+    assert prepared.asset.image.size == (20, 40)
+
+
+def test_longest_edge_is_bounded():
+    upload = make_image_bytes(300, 150, seed=1)
+    prepared = Preprocessor(max_edge=100).prepare(upload, "image/png")
+    assert prepared.transformed and prepared.asset.mime_type == "image/jpeg"
+    assert prepared.asset.image.size == (100, 50)
+    assert prepared.bytes_saved > 0
+
+
+def test_transparency_is_flattened_onto_white_for_jpeg():
+    image = Image.new("RGBA", (10, 10), (0, 0, 0, 0))
+    image.paste((255, 0, 0, 255), (0, 0, 5, 10))
+    prepared = Preprocessor(max_edge=100).prepare(encode(image), "image/png")
+    decoded = prepared.asset.image
+    assert decoded.mode == "RGB"
+    left, right = decoded.getpixel((1, 5)), decoded.getpixel((8, 5))
+    assert left[0] > 200 and left[1] < 60
+    assert min(right) > 240
+
+
+def test_small_image_that_needs_no_change_keeps_its_bytes():
+    upload = encode(Image.new("RGB", (16, 16), (10, 20, 30)), "JPEG", quality=50)
+    prepared = Preprocessor(max_edge=100, quality=95).prepare(upload, "image/jpeg")
+    assert not prepared.transformed and prepared.asset.data == upload
+
+
+def test_results_are_cached_by_content_in_a_bounded_lru():
+    preprocessor = Preprocessor(max_edge=50, max_items=2)
+    uploads = [make_image_bytes(80, 80, seed=seed) for seed in range(3)]
+    first = preprocessor.prepare(uploads[0])
+    assert preprocessor.prepare(bytes(uploads[0])) is first
+    preprocessor.prepare(uploads[1])
+    preprocessor.prepare(uploads[2])
+    assert preprocessor.prepare(uploads[0]) is not first
+    assert preprocessor.stats()["bytes_in"] == sum(len(upload) for upload in uploads) + len(uploads[0])
+
+
+def test_undecodable_upload_is_passed_through():
+    prepared = Preprocessor().prepare(b"not an image", "image/png")
+    assert isinstance(prepared.asset, ImageAsset) and prepared.asset.data == b"not an image"
+    assert not prepared.transformed
@@ -0,0 +1,137 @@
+import asyncio
+import time
+
+import pytest
+
+from fake_backends import FakeImagenModel, FakeQuotaError
+from rate_limit import CallGuard, CircuitBreaker, CircuitOpenError, RetryPolicy, TokenBucket, is_retryable
+from services import ModelServices
+
+FAST = RetryPolicy(max_attempts=4, base_delay=0.001, max_delay=0.002)
+
+
+def scripted(errors, result="ok"):
+    errors = list(errors)
+    calls = []
+
+    def fn():
+        calls.append(time.monotonic())
+        if errors:
+            raise errors.pop(0)
+        return result
+    return fn, calls
+
+
+def test_quota_errors_are_retried_until_success():
+    fn, calls = scripted([FakeQuotaError(), FakeQuotaError()])
+    guard = CallGuard("imagen", policy=FAST)
+    assert guard.call(fn) == "ok"
+    assert len(calls) == 3
+    assert guard.breaker.state == "closed"
+
+
+def test_bad_request_is_not_retried():
+    fn, calls = scripted([ValueError("400 INVALID_ARGUMENT")])
+    guard = CallGuard("imagen", policy=FAST)
+    with pytest.raises(ValueError):
+        guard.call(fn)
+    assert len(calls) == 1
+    assert not is_retryable(ValueError("400 INVALID_ARGUMENT"))
+
+
+@pytest.mark.parametrize("error,retryable", [
+    (FakeQuotaError(), True),
+    (RuntimeError("429 Quota exceeded for aiplatform.googleapis.com"), True),
+    (RuntimeError("503 UNAVAILABLE: backend overloaded"), True),
+    (RuntimeError("Too Many Requests"), True),
+    (RuntimeError("Image size 4290 exceeds the limit"), False),
+    (RuntimeError("Prompt mentions a quota of coffee"), False),
+    (RuntimeError("400 INVALID_ARGUMENT: 429 is not a valid aspect ratio"), False),
+])
+def test_only_status_codes_and_documented_markers_are_retryable(error, retryable):
+    assert is_retryable(error) is retryable
+
+
+def test_client_errors_leave_the_breaker_state_alone():
+    breaker = CircuitBreaker("imagen", failure_threshold=2, reset_seconds=0.05)
+    guard = CallGuard("imagen", breaker=breaker, policy=RetryPolicy(1, 0.001, 0.001))
+    with pytest.raises(FakeQuotaError):
+        guard.call(scripted([FakeQuotaError()])[0])
+    with pytest.raises(ValueError):
+        guard.call(scripted([ValueError("400 INVALID_ARGUMENT")])[0])
+    with pytest.raises(FakeQuotaError):
+        guard.call(scripted([FakeQuotaError()])[0])
+    assert breaker.state == "open"
+    time.sleep(0.06)
+    # A bad request as the half-open trial neither closes nor re-opens the circuit
+    with pytest.raises(ValueError):
+        guard.call(scripted([ValueError("400 INVALID_ARGUMENT")])[0])
+    assert breaker.state == "half-open"
+    assert guard.call(scripted([])[0]) == "ok"
+    assert breaker.state == "closed"
+
+
+def test_circuit_opens_after_repeated_quota_errors_and_recovers():
+    breaker = CircuitBreaker("imagen", failure_threshold=2, reset_seconds=0.05)
+    guard = CallGuard("imagen", breaker=breaker, policy=RetryPolicy(1, 0.001, 0.001))
+    for _ in range(2):
+        with pytest.raises(FakeQuotaError):
+            guard.call(scripted([FakeQuotaError()])[0])
+    with pytest.raises(CircuitOpenError):
+        guard.call(scripted([])[0])
+    time.sleep(0.06)
+    assert breaker.state == "half-open"
+    assert guard.call(scripted([])[0]) == "ok"
+    assert breaker.state == "closed"
+
+
+def test_cancelled_half_open_trial_does_not_wedge_the_circuit():
+    breaker = CircuitBreaker("gemini_edit", failure_threshold=1, reset_seconds=0.01)
+    guard = CallGuard("gemini_edit", breaker=breaker, policy=RetryPolicy(1, 0.001, 0.001))
+    breaker.record_failure()
+    time.sleep(0.02)
+
+    async def slow():
+        await asyncio.sleep(10)
+
+    async def fast():
+        return "ok"
+
+    async def scenario():
+        trial = asyncio.ensure_future(guard.call_async(slow))
+        await asyncio.sleep(0.01)
+        trial.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await trial
+        return await guard.call_async(fast)
+
+    assert asyncio.run(scenario()) == "ok"
+    assert breaker.state == "closed"
+
+
+def test_token_bucket_paces_calls():
+    bucket = TokenBucket(per_minute=600, burst=2)
+    assert bucket.reserve() == 0.0
+    assert bucket.reserve() == 0.0
+    assert bucket.reserve() == pytest.approx(0.1, abs=0.02)
+    single = TokenBucket(per_minute=60, burst=1)
+    assert single.try_acquire()
+    assert not single.try_acquire()
+
+
+def test_timed_out_threaded_call_stops_retrying():
+    model = FakeImagenModel(width=16, height=16, failures=[FakeQuotaError()] * 50)
+    services = ModelServices(
+        imagen_model=model,
+        rate_limits={"imagen": {"per_minute": 0, "burst": 1}},
+        retry_policy=RetryPolicy(max_attempts=50, base_delay=0.05, max_delay=0.05),
+        timeouts={"imagen": 0.1},
+    )
+    services.guards["imagen"].breaker.failure_threshold = 1000
+    with pytest.raises(TimeoutError):
+        services.run(services.generate_images({"prompt": "shoe", "number_of_images": 1}))
+    time.sleep(0.05)
+    calls_after_timeout = model.calls
+    time.sleep(0.3)
+    assert model.calls == calls_after_timeout
+    assert calls_after_timeout < 10
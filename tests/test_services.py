@@ -0,0 +1,60 @@
+import threading
+import time
+from functools import partial
+
+import pytest
+
+from fake_backends import FakeGenerativeModel, FakeImagenModel, make_image_bytes
+from previews import PreviewCache
+from services import ModelServices
+
+
+def make_services(**kwargs):
+    unlimited = {family: {"per_minute": 0, "burst": 1} for family in ("imagen", "gemini", "gemini_edit", "veo")}
+    return ModelServices(imagen_model=FakeImagenModel(width=64, height=64), rate_limits=unlimited, **kwargs)
+
+
+def test_fan_out_runs_postprocess_per_image():
+    services = make_services()
+    previews = PreviewCache()
+    futures = services.fan_out_images({"prompt": "shoe", "number_of_images": 3}, None,
+                                      postprocess=partial(previews.get, width=32))
+    results = [future.result(timeout=10) for future in futures]
+    assert len(results) == 3
+    for image_bytes, cache_hit, thumbnail in results:
+        assert image_bytes and not cache_hit
+        assert thumbnail and thumbnail != image_bytes
+    assert previews.stats()["entries"] == len({r[0] for r in results})
+
+
+class RecordingGemini(FakeGenerativeModel):
+    def __init__(self):
+        super().__init__(text_chars=40)
+        self.requests = []
+
+    def generate_content(self, contents, **kwargs):
+        self.requests.append(contents)
+        return super().generate_content(contents, **kwargs)
+
+
+def test_describe_image_runs_on_a_fake_gemini_model():
+    gemini = RecordingGemini()
+    services = make_services(gemini_model=gemini)
+    description, cache_hit = services.run(services.describe_image(make_image_bytes(8, 8), "image/png", "Describe"))
+    assert description == gemini.text and not cache_hit
+    (prompt, part), = gemini.requests
+    assert prompt == "Describe" and part.inline_data.mime_type == "image/png"
+
+
+def test_timed_out_call_keeps_its_slot_until_the_thread_returns():
+    services = make_services(concurrency={"imagen": 1}, timeouts={"imagen": 0.05})
+    release = threading.Event()
+    started = []
+    with pytest.raises(TimeoutError):
+        services.run(services._call("imagen", release.wait, 5))
+    second = services.submit(services._call("imagen", started.append, "second"))
+    time.sleep(0.2)
+    assert started == [] and not second.done()
+    release.set()
+    second.result(timeout=5)
+    assert started == ["second"]
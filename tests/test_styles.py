@@ -0,0 +1,118 @@
+import json
+import os
+
+import pytest
+
+from config import STYLES_PATH
+from styles import StyleRegistry, compact_feedback_prompt, feedback_prompt, merge_feedback, registry
+
+STYLE = "E-commerce Product"
+
+
+def styles_data():
+    with open(STYLES_PATH, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def write_styles(path, data):
+    path.write_text(json.dumps(data), encoding="utf-8")
+    return path
+
+
+def test_merge_feedback_keeps_the_latest_of_repeated_requests():
+    items = ["brighter background.", "Make it warmer", "brighter background with a soft gradient"]
+    assert merge_feedback(items) == ["Make it warmer", "brighter background with a soft gradient"]
+
+
+def test_negated_request_keeps_the_request_it_negates():
+    assert merge_feedback(["make it red", "don't make it red"]) == ["make it red", "don't make it red"]
+    assert merge_feedback(["make it red", "make it red"]) == ["make it red"]
+
+
+def test_short_prompt_is_left_alone():
+    items = ["make it warmer", "add a shadow"]
+    prompt = compact_feedback_prompt("A red mug on a table", items, STYLE, 1800)
+    assert prompt == feedback_prompt("A red mug on a table", "make it warmer; add a shadow", STYLE)
+    assert prompt.endswith(registry().get(STYLE).feedback_enhancement)
+
+
+def test_long_base_prompt_is_shortened_before_feedback_is_dropped():
+    base = ". ".join(f"Detail number {i} of the product shot" for i in range(60))
+    items = ["make it warmer", "add a soft shadow", "zoom out a little"]
+    prompt = compact_feedback_prompt(base, items, STYLE, 1000)
+    assert len(prompt) <= 1000
+    assert "make it warmer; add a soft shadow; zoom out a little" in prompt
+    assert prompt.startswith("Detail number 0 of the product shot")
+
+
+def test_oldest_feedback_goes_once_the_base_is_at_its_share():
+    base = "A red mug on a wooden table " * 20
+    items = [f"change number {i} to the lighting and the framing" for i in range(40)]
+    prompt = compact_feedback_prompt(base, items, STYLE, 900)
+    assert len(prompt) <= 900
+    assert "change number 39" in prompt
+    assert "change number 0 " not in prompt
+    assert prompt.startswith("A red mug on a wooden table")
+
+
+def test_newest_feedback_survives_a_huge_base_prompt():
+    base = "word " * 2000
+    newest = "replace the background with white " * 10
+    prompt = compact_feedback_prompt(base, ["an older request", newest], STYLE, 800)
+    assert len(prompt) <= 800
+    assert merge_feedback([newest])[0] in prompt
+
+
+def test_oversized_newest_feedback_is_cut_at_a_word_boundary():
+    newest = " ".join(f"detail{i}" for i in range(400))
+    prompt = compact_feedback_prompt("A red mug", [newest], STYLE, 600)
+    assert len(prompt) <= 600
+    assert prompt.endswith(registry().get(STYLE).feedback_enhancement)
+    feedback = prompt.split("IMPROVEMENT NEEDED: ")[1].split(". STYLE:")[0]
+    assert newest.startswith(feedback) and newest[len(feedback)] == " "
+
+
+@pytest.mark.parametrize("edit, message", [
+    (lambda data: data["templates"].pop("style_badge"), "missing templates: style_badge"),
+    (lambda data: data["styles"][0].pop("edit_prompt"), "is missing edit_prompt"),
+    (lambda data: data["styles"][0].update(hedge_after_seconds=0), "hedge_after_seconds must be a positive"),
+    (lambda data: data.update(hedge_after_seconds="soon"), "hedge_after_seconds must be a positive"),
+    (lambda data: data.update(default="Watercolour"), "default style 'Watercolour' is not defined"),
+    (lambda data: data.update(styles=[]), "defines no styles"),
+])
+def test_invalid_styles_file_is_rejected(tmp_path, edit, message):
+    data = styles_data()
+    edit(data)
+    with pytest.raises(ValueError, match=message):
+        StyleRegistry(write_styles(tmp_path / "styles.json", data))
+
+
+def test_invalid_edit_keeps_the_previous_styles(tmp_path):
+    data = styles_data()
+    path = write_styles(tmp_path / "styles.json", data)
+    styles = StyleRegistry(path, check_interval=0)
+    version, names = styles.version, styles.names
+
+    data["styles"][0].pop("css_class")
+    write_styles(path, data)
+    os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 10 ** 9))
+    styles.reload_if_changed()
+    assert (styles.version, styles.names) == (version, names)
+
+    data = styles_data()
+    data["styles"] = data["styles"][:1]
+    write_styles(path, data)
+    os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 2 * 10 ** 9))
+    styles.reload_if_changed()
+    assert styles.names == (data["styles"][0]["name"],) and styles.version != version
+
+
+def test_badge_of_a_removed_style_uses_the_default_styling(tmp_path):
+    data = styles_data()
+    data["styles"] = [style for style in data["styles"] if style["name"] != STYLE]
+    data.pop("default", None)
+    styles = StyleRegistry(write_styles(tmp_path / "styles.json", data))
+    badge = styles.badge_html(STYLE)
+    assert STYLE in badge
+    assert styles.get(styles.default).css_class in badge
+    assert styles.get(STYLE) is styles.get(styles.default)
@@ -0,0 +1,103 @@
+import time
+from types import SimpleNamespace
+
+from fake_backends import FakeGenAIClient
+from job_store import JOB_FAILED, JOB_SUCCEEDED, JobStore
+from video_jobs import JOB_KIND, VideoJobManager
+
+
+def wait_done(manager, job_id, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = manager.get(job_id)
+        if job is not None and job.done:
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f"job {job_id} did not finish")
+
+
+def make_manager(client=None, **kwargs):
+    client = client or FakeGenAIClient(video_polls=2, video_bytes=1024, edit_width=8, edit_height=8)
+    return client, VideoJobManager(client, initial_delay=0.01, max_delay=0.02, **kwargs)
+
+
+def test_job_polls_until_the_operation_finishes():
+    client, manager = make_manager()
+    try:
+        job = wait_done(manager, manager.submit({"prompt": "a product", "model": "veo"}))
+    finally:
+        manager.shutdown()
+    assert job.status == JOB_SUCCEEDED
+    assert job.poll_count == 2
+    assert job.video_bytes.startswith(b"\x00\x00\x00\x18ftyp")
+
+
+def test_client_factory_runs_on_first_submission():
+    created = []
+
+    def factory():
+        created.append(True)
+        return FakeGenAIClient(video_polls=1, video_bytes=1024, edit_width=8, edit_height=8)
+
+    manager = VideoJobManager(client_factory=factory, initial_delay=0.01, max_delay=0.02)
+    try:
+        assert created == []
+        job = wait_done(manager, manager.submit({"prompt": "a product"}))
+    finally:
+        manager.shutdown()
+    assert job.status == JOB_SUCCEEDED
+    assert created == [True]
+
+
+def test_job_fails_after_consecutive_poll_errors():
+    client = FakeGenAIClient(video_polls=100, video_bytes=1024, edit_width=8, edit_height=8)
+
+    def broken_get(operation):
+        raise ConnectionError("service unavailable")
+
+    client.operations.get = broken_get
+    _, manager = make_manager(client, max_poll_errors=3)
+    try:
+        job = wait_done(manager, manager.submit({"prompt": "a product"}))
+    finally:
+        manager.shutdown()
+    assert job.status == JOB_FAILED
+    assert "service unavailable" in job.error
+
+
+def test_job_fails_once_it_runs_too_long():
+    client = FakeGenAIClient(video_polls=10 ** 6, video_bytes=1024, edit_width=8, edit_height=8)
+    _, manager = make_manager(client, max_age_seconds=0.1)
+    try:
+        job = wait_done(manager, manager.submit({"prompt": "a product"}))
+    finally:
+        manager.shutdown()
+    assert job.status == JOB_FAILED
+    assert "did not finish" in job.error
+
+
+def test_restart_resumes_running_operations_and_fails_the_rest(tmp_path):
+    store = JobStore(tmp_path / "jobs.db")
+    resumable = store.create("alice", JOB_KIND, {"prompt": "a mug"})
+    store.mark_running(resumable, "operations/good")
+    expired = store.create("alice", JOB_KIND, {"prompt": "a lamp"})
+    store.mark_running(expired, "operations/expired")
+    never_started = store.create("alice", JOB_KIND, {"prompt": "a chair"})
+
+    def operation_from_name(name):
+        if name == "operations/expired":
+            raise ValueError("operation not found")
+        return SimpleNamespace(name=name, done=False, error=None, response=None, _polls=0)
+
+    client = FakeGenAIClient(video_polls=1, video_bytes=1024, edit_width=8, edit_height=8)
+    manager = VideoJobManager(client, initial_delay=0.01, max_delay=0.02, store=store,
+                              operation_from_name=operation_from_name)
+    try:
+        job = wait_done(manager, resumable)
+    finally:
+        # Let _resume finish with the remaining records
+        manager.shutdown(wait=True)
+    assert job.status == JOB_SUCCEEDED and client.video_calls == 0
+    assert store.get(resumable).status == JOB_SUCCEEDED
+    assert store.get(expired).status == JOB_FAILED and "operation not found" in store.get(expired).error
+    assert store.get(never_started).status == JOB_FAILED
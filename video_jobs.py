@@ -0,0 +1,317 @@
+import heapq
+import itertools
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Optional
+
+from job_store import JOB_FAILED, JOB_PENDING, JOB_RUNNING, JOB_SUCCEEDED
+from metrics import REGISTRY, stage
+from payloads import KIND_VIDEO, decode_payload
+
+logger = logging.getLogger(__name__)
+
+JOB_KIND = "video"
+
+
+@dataclass
+class VideoJob:
+    """State of a single Veo generation request."""
+    job_id: str
+    status: str = JOB_PENDING
+    submitted_at: float = field(default_factory=time.time)
+    finished_at: Optional[float] = None
+    poll_count: int = 0
+    poll_errors: int = 0
+    next_delay: float = 0.0
+    operation: Any = None
+    video_path: Optional[str] = None
+    video_bytes: Optional[bytes] = None
+    error: Optional[str] = None
+
+    @property
+    def done(self) -> bool:
+        return self.status in (JOB_SUCCEEDED, JOB_FAILED)
+
+    @property
+    def elapsed(self) -> float:
+        return (self.finished_at or time.time()) - self.submitted_at
+
+    @classmethod
+    def from_record(cls, record):
+        """Rebuild a job from its :class:`job_store.JobRecord` (no live operation)."""
+        return cls(job_id=record.job_id, status=record.status, submitted_at=record.submitted_at,
+                   finished_at=record.finished_at, video_path=(record.result_refs or [None])[0],
+                   error=record.error)
+
+
+def _first_video(operation):
+    response = getattr(operation, "response", None)
+    if not response:
+        return None
+    videos = getattr(response, "generated_videos", None) or []
+    if not videos:
+        return None
+    return getattr(videos[0], "video", None)
+
+
+def extract_video_uri(operation):
+    """Return the storage URI of the first generated video, if the model wrote one."""
+    return getattr(_first_video(operation), "uri", None)
+
+
+def extract_video_bytes(operation):
+    """Return the first generated video's bytes from a finished operation, or None.
+
+    Raw and base64-encoded MP4 are both accepted; anything else raises
+    :class:`payloads.InvalidPayload`.
+    """
+    video = _first_video(operation)
+    video_bytes = getattr(video, "video_bytes", None)
+    if not video_bytes:
+        return None
+    return decode_payload(video_bytes, getattr(video, "mime_type", None), kinds=(KIND_VIDEO,)).data
+
+
+class VideoJobManager:
+    """Runs Veo operations in the background and polls them with adaptive backoff.
+
+    A single scheduler thread keeps a heap of due polls and hands each poll to a
+    small worker pool, so waiting jobs never hold a thread. ``client`` only needs
+    ``models.generate_videos(**kwargs)`` and ``operations.get(operation)``.
+    Pass ``client_factory`` instead to create the client on first use, on a
+    worker thread, so building the manager never loads the SDK.
+    An optional :class:`rate_limit.CallGuard` throttles and retries submissions.
+
+    With a :class:`media_store.MediaStore`, finished videos are written to (or
+    downloaded from their GCS output URI into) the store and jobs keep only the
+    file path; without one the bytes stay on the job.
+
+    With a :class:`job_store.JobStore`, every job is also recorded durably:
+    ``get`` finds jobs that have already been pruned from memory, and on start
+    the manager resumes polling operations left running by a previous process.
+    ``operation_from_name`` turns a stored operation name back into something
+    ``operations.get`` accepts.
+
+    A job fails after ``max_poll_errors`` polls in a row raise, or once it has
+    been running for ``max_age_seconds`` (counted from submission, so across
+    restarts too), instead of being polled forever.
+    """
+
+    def __init__(self, client=None, max_workers=4, initial_delay=5.0, max_delay=20.0,
+                 backoff=1.5, retention_seconds=3600.0, guard=None, media_store=None,
+                 store=None, operation_from_name=None, client_factory=None, max_poll_errors=5,
+                 max_age_seconds=1800.0):
+        self._client = client
+        self.client_factory = client_factory
+        self._client_lock = threading.Lock()
+        self.guard = guard
+        self.media_store = media_store
+        self.store = store
+        self.operation_from_name = operation_from_name
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+        self.backoff = backoff
+        self.retention_seconds = retention_seconds
+        self.max_poll_errors = max_poll_errors
+        self.max_age_seconds = max_age_seconds
+        self._jobs = {}
+        self._heap = []
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._closed = False
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="veo-poll")
+        self._scheduler = threading.Thread(target=self._run_scheduler, name="veo-scheduler", daemon=True)
+        self._scheduler.start()
+        if self.store is not None:
+            # Rebuilding operations may load the SDK; keep that off the constructing thread
+            self._pool.submit(self._resume)
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    if self.client_factory is None:
+                        raise RuntimeError("VideoJobManager has no client")
+                    self._client = self.client_factory()
+        return self._client
+
+    # --- Public API ---
+    def submit(self, generate_kwargs, owner="") -> str:
+        """Start a Veo operation in the background and return its job id immediately."""
+        if self.store is not None:
+            request = {key: generate_kwargs[key] for key in ("prompt", "model") if key in generate_kwargs}
+            request["has_image"] = generate_kwargs.get("image") is not None
+            job_id = self.store.create(owner, JOB_KIND, request)
+        else:
+            job_id = uuid.uuid4().hex
+        job = VideoJob(job_id=job_id)
+        with self._lock:
+            self._prune_locked()
+            self._jobs[job.job_id] = job
+        self._pool.submit(self._start, job, dict(generate_kwargs))
+        return job.job_id
+
+    def get(self, job_id) -> Optional[VideoJob]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None and job_id and self.store is not None:
+            record = self.store.get(job_id)
+            # Unfinished records are only live in the process that resumed them
+            if record is not None and record.done:
+                job = VideoJob.from_record(record)
+        return job
+
+    def latest(self, owner, max_age_seconds=None) -> Optional[VideoJob]:
+        """``owner``'s most recent job, so a reloaded page can re-attach to it."""
+        if self.store is None:
+            return None
+        record = self.store.latest(owner, JOB_KIND, max_age_seconds)
+        return self.get(record.job_id) if record is not None else None
+
+    def shutdown(self, wait=False):
+        with self._lock:
+            self._closed = True
+            self._wakeup.notify_all()
+        self._pool.shutdown(wait=wait)
+
+    # --- Internals ---
+    def _start(self, job, generate_kwargs):
+        try:
+            with stage("veo_submit"):
+                if self.guard is not None:
+                    operation = self.guard.call(self.client.models.generate_videos, **generate_kwargs)
+                else:
+                    operation = self.client.models.generate_videos(**generate_kwargs)
+        except Exception as e:
+            logger.exception("Veo submission failed")
+            self._fail(job, f"Video generation request failed: {e}")
+            return
+        job.operation = operation
+        job.status = JOB_RUNNING
+        self._record("mark_running", job.job_id, getattr(operation, "name", None))
+        self._advance(job, self.initial_delay)
+
+    def _poll(self, job):
+        try:
+            job.operation = self.client.operations.get(job.operation)
+            job.poll_count += 1
+            job.poll_errors = 0
+            REGISTRY.increment("veo_polls")
+        except Exception as e:
+            job.poll_errors += 1
+            logger.warning("Polling Veo operation for job %s failed (%d in a row): %s",
+                           job.job_id, job.poll_errors, e)
+            if job.poll_errors >= self.max_poll_errors:
+                self._fail(job, f"Could not check on the video generation: {e}")
+                return
+        if not getattr(job.operation, "done", False) and time.time() - job.submitted_at > self.max_age_seconds:
+            self._fail(job, f"Video generation did not finish within {self.max_age_seconds / 60:.0f} minutes.")
+            return
+        self._advance(job, min(job.next_delay * self.backoff, self.max_delay))
+
+    def _advance(self, job, delay):
+        if getattr(job.operation, "done", False):
+            self._finish(job)
+            return
+        job.next_delay = delay
+        with self._lock:
+            if self._closed:
+                return
+            heapq.heappush(self._heap, (time.monotonic() + delay, next(self._seq), job))
+            self._wakeup.notify()
+
+    def _finish(self, job):
+        operation = job.operation
+        error = getattr(operation, "error", None)
+        if error:
+            self._fail(job, f"Video generation failed: {error}")
+            return
+        try:
+            video_bytes = extract_video_bytes(operation)
+            video_uri = extract_video_uri(operation)
+            if self.media_store is not None:
+                if video_bytes:
+                    job.video_path = self.media_store.save_bytes(video_bytes)
+                elif video_uri:
+                    job.video_path = self.media_store.fetch_uri(video_uri)
+            else:
+                job.video_bytes = video_bytes
+        except Exception as e:
+            self._fail(job, f"Could not read generated video: {e}")
+            return
+        if not job.video_path and not job.video_bytes:
+            self._fail(job, "Video generation did not return video bytes.")
+            return
+        job.finished_at = time.time()
+        job.status = JOB_SUCCEEDED
+        self._record("succeed", job.job_id, [job.video_path] if job.video_path else [])
+        REGISTRY.observe("veo_total", job.elapsed)
+
+    def _fail(self, job, message):
+        job.error = message
+        job.finished_at = time.time()
+        job.status = JOB_FAILED
+        self._record("fail", job.job_id, message)
+        REGISTRY.observe("veo_total", job.elapsed, error=True)
+
+    def _record(self, method, *args):
+        if self.store is None:
+            return
+        try:
+            getattr(self.store, method)(*args)
+        except Exception as e:
+            # The in-memory job stays authoritative for this process
+            logger.warning("Could not record Veo job %s in the job store: %s", args[0], e)
+
+    def _resume(self):
+        """Pick up operations a previous process submitted but never saw finish."""
+        try:
+            records = self.store.unfinished(JOB_KIND)
+        except Exception:
+            logger.exception("Could not read unfinished Veo jobs")
+            return
+        for record in records:
+            if record.status != JOB_RUNNING or not record.operation_name or self.operation_from_name is None:
+                # The request may never have reached Veo; resubmitting could bill it twice
+                self._record("fail", record.job_id, "Video generation was interrupted by a server restart. "
+                                                    "Please submit it again.")
+                continue
+            try:
+                operation = self.operation_from_name(record.operation_name)
+            except Exception as e:
+                # One unreadable record must not stop the others from resuming
+                logger.warning("Could not resume Veo job %s (%s): %s", record.job_id, record.operation_name, e)
+                self._record("fail", record.job_id, f"Video generation could not be resumed after a restart: {e}")
+                continue
+            job = VideoJob(job_id=record.job_id, status=JOB_RUNNING, submitted_at=record.submitted_at,
+                           operation=operation)
+            with self._lock:
+                self._jobs[job.job_id] = job
+            logger.info("Resuming Veo job %s (%s)", job.job_id, record.operation_name)
+            # Check on it right away, then back off as usual
+            job.next_delay = self.initial_delay / self.backoff
+            self._pool.submit(self._poll, job)
+
+    def _run_scheduler(self):
+        while True:
+            with self._lock:
+                while not self._closed and (not self._heap or self._heap[0][0] > time.monotonic()):
+                    timeout = self._heap[0][0] - time.monotonic() if self._heap else None
+                    self._wakeup.wait(timeout)
+                if self._closed:
+                    return
+                _, _, job = heapq.heappop(self._heap)
+            self._pool.submit(self._poll, job)
+
+    def _prune_locked(self):
+        cutoff = time.time() - self.retention_seconds
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job.done and job.finished_at < cutoff]
+        for job_id in expired:
+            del self._jobs[job_id]